@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+'''
+Sharded batch runner for very large request files
+By: Michael Asnes
+
+Does what `fincalc.py batch --format=csv` does, for inputs far larger than
+memory, on every core. The input is read a shard (a fixed number of rows) at
+a time, and shards are answered by a process pool. Output is written in the
+input's order, and only a bounded number of shards are held at once.
+
+After each shard is written, a checkpoint file records how far into the
+input and output the run got. If a run dies, running it again with -r picks
+up from the last finished shard.
+'''
+import collections
+import concurrent.futures
+import csv
+import getopt
+import io
+import itertools
+import json
+import os
+import sys
+import time
+from array import array
+
+import columnar
+import fincalc
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+DEFAULT_SHARD_ROWS = 10000
+DEFAULT_SHARDS_PER_WORKER = 2       # shards in flight, per worker
+DEFAULT_PROGRESS_SECONDS = 5.0
+CHECKPOINT_SUFFIX = '.checkpoint'
+COLUMNAR_SUFFIX = '.fcol'
+# Results that aren't single numbers, left out of columnar output
+NON_NUMERIC_RESULTS = ('multipliers', 'sensitivities')
+
+# Codes in the status column of columnar output
+STATUS_OK = 0
+STATUS_ERROR = 1
+STATUS_CODES = {
+    STATUS_OK: "ok",
+    STATUS_ERROR: "error (run with csv output to see the message)",
+}
+
+
+def usage():
+    print(''' Usage: batch_runner.py [options] <input.csv> <output>
+          -h show this help
+          -c command for rows without a command column
+          -w worker processes (defaults to {})
+          -s rows per shard (defaults to {:,})
+          -f shards in flight per worker (defaults to {})
+          -k checkpoint file (defaults to <output>{})
+          -r resume from the checkpoint, if there is one
+          -q don't report progress
+
+          Input is a csv file of requests, like fincalc.py batch
+          --format=csv takes. Output has the same columns, plus the
+          results and an error column. If output ends in {}, it gets
+          just the numeric results and a status column instead, in the
+          columnar binary format (see columnar.py). Progress goes to
+          stderr.
+          '''.format(DEFAULT_WORKERS, DEFAULT_SHARD_ROWS,
+                     DEFAULT_SHARDS_PER_WORKER, CHECKPOINT_SUFFIX,
+                     COLUMNAR_SUFFIX))
+
+
+def process_opts():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "c:w:s:f:k:rqh", ["help"])
+    except getopt.GetoptError as err:
+        print(str(err))
+        usage()
+        sys.exit(2)
+    options = {}
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            usage()
+            sys.exit()
+        elif o == "-c":
+            options['default_command'] = a
+        elif o == "-w":
+            options['workers'] = int(a)
+        elif o == "-s":
+            options['shard_rows'] = int(a)
+        elif o == "-f":
+            options['shards_per_worker'] = int(a)
+        elif o == "-k":
+            options['checkpoint_path'] = a
+        elif o == "-r":
+            options['resume'] = True
+        elif o == "-q":
+            options['progress_seconds'] = None
+        else:
+            assert False, "unhandled option"
+    if len(args) != 2:
+        sys.exit(usage())
+    return args[0], args[1], options
+
+
+class CsvShardReader(object):
+    ''' Reads shards of a csv file opened in binary mode.
+
+    fieldnames is the header row. shards() yields (shard, offset), where
+    shard is the raw csv text of about shard_rows rows and offset is the
+    byte offset just past it, which shards() can start from again. Rows
+    aren't parsed here but by run_shard(), in the worker processes.
+    '''
+    def __init__(self, input_file, shard_rows=DEFAULT_SHARD_ROWS):
+        self.input_file = input_file
+        self.shard_rows = shard_rows
+        input_file.seek(0)
+        header = b''
+        for line in input_file:
+            header += line
+            if _quotes_balanced(header):
+                break
+        rows = list(csv.reader(io.StringIO(header.decode('utf-8'))))
+        self.fieldnames = rows[0] if rows else []
+        self.data_offset = len(header)
+
+    def shards(self, start_offset=None):
+        offset = self.data_offset if start_offset is None else start_offset
+        self.input_file.seek(offset)
+        lines = iter(self.input_file)
+        while True:
+            shard = b''.join(itertools.islice(lines, self.shard_rows))
+            if not shard:
+                return
+            # A quoted field can hold newlines. Don't cut the shard inside
+            # one (escaped quotes come in pairs, so an odd count of quotes
+            # means a field is still open).
+            while not _quotes_balanced(shard):
+                line = next(lines, b'')
+                if not line:
+                    break
+                shard += line
+            offset += len(shard)
+            yield shard, offset
+
+    def size(self):
+        return os.fstat(self.input_file.fileno()).st_size
+
+
+def _quotes_balanced(data):
+    return data.count(b'"') % 2 == 0
+
+
+def run_shard(task):
+    ''' Answers one shard. Returns (output, encoded, rows answered).
+
+    output_fields are the csv output's columns, or for columnar output the
+    result columns (before the status column). Lives at module level so it
+    can be sent to a process pool.
+    '''
+    fieldnames, output_fields, default_command, shard, columnar_output = task
+    rows = _answered_rows(fieldnames, default_command, shard)
+    if columnar_output:
+        return _columnar_chunk(output_fields, rows)
+    output = io.StringIO()
+    writer = csv.DictWriter(output, output_fields, extrasaction='ignore')
+    num_rows = 0
+    for row in rows:
+        writer.writerow(row)
+        num_rows += 1
+    return output.getvalue().encode('utf-8'), num_rows
+
+
+def _answered_rows(fieldnames, default_command, shard):
+    for values in csv.reader(io.StringIO(shard.decode('utf-8'))):
+        if not values:
+            continue
+        row = dict(zip(fieldnames, values))
+        fincalc.evaluate_csv_row(row, default_command)
+        yield row
+
+
+def _columnar_chunk(result_names, rows):
+    nan = float('nan')
+    columns = [array('d') for _ in result_names]
+    statuses = array('b')
+    for row in rows:
+        failed = 'error' in row
+        statuses.append(STATUS_ERROR if failed else STATUS_OK)
+        for name, column in zip(result_names, columns):
+            value = nan if failed else row.get(name)
+            column.append(value if isinstance(value, (int, float)) else nan)
+    columns.append(statuses)
+    return (columnar.encode_chunk(columnar_columns(result_names), columns),
+            len(statuses))
+
+
+def columnar_columns(result_names):
+    ''' Columns of columnar output: a float64 per result, then the status '''
+    return [(name, 'd') for name in result_names] + [('status', 'b')]
+
+
+class Progress(object):
+    ''' Reports rows done, throughput and an ETA (from the share of the input
+    read) every report_seconds '''
+    def __init__(self, total_bytes, start_offset=0, rows=0,
+                 report_seconds=DEFAULT_PROGRESS_SECONDS, output=sys.stderr):
+        self.total_bytes = total_bytes
+        self.start_offset = start_offset
+        self.start_rows = rows
+        self.report_seconds = report_seconds
+        self.output = output
+        self.started = self.last_report = time.monotonic()
+
+    def update(self, rows, offset, force=False):
+        now = time.monotonic()
+        if not force and now - self.last_report < self.report_seconds:
+            return
+        self.last_report = now
+        self.output.write(self.describe(rows, offset, now) + '\n')
+        self.output.flush()
+
+    def describe(self, rows, offset, now=None):
+        elapsed = (now or time.monotonic()) - self.started
+        done = offset / self.total_bytes if self.total_bytes else 1.0
+        line = "{:,} rows ({:.1%})".format(rows, done)
+        if elapsed > 0:
+            line += ", {:,.0f} rows/s".format((rows - self.start_rows) / elapsed)
+            bytes_per_second = (offset - self.start_offset) / elapsed
+            if bytes_per_second > 0 and offset < self.total_bytes:
+                line += ", about {} left".format(format_seconds(
+                    (self.total_bytes - offset) / bytes_per_second))
+        return line
+
+
+def format_seconds(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return '{}:{:02}:{:02}'.format(hours, minutes, seconds)
+
+
+def load_checkpoint(checkpoint_path):
+    ''' Returns the checkpoint as a dict, or None if there isn't one '''
+    try:
+        with open(checkpoint_path) as checkpoint_file:
+            return json.load(checkpoint_file)
+    except FileNotFoundError:
+        return None
+
+
+def save_checkpoint(checkpoint_path, checkpoint):
+    ''' Replaces the checkpoint file in one step, so a crash leaves either
+    the old checkpoint or the new one '''
+    partial_path = checkpoint_path + '.partial'
+    with open(partial_path, 'w') as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file)
+        checkpoint_file.flush()
+        os.fsync(checkpoint_file.fileno())
+    os.replace(partial_path, checkpoint_path)
+
+
+def run(input_path, output_path, default_command=None,
+        workers=DEFAULT_WORKERS, shard_rows=DEFAULT_SHARD_ROWS,
+        shards_per_worker=DEFAULT_SHARDS_PER_WORKER, checkpoint_path=None,
+        resume=False, progress_seconds=DEFAULT_PROGRESS_SECONDS):
+    ''' Answers every request in input_path, writing the results to
+    output_path (as csv, or in the columnar format if it ends in
+    COLUMNAR_SUFFIX). Returns the number of rows answered, counting any from
+    a resumed run.
+
+    The checkpoint file is removed once the run is done. Raises ValueError
+    if asked to resume from a checkpoint of a different run.
+    '''
+    if checkpoint_path is None:
+        checkpoint_path = output_path + CHECKPOINT_SUFFIX
+    checkpoint = load_checkpoint(checkpoint_path) if resume else None
+    if checkpoint is not None and (
+            checkpoint['input'] != os.path.abspath(input_path)
+            or checkpoint['command'] != default_command):
+        raise ValueError("The checkpoint {} is for a different run".format(
+            checkpoint_path))
+
+    with open(input_path, 'rb') as input_file:
+        reader = CsvShardReader(input_file, shard_rows)
+        columnar_output = output_path.endswith(COLUMNAR_SUFFIX)
+        if columnar_output:
+            output_fields = [field for field
+                             in fincalc.result_fields(default_command)
+                             if field not in NON_NUMERIC_RESULTS]
+            header = columnar.encode_header(columnar_columns(output_fields),
+                                            STATUS_CODES)
+        else:
+            output_fields = fincalc.csv_output_fields(reader.fieldnames,
+                                                      default_command)
+            header = io.StringIO()
+            csv.writer(header).writerow(output_fields)
+            header = header.getvalue().encode('utf-8')
+        if checkpoint is None:
+            checkpoint = {'input': os.path.abspath(input_path),
+                          'command': default_command, 'input_offset': None,
+                          'output_offset': 0, 'rows': 0}
+            output_file = open(output_path, 'wb')
+            output_file.write(header)
+            output_file.flush()
+            checkpoint['output_offset'] = output_file.tell()
+        else:
+            output_file = open(output_path, 'r+b')
+            output_file.truncate(checkpoint['output_offset'])
+            output_file.seek(checkpoint['output_offset'])
+        progress = None
+        if progress_seconds is not None:
+            progress = Progress(reader.size(), checkpoint['input_offset'] or 0,
+                                checkpoint['rows'], progress_seconds)
+
+        def finish(future, offset):
+            output, num_rows = future.result()
+            output_file.write(output)
+            output_file.flush()
+            os.fsync(output_file.fileno())
+            checkpoint['input_offset'] = offset
+            checkpoint['output_offset'] = output_file.tell()
+            checkpoint['rows'] += num_rows
+            save_checkpoint(checkpoint_path, checkpoint)
+            if progress is not None:
+                progress.update(checkpoint['rows'], offset)
+
+        pool = (concurrent.futures.ProcessPoolExecutor(workers)
+                if workers > 1 else None)
+        max_in_flight = max(workers * shards_per_worker, 1)
+        in_flight = collections.deque()
+        try:
+            with output_file:
+                for shard, offset in reader.shards(checkpoint['input_offset']):
+                    task = (reader.fieldnames, output_fields, default_command,
+                            shard, columnar_output)
+                    if pool is None:
+                        future = concurrent.futures.Future()
+                        future.set_result(run_shard(task))
+                    else:
+                        future = pool.submit(run_shard, task)
+                    in_flight.append((future, offset))
+                    # Output goes in order, so wait on the oldest shard
+                    if len(in_flight) >= max_in_flight:
+                        finish(*in_flight.popleft())
+                while in_flight:
+                    finish(*in_flight.popleft())
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+        if progress is not None:
+            progress.update(checkpoint['rows'], reader.size(), force=True)
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return checkpoint['rows']
+
+
+def main():
+    input_path, output_path, options = process_opts()
+    try:
+        run(input_path, output_path, **options)
+    except (OSError, ValueError) as err:
+        sys.exit(str(err))
+
+
+if __name__ == '__main__':
+    main()
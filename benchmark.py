@@ -0,0 +1,555 @@
+#!/usr/bin/env python3
+'''
+Benchmarks for the calculators' hot paths
+By: Michael Asnes
+
+    benchmark.py run [options] [results.json]     time every benchmark
+    benchmark.py compare <baseline.json> <results.json> [-t percent]
+
+Inputs are generated from a fixed seed, so every run times the same work.
+Save a run as a baseline, and compare later runs against it to catch
+regressions (and to prove speedups).
+'''
+import collections
+import getopt
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import timeit
+
+SEED = 20160101
+DEFAULT_SIZES = (1, 1000, 1000000)
+DEFAULT_REPEATS = 5
+DEFAULT_MAX_SECONDS = 10.0   # stop repeating a benchmark after this long
+DEFAULT_THRESHOLD = 0.10     # slowdowns beyond this are regressions
+
+# name: (what size counts, sizes, benchmark), filled in by @benchmark
+BENCHMARKS = collections.OrderedDict()
+
+BenchmarkResult = collections.namedtuple(
+    'BenchmarkResult', ['name', 'size', 'unit', 'loops', 'best', 'median'])
+
+Comparison = collections.namedtuple(
+    'Comparison', ['name', 'size', 'baseline', 'current', 'ratio', 'status'])
+
+
+def usage():
+    print(
+        '''Usage:
+\t-h show this help
+\trun [options] [results.json]  run the benchmarks, printing a table and
+\t\toptionally saving the results as json
+\t\t-k only run benchmarks whose name contains this
+\t\t-m skip sizes larger than this
+\t\t-r timing repeats per benchmark (defaults to {})
+\t\t-s stop repeating a benchmark after this many seconds
+\t\t   (defaults to {})
+\tcompare [-t percent] <baseline.json> <results.json>
+\t\tflag benchmarks that got more than percent slower (defaults to
+\t\t{:.0%}). Exits with status 1 if any did.'''
+        .format(DEFAULT_REPEATS, DEFAULT_MAX_SECONDS, DEFAULT_THRESHOLD)
+    )
+
+
+def benchmark(name, unit='inputs', sizes=DEFAULT_SIZES):
+    ''' Registers a benchmark.
+
+    The benchmark is a generator function taking a size. It prepares its
+    inputs, yields a function doing the work to time (called with no
+    arguments), and cleans up after the yield.
+    '''
+    def register(function):
+        BENCHMARKS[name] = (unit, sizes, function)
+        return function
+    return register
+
+
+@benchmark('inputstreamcagr.approximate_growth_rate', 'periods',
+           (10, 480, 12000))
+def bench_approximate_growth_rate(periods):
+    import inputstreamcagr
+    rate = 1 + 0.07 / 12 if periods > 40 else 1.07
+    isc = inputstreamcagr.InputStreamCagr(10000, 0, 1000, periods)
+    ending_value = isc._calculate_return_at_rate(rate)
+    yield lambda: inputstreamcagr.InputStreamCagr(
+        10000, ending_value, 1000, periods).approximate_growth_rate()
+
+
+@benchmark('retirement.CompoundingCalculator.get_retirement_funds', 'plans',
+           (1,))
+def bench_get_retirement_funds(_):
+    import retirement
+    parameters = retirement.RetirementParameters()
+    yield lambda: retirement.CompoundingCalculator(
+        parameters).get_retirement_funds()
+
+
+@benchmark('retirement.sensitivities_batch', 'plans')
+def bench_sensitivities_batch(size):
+    import retirement
+    rng = random.Random(SEED)
+    plans = [retirement.RetirementParameters(
+                 starting_contribution=rng.uniform(0, 200000),
+                 compounding_rate=rng.choice((1.05, 1.07, 1.095)),
+                 yearly_contribution=rng.uniform(1000, 30000),
+                 years_of_contribution=rng.randint(1, 45),
+                 years_till_retirement=rng.randint(5, 45))
+             for _ in range(size)]
+    yield lambda: retirement.sensitivities_batch(plans)
+
+
+@benchmark('retirement.ledger_arrays', 'years', (1, 40, 1000))
+def bench_ledger_arrays(years):
+    import retirement
+    parameters = retirement.RetirementParameters(
+        years_of_contribution=years, years_till_retirement=years)
+    yield lambda: retirement.ledger_arrays(parameters)
+
+
+@benchmark('portfolio.project', 'households', (1, 1000, 100000))
+def bench_portfolio_project(size):
+    import portfolio
+    rng = random.Random(SEED)
+    accounts = portfolio.Portfolio()
+    for household in range(size):
+        years = rng.randint(5, 45)
+        for account_type in portfolio.ACCOUNT_TYPES:
+            accounts.add_account(
+                household, account_type,
+                starting_balance=rng.uniform(0, 100000),
+                compounding_rate=rng.choice((1.05, 1.07, 1.095)),
+                yearly_contribution=rng.uniform(1000, 30000),
+                years_of_contribution=rng.randint(1, years),
+                years_till_retirement=years)
+    yield lambda: portfolio.project(accounts)
+
+
+@benchmark('retirement.compound', 'years', (1, 40, 1000))
+def bench_compound(years):
+    import retirement
+    yield lambda: retirement.compound(10000.0, 1.07, years)
+
+
+@benchmark('retirement.CompoundingCalculator.get_multipliers', 'multipliers',
+           (2, 40))
+def bench_get_multipliers(num_multipliers):
+    import retirement
+    parameters = retirement.RetirementParameters()
+    yield lambda: retirement.CompoundingCalculator(
+        parameters).get_multipliers(num_multipliers)
+
+
+@benchmark('cagr.cagr_batch')
+def bench_cagr_batch(size):
+    import cagr
+    rng = random.Random(SEED)
+    beginning_values = [rng.uniform(1000, 100000) for _ in range(size)]
+    ending_values = [rng.uniform(1000, 400000) for _ in range(size)]
+    num_periods = [rng.randint(1, 40) for _ in range(size)]
+    yield lambda: cagr.cagr_batch(beginning_values, ending_values, num_periods)
+
+
+@benchmark('rolling_cagr.RollingCagr.update_chunk', 'prices')
+def bench_rolling_cagr(size):
+    import math
+    import rolling_cagr
+    rng = random.Random(SEED)
+    prices = [100 * math.exp(rng.gauss(0, 0.01) * day) for day in range(size)]
+    yield lambda: rolling_cagr.RollingCagr().update_chunk(prices)
+
+
+@benchmark('periods_for_growth.periods_batch')
+def bench_periods_batch(size):
+    import periods_for_growth
+    rng = random.Random(SEED)
+    beginning_values = [rng.uniform(0, 100000) for _ in range(size)]
+    ending_values = [rng.uniform(200000, 2000000) for _ in range(size)]
+    rates = [rng.uniform(1.0, 1.12) for _ in range(size)]
+    contributions = [rng.uniform(1000, 20000) for _ in range(size)]
+    yield lambda: periods_for_growth.periods_batch(
+        beginning_values, ending_values, rates, contributions)
+
+
+@benchmark('inputstreamcagr.approximate_growth_rates')
+def bench_approximate_growth_rates(size):
+    import inputstreamcagr
+    rng = random.Random(SEED)
+    beginning_values = [rng.uniform(0, 100000) for _ in range(size)]
+    ending_values = [rng.uniform(200000, 2000000) for _ in range(size)]
+    contributions = [rng.uniform(1000, 20000) for _ in range(size)]
+    num_periods = [rng.randint(10, 480) for _ in range(size)]
+    yield lambda: inputstreamcagr.approximate_growth_rates(
+        beginning_values, ending_values, contributions, num_periods)
+
+
+@benchmark('xirr.xirr_batch', 'flows')
+def bench_xirr_batch(size):
+    import xirr
+    rng = random.Random(SEED)
+    book = xirr.FlowBook()
+    while len(book.days) < size:
+        # A few years of irregular deposits, then the ending value
+        day = 730000 + rng.randrange(3650)
+        flows = []
+        for _ in range(min(rng.randint(1, 24), size - len(book.days) - 1)):
+            day += rng.randint(1, 90)
+            flows.append((day, -rng.uniform(100, 5000)))
+        total = -sum(amount for _, amount in flows)
+        flows.append((day + rng.randint(1, 365),
+                      total * rng.uniform(0.8, 1.6) or 1.0))
+        book.add_account(flows)
+    yield lambda: xirr.xirr_batch(book)
+
+
+@benchmark('goal_seek.goal_seek_batch', 'plans', (1, 1000, 100000))
+def bench_goal_seek_batch(size):
+    import goal_seek
+    import retirement
+    rng = random.Random(SEED)
+    plans = []
+    for _ in range(size):
+        years_till_retirement = rng.randint(5, 45)
+        plans.append(retirement.RetirementParameters(
+            starting_contribution=rng.uniform(0, 200000),
+            yearly_contribution=rng.uniform(1000, 30000),
+            years_of_contribution=rng.randint(1, years_till_retirement),
+            years_till_retirement=years_till_retirement,
+            years_of_retirement=rng.randint(10, 60)))
+    withdrawals = [rng.uniform(10000, 150000) for _ in range(size)]
+    yield lambda: goal_seek.goal_seek_batch('rate', plans, withdrawals)
+
+
+@benchmark('montecarlo.MonteCarloSimulator.run', 'paths')
+def bench_monte_carlo(paths):
+    import montecarlo
+    import retirement
+    simulator = montecarlo.MonteCarloSimulator(
+        retirement.RetirementParameters(), paths, seed=SEED,
+        target_funds=1000000)
+    yield simulator.run
+
+
+@benchmark('decumulation.DecumulationSimulator.run', 'paths')
+def bench_decumulation(paths):
+    import decumulation
+    import retirement
+    simulator = decumulation.DecumulationSimulator(
+        retirement.RetirementParameters(), paths, 'guardrail', seed=SEED)
+    yield simulator.run
+
+
+@benchmark('sweep.sweep', 'cells')
+def bench_sweep(cells):
+    import sweep
+    rng = random.Random(SEED)
+    ranges = {axis: [value] for axis, value in sweep.DEFAULT_VALUES.items()}
+    ranges['yearly_contribution'] = [rng.randrange(1000, 30000)
+                                     for _ in range(min(cells, 100))]
+    ranges['compounding_rate'] = [rng.uniform(1.03, 1.12)
+                                  for _ in range(max(cells // 100, 1))]
+    yield lambda: sweep.sweep(ranges, io.BytesIO(), 'npy')
+
+
+@benchmark('safe_withdrawal.SafeWithdrawIndex.lookup', 'lookups')
+def bench_safe_withdraw_lookup(lookups):
+    import history
+    import safe_withdrawal
+    rng = random.Random(SEED)
+    history_years = [history.HistoryYear(1900 + year, rng.gauss(0.10, 0.18),
+                                         rng.gauss(0.05, 0.06),
+                                         rng.gauss(0.03, 0.02))
+                     for year in range(100)]
+    queries = [(rng.randint(1, 60),
+                rng.choice(safe_withdrawal.DEFAULT_ALLOCATIONS),
+                rng.choice(safe_withdrawal.DEFAULT_SUCCESS_RATES))
+               for _ in range(lookups)]
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'swr.idx')
+        safe_withdrawal.build_index(history_years, path)
+        with safe_withdrawal.SafeWithdrawIndex(path) as index:
+            lookup = index.lookup
+            yield lambda: [lookup(*query) for query in queries]
+    finally:
+        shutil.rmtree(directory)
+
+
+def _requests(size):
+    ''' size random fincalc batch requests '''
+    rng = random.Random(SEED)
+    requests = []
+    for _ in range(size):
+        kind = rng.random()
+        if kind < 0.4:
+            requests.append({'command': 'cagr',
+                             'beginning_value': rng.uniform(1000, 100000),
+                             'ending_value': rng.uniform(1000, 400000),
+                             'num_periods': rng.randint(1, 40)})
+        elif kind < 0.7:
+            requests.append({'command': 'inputstreamcagr',
+                             'beginning_value': rng.uniform(0, 100000),
+                             'ending_value': rng.uniform(200000, 2000000),
+                             'contribution_per_period': rng.uniform(1000, 20000),
+                             'num_periods': rng.randint(10, 480)})
+        else:
+            requests.append({'command': 'retirement',
+                             'compounding_rate': rng.uniform(1.03, 1.12),
+                             'yearly_contribution': rng.randrange(1000, 30000),
+                             'years_till_retirement': rng.randint(10, 45)})
+    return requests
+
+
+@benchmark('columnar.ColumnarReader.chunks', 'rows')
+def bench_columnar_read(size):
+    import columnar
+    rng = random.Random(SEED)
+    columns = [('rate', 'd'), ('status', 'b')]
+    handle, path = tempfile.mkstemp(suffix='.fcol')
+    try:
+        with os.fdopen(handle, 'wb') as output_file:
+            writer = columnar.ColumnarWriter(output_file, columns)
+            for start in range(0, size, 65536):
+                rows = min(65536, size - start)
+                writer.write_chunk([[rng.uniform(0.9, 1.2) for _ in range(rows)],
+                                    [0] * rows])
+        def read():
+            with columnar.ColumnarReader(path) as reader:
+                return sum(len(chunk['rate']) for chunk in reader.chunks())
+        yield read
+    finally:
+        os.remove(path)
+
+
+@benchmark('fincalc.run_batch', 'requests')
+def bench_run_batch(size):
+    import fincalc
+    lines = ''.join(json.dumps(request) + '\n' for request in _requests(size))
+    yield lambda: fincalc.run_batch(io.StringIO(lines), io.StringIO())
+
+
+@benchmark('server.evaluate_batch', 'requests')
+def bench_evaluate_batch(size):
+    import server
+    requests = _requests(size)
+    yield lambda: server.evaluate_batch(requests)
+
+
+@benchmark('cache.ResultCache.get_or_compute', 'requests')
+def bench_result_cache(size):
+    import cache
+    rng = random.Random(SEED)
+    # Half of the requests repeat an earlier one
+    requests = []
+    for request in _requests(size):
+        if requests and rng.random() < 0.5:
+            request = rng.choice(requests)
+        requests.append(request)
+
+    def run():
+        results = cache.ResultCache()
+        for request in requests:
+            results.get_or_compute(request['command'], request, len)
+    yield run
+
+
+def run_benchmarks(names=None, max_size=None, repeats=DEFAULT_REPEATS,
+                   max_seconds=DEFAULT_MAX_SECONDS, progress=None):
+    ''' Returns a list of BenchmarkResult, with times in seconds per call.
+
+    names limits the run to those benchmarks. Each benchmark is called in
+    loops long enough to time reliably, and timed repeats times (fewer once
+    max_seconds have gone by). best is the fastest repeat, which is the one
+    least disturbed by the rest of the machine. progress, if given, is called
+    with each result as it's ready.
+    '''
+    results = []
+    for name, (unit, sizes, function) in BENCHMARKS.items():
+        if names is not None and name not in names:
+            continue
+        for size in sizes:
+            if max_size is not None and size > max_size:
+                continue
+            setup = function(size)
+            try:
+                work = next(setup)
+                timer = timeit.Timer(work)
+                started = time.perf_counter()
+                loops, elapsed = timer.autorange()
+                timings = [elapsed / loops]
+                while (len(timings) < repeats
+                       and time.perf_counter() - started < max_seconds):
+                    timings.append(timer.timeit(loops) / loops)
+            finally:
+                setup.close()
+            result = BenchmarkResult(name, size, unit, loops, min(timings),
+                                     statistics.median(timings))
+            results.append(result)
+            if progress is not None:
+                progress(result)
+    return results
+
+
+def save_results(results, output_file):
+    json.dump({'python': platform.python_version(),
+               'implementation': platform.python_implementation(),
+               'machine': platform.machine(),
+               'platform': platform.platform(),
+               'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'results': [result._asdict() for result in results]},
+              output_file, indent=1)
+    output_file.write('\n')
+
+
+def load_results(input_file):
+    ''' Returns a list of BenchmarkResult saved by save_results() '''
+    return [BenchmarkResult(**result)
+            for result in json.load(input_file)['results']]
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    ''' Returns a Comparison for each benchmark in either list of results.
+
+    status is 'regression' if the current best time is more than threshold
+    slower than the baseline, 'faster' if it's more than threshold faster,
+    'ok' in between, and 'new' / 'missing' if only one side ran it.
+    '''
+    baseline_times = collections.OrderedDict(
+        ((result.name, result.size), result.best) for result in baseline)
+    current_times = collections.OrderedDict(
+        ((result.name, result.size), result.best) for result in current)
+    comparisons = []
+    for key, current_time in current_times.items():
+        baseline_time = baseline_times.get(key)
+        if baseline_time is None:
+            comparisons.append(Comparison(key[0], key[1], None, current_time,
+                                          None, 'new'))
+            continue
+        ratio = current_time / baseline_time if baseline_time else float('inf')
+        if ratio > 1 + threshold:
+            status = 'regression'
+        elif ratio < 1 / (1 + threshold):
+            status = 'faster'
+        else:
+            status = 'ok'
+        comparisons.append(Comparison(key[0], key[1], baseline_time,
+                                      current_time, ratio, status))
+    for key, baseline_time in baseline_times.items():
+        if key not in current_times:
+            comparisons.append(Comparison(key[0], key[1], baseline_time, None,
+                                          None, 'missing'))
+    return comparisons
+
+
+def format_time(seconds):
+    if seconds is None:
+        return '-'
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return '{:.3g}{}'.format(seconds / scale, unit)
+    return '{:.3g}ns'.format(seconds / 1e-9)
+
+
+def print_result(result):
+    print('{:<55} {:>9,} {:<11} {:>9} {:>9} {:>10}/item'.format(
+        result.name, result.size, result.unit, format_time(result.best),
+        format_time(result.median), format_time(result.best / result.size)))
+
+
+def print_comparison(comparison):
+    change = ('{:+.1%}'.format(comparison.ratio - 1)
+              if comparison.ratio is not None else '')
+    print('{:<55} {:>9,} {:>9} {:>9} {:>8} {}'.format(
+        comparison.name, comparison.size, format_time(comparison.baseline),
+        format_time(comparison.current), change, comparison.status))
+
+
+def run_main(args):
+    try:
+        opts, args = getopt.getopt(args, "k:m:r:s:h", ["help"])
+    except getopt.GetoptError as err:
+        print(str(err))
+        usage()
+        sys.exit(2)
+    pattern = None
+    max_size = None
+    repeats = DEFAULT_REPEATS
+    max_seconds = DEFAULT_MAX_SECONDS
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            usage()
+            sys.exit()
+        elif o == "-k":
+            pattern = a
+        elif o == "-m":
+            max_size = int(float(a))
+        elif o == "-r":
+            repeats = int(a)
+        elif o == "-s":
+            max_seconds = float(a)
+        else:
+            assert False, "unhandled option"
+    if len(args) > 1:
+        sys.exit(usage())
+    names = None
+    if pattern is not None:
+        names = [name for name in BENCHMARKS if pattern in name]
+    print('{:<55} {:>9} {:<11} {:>9} {:>9} {:>15}'.format(
+        'benchmark', 'size', '', 'best', 'median', 'best'))
+    results = run_benchmarks(names, max_size, repeats, max_seconds,
+                             print_result)
+    if args:
+        with open(args[0], 'w') as output_file:
+            save_results(results, output_file)
+
+
+def compare_main(args):
+    try:
+        opts, args = getopt.getopt(args, "t:h", ["help"])
+    except getopt.GetoptError as err:
+        print(str(err))
+        usage()
+        sys.exit(2)
+    threshold = DEFAULT_THRESHOLD
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            usage()
+            sys.exit()
+        elif o == "-t":
+            threshold = float(a.replace('%', '')) / 100
+        else:
+            assert False, "unhandled option"
+    if len(args) != 2:
+        sys.exit(usage())
+    with open(args[0]) as baseline_file, open(args[1]) as current_file:
+        comparisons = compare(load_results(baseline_file),
+                              load_results(current_file), threshold)
+    print('{:<55} {:>9} {:>9} {:>9} {:>8}'.format(
+        'benchmark', 'size', 'baseline', 'current', 'change'))
+    for comparison in comparisons:
+        print_comparison(comparison)
+    regressions = [c for c in comparisons if c.status == 'regression']
+    if regressions:
+        sys.exit("{} benchmark(s) more than {:.0%} slower than the baseline"
+                 .format(len(regressions), threshold))
+
+
+def main():
+    args = sys.argv[1:]
+    if not args or args[0] in ('-h', '--help'):
+        sys.exit(usage())
+    if args[0] == 'run':
+        run_main(args[1:])
+    elif args[0] == 'compare':
+        compare_main(args[1:])
+    else:
+        sys.exit("Unknown command {!r}. Use -h for help".format(args[0]))
+
+if __name__ == '__main__':
+    main()
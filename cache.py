@@ -0,0 +1,176 @@
+'''
+Result cache shared by the calculators
+By: Michael Asnes
+
+Keeps the results of recent calculations, keyed by the command and its
+canonicalized parameters, so "7%", "1.07" and 1.07 are all the same rate and
+"10" and 10 are the same number of periods. The most recently used
+max_entries results are kept in memory. Optionally every result is also
+written to a sqlite file, so a new process starts with a warm cache. The file
+records the CACHE_VERSION it was written with, and is emptied when opened
+with a different one.
+'''
+import collections
+import json
+import sqlite3
+
+DEFAULT_MAX_ENTRIES = 100000
+# Results are written to disk in transactions of this many
+DEFAULT_COMMIT_EVERY = 1000
+# Bump whenever a calculator's results (or the key format) change, so results
+# stored before the change are thrown away instead of served
+CACHE_VERSION = 2
+
+# Parameters given as growth rates (ex: 1.07), which may also be written '7%'
+RATE_PARAMETERS = frozenset(['rate', 'rate_of_change', 'inflation_rate',
+                             'compounding_rate'])
+
+
+def canonical_value(name, value):
+    ''' Numbers become floats, so 10, 10.0 and "10" match but inputs that
+    differ in any digit don't. Rates given as percentages become growth
+    rates, the same way fincalc reads them. Anything else is left alone. '''
+    if isinstance(value, str):
+        text = value.strip()
+        try:
+            if text.endswith('%') and name in RATE_PARAMETERS:
+                value = float(text[:-1]) / 100 + 1
+            else:
+                value = float(text)
+        except ValueError:
+            return value
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, sort_keys=True)
+    return value
+
+
+def canonical_key(command, parameters):
+    ''' A hashable key that's the same for equivalent requests '''
+    return (command,) + tuple(sorted(
+        (name, canonical_value(name, value))
+        for name, value in parameters.items()))
+
+
+class ResultCache(object):
+    ''' LRU cache of calculation results, with an optional sqlite backing
+    store. Counts hits (from memory and from disk), misses and evictions. '''
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, path=None,
+                 max_disk_entries=None, commit_every=DEFAULT_COMMIT_EVERY,
+                 version=CACHE_VERSION):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.commit_every = commit_every
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+        self._pending_writes = 0
+        self._db = None
+        if path is not None:
+            self._db = sqlite3.connect(path)
+            self._db.execute('CREATE TABLE IF NOT EXISTS results '
+                             '(key TEXT PRIMARY KEY, value TEXT)')
+            self._db.execute('CREATE TABLE IF NOT EXISTS metadata '
+                             '(name TEXT PRIMARY KEY, value TEXT)')
+            row = self._db.execute("SELECT value FROM metadata WHERE name = "
+                                   "'version'").fetchone()
+            if row is None or row[0] != str(version):
+                # Written by another version of the calculators
+                self._db.execute('DELETE FROM results')
+                self._db.execute("INSERT OR REPLACE INTO metadata VALUES "
+                                 "('version', ?)", (str(version),))
+                self._db.commit()
+
+    def get(self, command, parameters):
+        ''' Returns the cached result, or None '''
+        try:
+            key = canonical_key(command, parameters)
+        except TypeError:   # parameters that can't be compared or hashed
+            self.misses += 1
+            return None
+        try:
+            result = self._entries[key]
+        except KeyError:
+            result = self._load(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, result)
+        else:
+            self._entries.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def put(self, command, parameters, result):
+        try:
+            key = canonical_key(command, parameters)
+        except TypeError:
+            return
+        self._remember(key, result)
+        if self._db is not None:
+            self._db.execute('INSERT OR REPLACE INTO results VALUES (?, ?)',
+                             (json.dumps(key), json.dumps(result)))
+            self._pending_writes += 1
+            if self._pending_writes >= self.commit_every:
+                self.flush()
+
+    def get_or_compute(self, command, parameters, compute):
+        ''' Returns the cached result, or compute(parameters) (which is then
+        cached). Exceptions from compute aren't cached. '''
+        result = self.get(command, parameters)
+        if result is None:
+            result = compute(parameters)
+            self.put(command, parameters, result)
+        return result
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'entries': len(self._entries), 'hits': self.hits,
+                'disk_hits': self.disk_hits, 'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0}
+
+    def flush(self):
+        ''' Commits pending writes to the sqlite file '''
+        if self._db is not None and self._pending_writes:
+            self._db.commit()
+            self._pending_writes = 0
+
+    def close(self):
+        if self._db is None:
+            return
+        self.flush()
+        if self.max_disk_entries is not None:
+            # rowids grow with every write, so the newest results are kept
+            self._db.execute('DELETE FROM results WHERE rowid NOT IN (SELECT '
+                             'rowid FROM results ORDER BY rowid DESC LIMIT ?)',
+                             (self.max_disk_entries,))
+            self._db.commit()
+        self._db.close()
+        self._db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _remember(self, key, result):
+        self._entries[key] = result
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _load(self, key):
+        if self._db is None:
+            return None
+        row = self._db.execute('SELECT value FROM results WHERE key = ?',
+                               (json.dumps(key),)).fetchone()
+        return json.loads(row[0]) if row is not None else None
@@ -5,6 +5,23 @@ By: Michael Asnes
 '''
 import sys
 import math
+from array import array
+
+# Per-element status codes returned by cagr_batch()
+STATUS_OK = 0
+STATUS_ZERO_TO_ZERO = 1
+STATUS_INFINITE = 2
+STATUS_ZERO_PERIODS = 3
+STATUS_NEGATIVE_RATIO = 4
+
+FAILSAFE_MESSAGES = {
+    STATUS_ZERO_TO_ZERO: ("Investment went from $0 to $0! "
+                          "You made no money, from no money."),
+    STATUS_INFINITE: "Your returns were infinite",
+    STATUS_ZERO_PERIODS: "Growth doesn't make sense over 0 periods",
+    STATUS_NEGATIVE_RATIO: ("Growth can't be calculated when the beginning "
+                            "and ending values have different signs"),
+}
 
 def usage():
     print(
@@ -36,16 +53,73 @@ class CagrCalc(object):
 
     def cagr(self):
         self._cagr_failsafes()
-        return math.pow((self.ending_value / self.beginning_value), (1 / self.num_periods)) - 1
+        return _growth(*self.get_parameters())
 
     def _cagr_failsafes(self):
-        if self.ending_value == 0 and self.beginning_value == 0:
-            sys.exit("Investment went from $0 to $0! "
-                     "You made no money, from no money.")
-        elif self.beginning_value == 0:
-            sys.exit("Your returns were infinite")
-        elif self.num_periods == 0:
-            sys.exit("Growth doesn't make sense over 0 periods")
+        status = cagr_status(self.beginning_value, self.ending_value,
+                             self.num_periods)
+        if status != STATUS_OK:
+            sys.exit(FAILSAFE_MESSAGES[status])
+
+def cagr_status(beginning_value, ending_value, num_periods):
+    """ Returns the STATUS_* code describing whether a cagr can be computed """
+    if ending_value == 0 and beginning_value == 0:
+        return STATUS_ZERO_TO_ZERO
+    elif beginning_value == 0:
+        return STATUS_INFINITE
+    elif num_periods == 0:
+        return STATUS_ZERO_PERIODS
+    elif ending_value / beginning_value < 0:
+        return STATUS_NEGATIVE_RATIO
+    elif not math.isfinite(_growth(beginning_value, ending_value, num_periods)):
+        return STATUS_INFINITE
+    return STATUS_OK
+
+def _growth(beginning_value, ending_value, num_periods):
+    """ The cagr, inf if it's too large to represent """
+    try:
+        return math.pow(ending_value / beginning_value, 1 / num_periods) - 1
+    except OverflowError:
+        return math.inf
+
+def cagr_batch(beginning_values, ending_values, num_periods):
+    """ Computes the cagr of many positions in a single pass.
+
+    Takes three equal length sequences (lists, array.array, numpy arrays or
+    anything else that can be iterated) and returns (rates, statuses):
+        rates: array('d') of growth rates, nan where a rate can't be computed
+        statuses: array('b') of STATUS_* codes, one per position
+
+    Bad rows are flagged in statuses instead of exiting, so one bad
+    position doesn't stop the rest of the batch.
+    """
+    rates = array('d')
+    statuses = array('b')
+    append_rate = rates.append
+    append_status = statuses.append
+    pow_ = math.pow
+    isfinite = math.isfinite
+    nan = float('nan')
+    for beginning, ending, periods in zip(beginning_values, ending_values,
+                                          num_periods):
+        beginning = float(beginning)
+        ending = float(ending)
+        periods = float(periods)
+        if beginning == 0 or periods == 0 or ending / beginning < 0:
+            append_rate(nan)
+            append_status(cagr_status(beginning, ending, periods))
+        else:
+            try:
+                rate = pow_(ending / beginning, 1 / periods) - 1
+            except OverflowError:
+                rate = nan
+            if isfinite(rate):
+                append_rate(rate)
+                append_status(STATUS_OK)
+            else:
+                append_rate(nan)
+                append_status(STATUS_INFINITE)
+    return rates, statuses
 
 def main():
     cagr_calc = CagrCalc(*process_opts())
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+'''
+Columnar binary format for batch results
+By: Michael Asnes
+
+A .fcol file holds a table of fixed width numbers, stored a column at a
+time, so it can be read back without parsing anything:
+
+    header  b'FCOL', version (uint16), 0 (uint16), length of the json
+            (uint32), then json naming the columns, their array typecodes
+            and the meaning of any status codes, padded to 8 bytes
+    chunks  b'CHNK', 0 (uint32), rows (uint64), then each column's values
+            in order, each padded to 8 bytes
+
+Everything is little endian. Writers append chunks as results come in, and
+readers memory map the file and hand out each chunk's columns as
+memoryviews, without copying. numpy.frombuffer() turns one into a NumPy
+array, still without copying.
+'''
+import collections
+import json
+import mmap
+import struct
+import sys
+from array import array
+
+MAGIC = b'FCOL'
+CHUNK_MAGIC = b'CHNK'
+VERSION = 1
+ALIGNMENT = 8
+# Typecodes whose size is the same everywhere
+TYPECODES = {'b': 1, 'B': 1, 'h': 2, 'H': 2, 'i': 4, 'I': 4, 'q': 8, 'Q': 8,
+             'f': 4, 'd': 8}
+
+_HEADER = struct.Struct('<4sHHI')
+_CHUNK_HEADER = struct.Struct('<4sIQ')
+
+
+def usage():
+    print(
+        '''Usage:
+\t-h show this help
+\t<file.fcol>
+\t\tprints the columns of a columnar results file as csv'''
+    )
+
+
+def _padding(length):
+    return -length % ALIGNMENT
+
+
+def encode_header(columns, status_codes=None):
+    ''' The header of a file with columns, a list of (name, typecode) pairs.
+    status_codes maps any status codes used in the file to what they mean. '''
+    for name, typecode in columns:
+        if typecode not in TYPECODES:
+            raise ValueError("Column {!r} has unsupported type {!r}".format(
+                name, typecode))
+    description = json.dumps({
+        'columns': [[name, typecode] for name, typecode in columns],
+        'status_codes': {str(code): meaning for code, meaning
+                         in (status_codes or {}).items()}}).encode('utf-8')
+    description += b' ' * _padding(_HEADER.size + len(description))
+    return _HEADER.pack(MAGIC, VERSION, 0, len(description)) + description
+
+
+def encode_chunk(columns, values):
+    ''' One chunk of rows. values holds a sequence (ideally an array of the
+    column's type) per column, all the same length. '''
+    if len(values) != len(columns):
+        raise ValueError("Need {} columns of values, got {}".format(
+            len(columns), len(values)))
+    num_rows = len(values[0]) if values else 0
+    parts = [_CHUNK_HEADER.pack(CHUNK_MAGIC, 0, num_rows)]
+    for (name, typecode), column in zip(columns, values):
+        if len(column) != num_rows:
+            raise ValueError("Column {!r} has {} rows, expected {}".format(
+                name, len(column), num_rows))
+        if not (isinstance(column, array) and column.typecode == typecode):
+            column = array(typecode, column)
+        if sys.byteorder != 'little':
+            column = array(typecode, column)
+            column.byteswap()
+        data = column.tobytes()
+        parts.append(data + b'\0' * _padding(len(data)))
+    return b''.join(parts)
+
+
+class ColumnarWriter(object):
+    ''' Appends chunks of rows to a .fcol file opened in binary mode. Writes
+    the header first unless append is set (for adding to an existing file
+    with the same columns). '''
+    def __init__(self, output_file, columns, status_codes=None, append=False):
+        self.output_file = output_file
+        self.columns = [(name, typecode) for name, typecode in columns]
+        if not append:
+            output_file.write(encode_header(self.columns, status_codes))
+
+    def write_chunk(self, values):
+        self.output_file.write(encode_chunk(self.columns, values))
+
+
+class ColumnarReader(object):
+    ''' Memory maps a .fcol file.
+
+    columns is a list of (name, typecode) pairs and status_codes maps status
+    codes to their meaning. chunks() yields an OrderedDict of memoryviews per
+    chunk, keyed by column name, straight into the mapped file. They stay
+    valid until close().
+    '''
+    def __init__(self, path):
+        if sys.byteorder != 'little':
+            raise ValueError("Columnar files can only be memory mapped on "
+                             "little endian machines")
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError("{} is empty".format(path))
+        self._views = []
+        magic, version, _, length = _HEADER.unpack_from(self._map, 0) \
+            if len(self._map) >= _HEADER.size else (b'', 0, 0, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("{} is not a columnar results file".format(path))
+        if version != VERSION:
+            self.close()
+            raise ValueError("{} is version {}, expected {}".format(
+                path, version, VERSION))
+        description = json.loads(
+            self._map[_HEADER.size:_HEADER.size + length].decode('utf-8'))
+        self.columns = [(name, typecode)
+                        for name, typecode in description['columns']]
+        self.status_codes = {int(code): meaning for code, meaning
+                             in description['status_codes'].items()}
+        self._data_offset = _HEADER.size + length
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        # Cast views before the views they were cast from
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._map.close()
+        self._file.close()
+
+    def chunks(self):
+        for offset, num_rows in self._chunk_rows():
+            offset += _CHUNK_HEADER.size
+            chunk = collections.OrderedDict()
+            for name, typecode in self.columns:
+                length = num_rows * TYPECODES[typecode]
+                chunk[name] = self._view(offset, length, typecode)
+                offset += length + _padding(length)
+            yield chunk
+
+    def __len__(self):
+        return sum(num_rows for _, num_rows in self._chunk_rows())
+
+    def _chunk_rows(self):
+        ''' Yields (offset, rows) for every chunk, checking each is whole '''
+        offset = self._data_offset
+        size = len(self._map)
+        while offset < size:
+            if offset + _CHUNK_HEADER.size > size:
+                raise ValueError("The file ends partway through a chunk")
+            magic, _, num_rows = _CHUNK_HEADER.unpack_from(self._map, offset)
+            if magic != CHUNK_MAGIC:
+                raise ValueError("Bad chunk at byte {:,}".format(offset))
+            length = _CHUNK_HEADER.size + sum(
+                num_rows * TYPECODES[typecode] + _padding(
+                    num_rows * TYPECODES[typecode])
+                for _, typecode in self.columns)
+            if offset + length > size:
+                raise ValueError("The file ends partway through a chunk")
+            yield offset, num_rows
+            offset += length
+
+    def _view(self, offset, length, typecode):
+        raw = memoryview(self._map)[offset:offset + length]
+        self._views.append(raw)
+        view = raw.cast(typecode)
+        self._views.append(view)
+        return view
+
+    def column(self, name):
+        ''' The whole of one column, copied into an array '''
+        typecode = dict(self.columns)[name]
+        values = array(typecode)
+        for chunk in self.chunks():
+            values.frombytes(chunk[name].cast('B'))
+        return values
+
+
+def main():
+    import csv
+    if len(sys.argv) != 2 or sys.argv[1] in ('-h', '--help'):
+        sys.exit(usage())
+    try:
+        reader = ColumnarReader(sys.argv[1])
+    except (OSError, ValueError) as err:
+        sys.exit(str(err))
+    with reader:
+        writer = csv.writer(sys.stdout)
+        writer.writerow([name for name, _ in reader.columns])
+        for chunk in reader.chunks():
+            writer.writerows(zip(*chunk.values()))
+
+
+if __name__ == '__main__':
+    main()
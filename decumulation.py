@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+'''
+Retirement drawdown simulator
+By: Michael Asnes
+
+The retirement calculator stops at the day you retire, and only uses the
+years of retirement to look up a safe withdrawal rate. This module
+simulates the retirement itself: starting from the projected retirement
+funds, it withdraws money every year along many random market paths and
+reports how often, and in which year, the money runs out.
+
+Withdrawal strategies:
+    fixed_percent       the withdraw rate times whatever is left, every year
+    inflation_adjusted  the withdraw rate times the starting funds, every
+                        year (in today's currency, so it rises with inflation)
+    guardrail           starts like inflation_adjusted, but cuts the
+                        withdrawal when it gets too large a share of what's
+                        left, and raises it when it gets too small a share
+
+Every balance is in today's currency, like in the retirement calculator.
+Each year's withdrawal comes out at the start of the year and the rest
+compounds at that year's net rate. Paths are simulated a chunk at a time,
+all of a chunk's paths a year at a time, and paths that run out of money
+drop out of the later years.
+'''
+import collections
+import concurrent.futures
+import random
+import sys
+from array import array
+
+import history
+import montecarlo
+import retirement
+
+STRATEGIES = ('fixed_percent', 'inflation_adjusted', 'guardrail')
+DEFAULT_STRATEGY = 'inflation_adjusted'
+# Guardrails sit this share above and below the starting withdraw rate, and
+# crossing one changes the withdrawal by this share
+DEFAULT_GUARDRAIL_BAND = 0.20
+DEFAULT_GUARDRAIL_ADJUSTMENT = 0.10
+DEFAULT_PATHS = 10000
+
+DecumulationResult = collections.namedtuple(
+    'DecumulationResult',
+    ['paths', 'seed', 'strategy', 'starting_funds', 'first_withdrawal',
+     'success_probability', 'depletion_years', 'ending_funds_percentiles',
+     'withdrawal_percentiles'])
+DecumulationResult.__doc__ = ''' Outcome of a DecumulationSimulator run.
+
+depletion_years[y] is how many paths ran out of money in year y + 1.
+withdrawal_percentiles are of each path's average yearly withdrawal, with
+nothing withdrawn after the money runs out. '''
+
+
+def usage():
+    print(''' Usage: decumulation.py [retirement.py options] [strategy options] [strategy]
+          strategy is one of {} (defaults to {}).
+          Simulates withdrawals over the years of retirement, starting from
+          the retirement funds retirement.py projects for the plan.
+
+          --withdraw-rate=<fraction> share of the funds withdrawn in the
+             first year (defaults to the safe withdraw rate for the years
+             of retirement) (float <= 1.00 or 'x%')
+          --retirement-rate=<rate> compounding rate during retirement
+             (defaults to {}) (float >= 1.00 or 'x%')
+          --guardrail-band=<fraction> (defaults to {})
+          --guardrail-adjustment=<fraction> (defaults to {})
+
+          The Monte Carlo options of retirement.py (--monte-carlo=<paths>,
+          --seed, --volatility, --distribution, --workers, ...) set up the
+          simulation. --monte-carlo defaults to {:,} paths.
+          '''.format(', '.join(STRATEGIES), DEFAULT_STRATEGY,
+                     retirement.DEFAULT_RETIRENMENT_COMPOUNDING_RATE,
+                     DEFAULT_GUARDRAIL_BAND, DEFAULT_GUARDRAIL_ADJUSTMENT,
+                     DEFAULT_PATHS))
+
+
+def process_opts():
+    ''' Splits out this module's options and strategy, and hands the rest to
+    retirement.DataHolder '''
+    def to_fraction(arg, set_to_one=False):
+        if '%' in arg:
+            return float(arg.replace('%', '')) / 100 + (1 if set_to_one else 0)
+        return float(arg)
+
+    options = {}
+    strategy = DEFAULT_STRATEGY
+    retirement_args = []
+    for arg in sys.argv[1:]:
+        name, _, value = arg.partition('=')
+        if arg in ('-h', '--help'):
+            usage()
+            sys.exit()
+        elif name == '--withdraw-rate':
+            options['withdraw_rate'] = to_fraction(value)
+        elif name == '--retirement-rate':
+            options['compounding_rate'] = to_fraction(value, set_to_one=True)
+        elif name == '--guardrail-band':
+            options['guardrail_band'] = to_fraction(value)
+        elif name == '--guardrail-adjustment':
+            options['guardrail_adjustment'] = to_fraction(value)
+        elif arg in STRATEGIES:
+            strategy = arg
+        else:
+            retirement_args.append(arg)
+    options['strategy'] = strategy
+    # DataHolder only keeps the Monte Carlo options along with a path count
+    if not any(arg.startswith('--monte-carlo') for arg in retirement_args):
+        retirement_args.append('--monte-carlo={}'.format(DEFAULT_PATHS))
+    return retirement.DataHolder(retirement_args), options
+
+
+class DecumulationSimulator(object):
+    ''' Simulates the retirement of a plan (a DataHolder or
+    RetirementParameters) over many random paths.
+
+    Paths start with starting_funds, which defaults to what
+    CompoundingCalculator projects for the plan, and last the plan's years
+    of retirement. withdraw_rate defaults to the builtin table's safe rate.
+    Yearly rates are drawn like montecarlo.MonteCarloSimulator's, around
+    compounding_rate (retirement portfolios usually hold fewer stocks) and
+    the plan's inflation rate. Chunks, seeds and workers work the same way
+    too.
+    '''
+    def __init__(self, dataHolder, paths, strategy=DEFAULT_STRATEGY,
+                 withdraw_rate=None, starting_funds=None,
+                 compounding_rate=retirement.DEFAULT_RETIRENMENT_COMPOUNDING_RATE,
+                 seed=None, distribution=montecarlo.DEFAULT_DISTRIBUTION,
+                 return_volatility=montecarlo.DEFAULT_RETURN_VOLATILITY,
+                 inflation_volatility=montecarlo.DEFAULT_INFLATION_VOLATILITY,
+                 history_years=None,
+                 stock_allocation=history.DEFAULT_STOCK_ALLOCATION,
+                 guardrail_band=DEFAULT_GUARDRAIL_BAND,
+                 guardrail_adjustment=DEFAULT_GUARDRAIL_ADJUSTMENT,
+                 workers=1, chunk_size=montecarlo.DEFAULT_CHUNK_SIZE):
+        if strategy not in STRATEGIES:
+            raise ValueError("Unknown strategy {!r}, expected one of {}"
+                             .format(strategy, ', '.join(STRATEGIES)))
+        if distribution not in montecarlo.DISTRIBUTIONS:
+            raise ValueError("Unknown distribution {!r}, expected one of {}"
+                             .format(distribution,
+                                     ', '.join(montecarlo.DISTRIBUTIONS)))
+        if distribution == 'bootstrap' and not history_years:
+            raise ValueError("The bootstrap distribution needs history to "
+                             "sample from")
+        if withdraw_rate is None:
+            withdraw_rate = retirement.safe_withdraw_rate_for(
+                dataHolder.years_of_retirement)
+        if not 0 <= withdraw_rate <= 1:
+            raise ValueError("The withdraw rate must be between 0 and 1")
+        if starting_funds is None:
+            starting_funds = retirement.CompoundingCalculator(
+                dataHolder).get_retirement_funds()
+        self.dataHolder = dataHolder
+        self.paths = int(paths)
+        self.strategy = strategy
+        self.withdraw_rate = withdraw_rate
+        self.starting_funds = float(starting_funds)
+        self.compounding_rate = compounding_rate
+        self.seed = seed if seed is not None else random.randrange(2 ** 32)
+        self.distribution = distribution
+        self.return_volatility = return_volatility
+        self.inflation_volatility = inflation_volatility
+        self.history_years = history_years
+        self.stock_allocation = stock_allocation
+        self.guardrail_band = guardrail_band
+        self.guardrail_adjustment = guardrail_adjustment
+        self.workers = workers
+        self.chunk_size = chunk_size
+
+    def run(self, percentiles=montecarlo.DEFAULT_PERCENTILES):
+        ''' Returns a DecumulationResult '''
+        years = self.dataHolder.years_of_retirement
+        depletion_years = [0] * years
+        ending_funds = array('d')
+        withdrawals = array('d')
+        for chunk_ending_funds, chunk_depletions, chunk_withdrawals \
+                in self._map_chunks():
+            ending_funds.extend(chunk_ending_funds)
+            withdrawals.extend(chunk_withdrawals)
+            for year, count in enumerate(chunk_depletions):
+                depletion_years[year] += count
+        ending_funds = sorted(ending_funds)
+        withdrawals = sorted(withdrawals)
+        depleted = sum(depletion_years)
+        return DecumulationResult(
+            self.paths, self.seed, self.strategy, self.starting_funds,
+            self.starting_funds * self.withdraw_rate,
+            1 - depleted / self.paths if self.paths else float('nan'),
+            depletion_years,
+            collections.OrderedDict((p, montecarlo.percentile(ending_funds, p))
+                                    for p in percentiles),
+            collections.OrderedDict((p, montecarlo.percentile(withdrawals, p))
+                                    for p in percentiles))
+
+    def _map_chunks(self):
+        chunks = [(self._plan(), self._sampler_settings(), self.seed, index,
+                   min(self.chunk_size, self.paths - start))
+                  for index, start in enumerate(range(0, self.paths,
+                                                      self.chunk_size))]
+        if self.workers <= 1 or len(chunks) <= 1:
+            return map(simulate_chunk, chunks)
+        executor = concurrent.futures.ProcessPoolExecutor(self.workers)
+        return montecarlo._shutdown_after(executor,
+                                          executor.map(simulate_chunk, chunks))
+
+    def _plan(self):
+        return (self.starting_funds, self.dataHolder.years_of_retirement,
+                self.strategy, self.withdraw_rate, self.guardrail_band,
+                self.guardrail_adjustment)
+
+    def _sampler_settings(self):
+        if self.distribution == 'bootstrap':
+            rates = [(history.compounding_rate(year, self.stock_allocation),
+                      history.inflation_rate(year))
+                     for year in self.history_years]
+        else:
+            rates = None
+        return (self.distribution, self.compounding_rate,
+                self.return_volatility, self.dataHolder.inflation_rate,
+                self.inflation_volatility, rates)
+
+
+def simulate_chunk(chunk):
+    ''' Simulates one chunk of retirements.
+
+    Returns (ending funds, depletions, average withdrawals): array('d') of
+    each path's funds at the end of retirement, array('l') of how many paths
+    ran out of money in each year, and array('d') of each path's average
+    yearly withdrawal. Lives at module level so it can be sent to a process
+    pool.
+    '''
+    plan, sampler_settings, seed, chunk_index, num_paths = chunk
+    starting_funds, years, strategy, withdraw_rate, band, adjustment = plan
+    rng = random.Random('decumulation:{}:{}'.format(seed, chunk_index))
+    draw_net_rate = montecarlo._net_rate_sampler(rng, *sampler_settings)
+
+    first_withdrawal = starting_funds * withdraw_rate
+    upper_rate = withdraw_rate * (1 + band)
+    lower_rate = withdraw_rate * (1 - band)
+    balances = array('d', [starting_funds]) * num_paths
+    withdrawals = array('d', [first_withdrawal]) * num_paths
+    totals = array('d', [0.0]) * num_paths
+    depletions = array('l', [0]) * max(years, 0)
+    # Paths that still have money. Depleted paths are dropped, so later
+    # years only do work for the paths that are left.
+    active = range(num_paths) if starting_funds > 0 else []
+    for year in range(max(years, 0)):
+        still_active = []
+        for path in active:
+            balance = balances[path]
+            if strategy == 'fixed_percent':
+                withdrawal = balance * withdraw_rate
+            elif strategy == 'guardrail':
+                withdrawal = withdrawals[path]
+                if withdrawal > balance * upper_rate:
+                    withdrawal *= 1 - adjustment
+                elif withdrawal < balance * lower_rate:
+                    withdrawal *= 1 + adjustment
+                withdrawals[path] = withdrawal
+            else:
+                withdrawal = first_withdrawal
+            if withdrawal >= balance:
+                totals[path] += balance
+                balances[path] = 0.0
+                depletions[year] += 1
+                continue
+            totals[path] += withdrawal
+            balance = (balance - withdrawal) * draw_net_rate()
+            if balance <= 0:
+                # A worse than -100% year
+                balances[path] = 0.0
+                depletions[year] += 1
+                continue
+            balances[path] = balance
+            still_active.append(path)
+        active = still_active
+    if starting_funds <= 0 and years > 0:
+        depletions[0] = num_paths
+        balances = array('d', [0.0]) * num_paths
+    average_withdrawals = array('d', [total / years for total in totals]
+                                if years > 0 else totals)
+    return balances, depletions, average_withdrawals
+
+
+def run_decumulation(dataHolder, **options):
+    ''' Sets up a DecumulationSimulator from retirement.py's Monte Carlo
+    options (as DataHolder parses them) and runs it '''
+    monte_carlo_options = dict(dataHolder.monte_carlo_options or {})
+    paths = int(monte_carlo_options.pop('monte_carlo', DEFAULT_PATHS))
+    # Retirements are judged by running out of money, not by a target
+    monte_carlo_options.pop('target', None)
+    converters = {'seed': int, 'workers': int, 'volatility': float,
+                  'inflation_volatility': float}
+    kwargs = {name: converters.get(name, str)(value)
+              for name, value in monte_carlo_options.items()}
+    kwargs['stock_allocation'] = dataHolder.stock_allocation
+    if 'volatility' in kwargs:
+        kwargs['return_volatility'] = kwargs.pop('volatility')
+    if 'history' in kwargs:
+        kwargs['history_years'] = history.load_history(kwargs.pop('history'))
+    kwargs.update(options)
+    return DecumulationSimulator(dataHolder, paths, **kwargs).run()
+
+
+def print_result(result, years_of_retirement):
+    print("Simulating {:,} retirements of {} years (seed {}), starting with "
+          "${:,.2f}".format(result.paths, years_of_retirement, result.seed,
+                            result.starting_funds))
+    print("and withdrawing ${:,.2f} the first year ({} strategy):".format(
+        result.first_withdrawal, result.strategy.replace('_', ' ')))
+    print("    {:.1%} of them never run out of money".format(
+        result.success_probability))
+    if result.paths and any(result.depletion_years):
+        print("    Share that has run out of money by year:")
+        depleted = 0
+        for year, count in enumerate(result.depletion_years, 1):
+            depleted += count
+            if year % 5 == 0 or year == years_of_retirement:
+                print("        {:3}: {:.1%}".format(year,
+                                                   depleted / result.paths))
+    print("    Funds left at the end (today's currency) by percentile:")
+    for pct, funds in result.ending_funds_percentiles.items():
+        print("        {:3}th: ${:,.2f}".format(pct, funds))
+    print("    Average yearly withdrawal (today's currency) by percentile:")
+    for pct, withdrawal in result.withdrawal_percentiles.items():
+        print("        {:3}th: ${:,.2f}".format(pct, withdrawal))
+
+
+def main():
+    dataHolder, options = process_opts()
+    try:
+        result = run_decumulation(dataHolder, **options)
+    except (OSError, ValueError) as err:
+        sys.exit(str(err))
+    print_result(result, dataHolder.years_of_retirement)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+'''
+One entry point for all of the financial calculators
+By: Michael Asnes
+
+    fincalc.py <command> [arguments]   runs one calculator, same as its script
+    fincalc.py batch [options]         answers many requests read from stdin
+
+Calculator modules are only imported once a command needs them, so starting
+up stays quick.
+'''
+import importlib
+import json
+import math
+import sys
+
+# command: calculator module
+SCRIPTS = {
+    'cagr': 'cagr',
+    'inputstreamcagr': 'inputstreamcagr',
+    'periods': 'periods_for_growth',
+    'net_increase': 'net_increase',
+    'retirement': 'retirement',
+    'sweep': 'sweep',
+    'safe_withdrawal': 'safe_withdrawal',
+    'rolling_cagr': 'rolling_cagr',
+    'xirr': 'xirr',
+    'goal_seek': 'goal_seek',
+}
+
+# command: batch evaluator, filled in by @batch_command
+BATCH_COMMANDS = {}
+
+# Result columns for each batch command, used for csv output
+RESULT_FIELDS = {}
+
+# A cache.ResultCache shared by every batch command, or None. See set_cache()
+result_cache = None
+
+
+def usage():
+    print(
+        '''Usage:
+\t-h show this help
+\t<command> [arguments]  run a calculator, where command is one of:
+\t\t{}
+\tbatch [--format=json|csv] [--command=<command>]
+\t\tread one request per line from stdin, write one result per line
+\t\tto stdout. json requests look like
+\t\t{{"command": "cagr", "beginning_value": 100, "ending_value": 200,
+\t\t  "num_periods": 10}}
+\t\tcsv input needs a header row naming the same fields. --command
+\t\tsets the command for requests that don't name one.
+\t\t--cache-size=<num> remembers the results of that many distinct
+\t\trequests, and --cache-file=<file> keeps them in a sqlite file
+\t\tbetween runs. --solver-stats=<file> writes histograms of the
+\t\tgrowth rate solver's work to file when done, in the Prometheus
+\t\ttext format if file ends in .prom and as json otherwise.'''
+        .format(', '.join(sorted(SCRIPTS)))
+    )
+
+
+def batch_command(name, result_fields):
+    ''' Registers a batch evaluator for a command '''
+    def register(evaluate):
+        BATCH_COMMANDS[name] = evaluate
+        RESULT_FIELDS[name] = result_fields
+        return evaluate
+    return register
+
+
+def to_rate(value):
+    ''' Accepts rates as 1.07, "1.07" or "7%" '''
+    if isinstance(value, str) and '%' in value:
+        return float(value.replace('%', '')) / 100 + 1
+    return float(value)
+
+
+@batch_command('cagr', ['rate'])
+def evaluate_cagr(beginning_value, ending_value, num_periods):
+    import cagr
+    beginning_value = float(beginning_value)
+    ending_value = float(ending_value)
+    num_periods = float(num_periods)
+    status = cagr.cagr_status(beginning_value, ending_value, num_periods)
+    if status != cagr.STATUS_OK:
+        raise ValueError(cagr.FAILSAFE_MESSAGES[status])
+    return {'rate': cagr.CagrCalc(beginning_value, ending_value,
+                                  num_periods).cagr()}
+
+
+@batch_command('inputstreamcagr', ['rate'])
+def evaluate_inputstreamcagr(beginning_value, ending_value,
+                             contribution_per_period, num_periods):
+    import inputstreamcagr
+    isc = inputstreamcagr.InputStreamCagr(beginning_value, ending_value,
+                                          contribution_per_period, num_periods)
+    return {'rate': isc.approximate_growth_rate()}
+
+
+@batch_command('xirr', ['rate'])
+def evaluate_xirr(dates, amounts):
+    import xirr
+    if len(dates) != len(amounts):
+        raise ValueError("Need one amount for each date")
+    return {'rate': xirr.xirr(zip(dates, amounts))}
+
+
+@batch_command('periods', ['periods'])
+def evaluate_periods(beginning_value, ending_value, rate_of_change,
+                     contribution_per_period=0):
+    import periods_for_growth
+    calc = periods_for_growth.PeriodsForGrowthCalc(beginning_value, ending_value,
+                                                   to_rate(rate_of_change),
+                                                   contribution_per_period)
+    return {'periods': calc.periods()}
+
+
+@batch_command('net_increase', ['multiple'])
+def evaluate_net_increase(rate, periods):
+    import net_increase
+    return {'multiple': net_increase.net_increase(to_rate(rate), float(periods))}
+
+
+@batch_command('retirement',
+               ['retirement_funds', 'money_contributed', 'safe_withdraw_rate',
+                'withdraw_per_year', 'multipliers', 'sensitivities'])
+def evaluate_retirement(num_multipliers=0, sensitivities=False, **parameters):
+    import retirement
+    parameters = to_retirement_parameters(parameters)
+    result = retirement.calculate(parameters, int(num_multipliers))._asdict()
+    if sensitivities not in (False, 'false', '0', 0):
+        derivatives = retirement.funds_sensitivities(parameters)._asdict()
+        del derivatives['retirement_funds']
+        result['sensitivities'] = derivatives
+    return result
+
+
+@batch_command('goal_seek', ['required'])
+def evaluate_goal_seek(solve_for, withdraw_per_year, safe_withdraw_rate=None,
+                       **parameters):
+    import goal_seek
+    if safe_withdraw_rate is not None:
+        safe_withdraw_rate = float(safe_withdraw_rate)
+    return {'required': goal_seek.solve(solve_for,
+                                        to_retirement_parameters(parameters),
+                                        float(withdraw_per_year),
+                                        safe_withdraw_rate)}
+
+
+def to_retirement_parameters(parameters):
+    ''' Builds retirement.RetirementParameters from request fields '''
+    import retirement
+    for name in ('inflation_rate', 'compounding_rate'):
+        if name in parameters:
+            parameters[name] = to_rate(parameters[name])
+    for name in ('starting_contribution', 'yearly_contribution'):
+        if name in parameters:
+            parameters[name] = float(parameters[name])
+    for name in ('years_of_contribution', 'years_till_retirement',
+                 'years_of_retirement'):
+        if name in parameters:
+            parameters[name] = int(parameters[name])
+    return retirement.RetirementParameters(**parameters)
+
+
+def set_cache(cache):
+    ''' Makes evaluate() look results up in cache (a cache.ResultCache)
+    before calculating them. None turns caching off. '''
+    global result_cache
+    result_cache = cache
+
+
+def evaluate(name, parameters):
+    ''' Runs one batch request. Returns a dict of results.
+
+    Raises ValueError for unknown commands, bad parameters, or inputs the
+    calculator can't handle.
+    '''
+    if not isinstance(name, str) or name not in BATCH_COMMANDS:
+        raise ValueError("Unknown batch command {!r}".format(name))
+    if result_cache is not None:
+        return result_cache.get_or_compute(
+            name, parameters, lambda parameters: _evaluate(name, parameters))
+    return _evaluate(name, parameters)
+
+
+def _evaluate(name, parameters):
+    try:
+        result = BATCH_COMMANDS[name](**parameters)
+    except TypeError as err:
+        raise ValueError("Bad parameters for {}: {}".format(name, err))
+    except ArithmeticError as err:
+        raise ValueError(str(err))
+    check_finite(result)
+    return result
+
+
+def check_finite(value, field='result'):
+    ''' Raises ValueError if value, or any number in it, is infinite or nan.
+    JSON has no way to write them. '''
+    if isinstance(value, dict):
+        for key, item in value.items():
+            check_finite(item, key)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            check_finite(item, field)
+    elif isinstance(value, float) and not math.isfinite(value):
+        raise ValueError("The {} is too large to calculate".format(field))
+
+
+def dump_response(response):
+    ''' Serializes a response as strict JSON (no NaN or Infinity) '''
+    try:
+        return json.dumps(response, allow_nan=False)
+    except ValueError as err:
+        return json.dumps({'error': "Internal error: {}".format(err)})
+
+
+def run_batch(input_file, output_file, input_format='json',
+              default_command=None):
+    ''' Answers one request per line of input_file until it runs out.
+    Each result is written (and flushed) as soon as it's ready. '''
+    if input_format == 'csv':
+        _run_csv_batch(input_file, output_file, default_command)
+        return
+    for line in input_file:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("Requests must be JSON objects")
+            name = request.pop('command', default_command)
+            response = {'result': evaluate(name, request)}
+        except ValueError as err:
+            response = {'error': str(err)}
+        except Exception as err:
+            # One bad line mustn't end a long running batch
+            response = {'error': "Internal error: {}".format(err)}
+        output_file.write(dump_response(response) + '\n')
+        output_file.flush()
+
+
+def _run_csv_batch(input_file, output_file, default_command):
+    import csv
+    reader = csv.DictReader(input_file)
+    writer = csv.DictWriter(output_file,
+                            csv_output_fields(reader.fieldnames or [],
+                                              default_command),
+                            extrasaction='ignore')
+    writer.writeheader()
+    for row in reader:
+        evaluate_csv_row(row, default_command)
+        writer.writerow(row)
+        output_file.flush()
+
+
+def csv_output_fields(input_fields, default_command=None):
+    ''' Columns of csv batch output: the input's, then every result field
+    the command (or any command) can give, then error '''
+    return list(input_fields) + result_fields(default_command) + ['error']
+
+
+def result_fields(command=None):
+    ''' Result fields of a batch command, or of every command if None '''
+    if command is not None:
+        return list(RESULT_FIELDS.get(command, []))
+    fields = []
+    for name in sorted(RESULT_FIELDS):
+        fields.extend(field for field in RESULT_FIELDS[name]
+                      if field not in fields)
+    return fields
+
+
+def evaluate_csv_row(row, default_command=None):
+    ''' Runs the request in a csv row (a dict), adding its results or error
+    to the row. Empty fields are left out of the request. '''
+    request = {field: value for field, value in row.items()
+               if value not in (None, '')}
+    name = request.pop('command', default_command)
+    try:
+        row.update(evaluate(name, request))
+    except ValueError as err:
+        row['error'] = str(err)
+    except Exception as err:
+        row['error'] = "Internal error: {}".format(err)
+
+
+def run_command(name, args):
+    ''' Runs a calculator script's main() with args as its arguments '''
+    module = importlib.import_module(SCRIPTS[name])
+    sys.argv = [module.__file__] + list(args)
+    module.main()
+
+
+def main():
+    args = sys.argv[1:]
+    if not args or args[0] in ('-h', '--help'):
+        sys.exit(usage())
+    name = args[0]
+    if name == 'batch':
+        input_format = 'json'
+        default_command = None
+        cache_size = None
+        cache_file = None
+        stats_file = None
+        for arg in args[1:]:
+            if arg.startswith('--format='):
+                input_format = arg.split('=', 1)[1]
+            elif arg.startswith('--command='):
+                default_command = arg.split('=', 1)[1]
+            elif arg.startswith('--cache-size='):
+                cache_size = int(arg.split('=', 1)[1])
+            elif arg.startswith('--cache-file='):
+                cache_file = arg.split('=', 1)[1]
+            elif arg.startswith('--solver-stats='):
+                stats_file = arg.split('=', 1)[1]
+            else:
+                sys.exit(usage())
+        if input_format not in ('json', 'csv'):
+            sys.exit("Unknown batch format {!r}".format(input_format))
+        if cache_size is not None or cache_file is not None:
+            import cache
+            set_cache(cache.ResultCache(cache_size or cache.DEFAULT_MAX_ENTRIES,
+                                        cache_file))
+        if stats_file is not None:
+            import inputstreamcagr
+            import solver_stats
+            stats = solver_stats.SolverStats()
+            inputstreamcagr.set_solver_stats(stats)
+        try:
+            run_batch(sys.stdin, sys.stdout, input_format, default_command)
+        finally:
+            if result_cache is not None:
+                result_cache.close()
+            if stats_file is not None:
+                with open(stats_file, 'w') as output_file:
+                    output_file.write(stats.to_prometheus()
+                                      if stats_file.endswith('.prom')
+                                      else stats.to_json() + '\n')
+    elif name in SCRIPTS:
+        run_command(name, args[1:])
+    else:
+        sys.exit("Unknown command {!r}. Use -h for help".format(name))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+'''
+Retirement goal seek
+By: Michael Asnes
+
+Runs the retirement calculator backwards: given a target safe withdrawal per
+year (in today's currency), finds the yearly contribution, compounding rate
+or years till retirement that gets there, with everything else in the plan
+held fixed.
+
+The target withdrawal fixes the retirement funds needed,
+    funds = withdraw per year / safe withdraw rate
+and the funds are (see retirement.growth_factors())
+    funds = s * g^t + c * g^(t-k) * (g^k - 1) / (g - 1)
+with g the net compounding rate and k the years of contribution. That's
+linear in c, and the same geometric series periods_for_growth.py solves for
+t, so contributions and years have closed forms. Only the rate needs a root
+finder.
+'''
+import math
+import sys
+from array import array
+
+import retirement
+from inputstreamcagr import (DEFAULT_MAX_ITERATIONS, DEFAULT_RELATIVE_TOLERANCE,
+                             MAX_BRACKET_EXPANSIONS, _newton_bisect_step,
+                             annuity_value_and_derivative, double_rate,
+                             newton_bisect)
+import periods_for_growth
+
+# What can be solved for: the RetirementParameters field each one sets
+GOALS = {
+    'contribution': 'yearly_contribution',
+    'rate': 'compounding_rate',
+    'years': 'years_till_retirement',
+}
+
+# Per-element status codes returned by goal_seek_batch()
+STATUS_OK = 0
+STATUS_UNREACHABLE = 1
+STATUS_BAD_INPUT = 2
+STATUS_MAX_ITERATIONS = 3
+
+FAILSAFE_MESSAGES = {
+    STATUS_UNREACHABLE: "No {} reaches the target withdrawal with this plan",
+    STATUS_BAD_INPUT: ("Values must be finite, contributions not negative, and "
+                       "the target and safe withdraw rate positive"),
+    STATUS_MAX_ITERATIONS: "The {} did not converge",
+}
+
+GOAL_DESCRIPTIONS = {
+    'contribution': 'yearly contribution',
+    'rate': 'compounding rate',
+    'years': 'number of years till retirement',
+}
+
+# Whole years are rounded up, but not over float noise like 25.000000000004
+YEARS_TOLERANCE = 1e-9
+
+
+def usage():
+    print(''' Usage: goal_seek.py [retirement.py options] <goal> <withdraw per year>
+          goal is one of contribution, rate or years. Finds the yearly
+          contribution, compounding rate or (whole) years till retirement
+          that lets you safely withdraw [withdraw per year] (today's
+          currency) each year of retirement. Everything else comes from
+          the retirement.py options (see retirement.py -h).
+
+          When solving for years, contributions continue until retirement.
+          ''')
+
+
+def process_opts():
+    args = sys.argv[1:]
+    if len(args) < 2 or '-h' in args or '--help' in args:
+        sys.exit(usage())
+    goal, target = args[-2:]
+    if goal not in GOALS:
+        sys.exit("Unknown goal {!r}, use one of {}".format(
+            goal, ', '.join(sorted(GOALS))))
+    try:
+        target = float(target.replace(',', ''))
+    except ValueError:
+        sys.exit(usage())
+    return retirement.DataHolder(args[:-2]), goal, target
+
+
+def required_contribution(parameters, withdraw_per_year,
+                          safe_withdraw_rate=None):
+    """ Yearly contribution needed to safely withdraw withdraw_per_year.
+    0 if the starting contribution gets there alone.
+
+    parameters can be RetirementParameters or a DataHolder. Raises ValueError
+    if there's no such contribution.
+    """
+    return _checked('contribution', *_solve_contribution(
+        parameters, _target(parameters, withdraw_per_year, safe_withdraw_rate)))
+
+
+def required_compounding_rate(parameters, withdraw_per_year,
+                              safe_withdraw_rate=None,
+                              relative_tolerance=DEFAULT_RELATIVE_TOLERANCE,
+                              max_iterations=DEFAULT_MAX_ITERATIONS):
+    """ Compounding rate (ex: 1.07, before inflation) needed to safely
+    withdraw withdraw_per_year.
+
+    Raises ValueError if there's no such rate, and ArithmeticError if it
+    can't be found.
+    """
+    funds = _target(parameters, withdraw_per_year, safe_withdraw_rate)
+    status = _rate_status(parameters, funds)
+    if status != STATUS_OK:
+        return _checked('rate', None, status)
+    residual = _RateResidual(parameters, funds)
+    min_rate, max_rate = residual.bracket()
+    net_rate = newton_bisect(residual, min_rate, max_rate, relative_tolerance,
+                             relative_tolerance, max_iterations)
+    return net_rate + parameters.inflation_rate - 1
+
+
+def required_years_till_retirement(parameters, withdraw_per_year,
+                                   safe_withdraw_rate=None,
+                                   keep_contributing=True):
+    """ Fewest whole years till retirement needed to safely withdraw
+    withdraw_per_year.
+
+    With keep_contributing, contributions continue every year until
+    retirement (years of contribution follows years till retirement).
+    Otherwise the years of contribution stay as they are. Raises ValueError
+    if no number of years gets there.
+    """
+    return _checked('years', *_solve_years(
+        parameters, _target(parameters, withdraw_per_year, safe_withdraw_rate),
+        keep_contributing))
+
+
+def solve(goal, parameters, withdraw_per_year, safe_withdraw_rate=None):
+    """ Runs the required_* function for goal (a key of GOALS) """
+    if goal == 'contribution':
+        return required_contribution(parameters, withdraw_per_year,
+                                     safe_withdraw_rate)
+    if goal == 'rate':
+        return required_compounding_rate(parameters, withdraw_per_year,
+                                         safe_withdraw_rate)
+    if goal == 'years':
+        return required_years_till_retirement(parameters, withdraw_per_year,
+                                              safe_withdraw_rate)
+    raise ValueError("Unknown goal {!r}".format(goal))
+
+
+def goal_seek_batch(goal, plans, withdrawals_per_year,
+                    safe_withdraw_rates=None,
+                    relative_tolerance=DEFAULT_RELATIVE_TOLERANCE,
+                    max_iterations=DEFAULT_MAX_ITERATIONS):
+    """ Solves goal for a whole list of clients in one call.
+
+    plans is a sequence of RetirementParameters, with a target withdrawal
+    per year (and optionally a safe withdraw rate) for each. Years are
+    solved with contributions continuing until retirement. Rates are
+    solved a step for every unsolved plan per pass, like
+    inputstreamcagr.approximate_growth_rates(). Returns (values, statuses):
+        values: array('d') of the required contributions, compounding rates
+            or years, nan where there's no answer (rates that don't
+            converge keep their last value)
+        statuses: array('b') of STATUS_* codes, one per plan
+    """
+    if goal not in GOALS:
+        raise ValueError("Unknown goal {!r}".format(goal))
+    if safe_withdraw_rates is None:
+        safe_withdraw_rates = [None] * len(plans)
+    nan = float('nan')
+    values = array('d')
+    statuses = array('b')
+    residuals = {}
+    for index, (parameters, withdraw_per_year, safe_withdraw_rate) in \
+            enumerate(zip(plans, withdrawals_per_year, safe_withdraw_rates)):
+        funds = _target(parameters, withdraw_per_year, safe_withdraw_rate)
+        if goal == 'contribution':
+            value, status = _solve_contribution(parameters, funds)
+        elif goal == 'years':
+            value, status = _solve_years(parameters, funds, True)
+        else:
+            value, status = nan, _rate_status(parameters, funds)
+            if status == STATUS_OK:
+                residuals[index] = _RateResidual(parameters, funds)
+        values.append(value)
+        statuses.append(status)
+    if residuals:
+        _solve_rates_in_lockstep(residuals, plans, values, statuses,
+                                 relative_tolerance, max_iterations)
+    return values, statuses
+
+
+def _target(parameters, withdraw_per_year, safe_withdraw_rate):
+    """ Target funds, or nan if the target or withdraw rate is unusable """
+    if safe_withdraw_rate is None:
+        safe_withdraw_rate = retirement.safe_withdraw_rate_for(
+            parameters.years_of_retirement)
+    withdraw_per_year = float(withdraw_per_year)
+    safe_withdraw_rate = float(safe_withdraw_rate)
+    if not (withdraw_per_year > 0 and safe_withdraw_rate > 0) \
+            or not math.isfinite(withdraw_per_year / safe_withdraw_rate):
+        return float('nan')
+    return withdraw_per_year / safe_withdraw_rate
+
+
+def _checked(goal, value, status):
+    if status != STATUS_OK:
+        raise ValueError(FAILSAFE_MESSAGES[status].format(
+            GOAL_DESCRIPTIONS[goal]))
+    return value
+
+
+def _finite(*values):
+    return all(math.isfinite(value) for value in values)
+
+
+def _solve_contribution(parameters, funds):
+    """ Returns (contribution, status) """
+    s = parameters.starting_contribution
+    if not _finite(funds, s, parameters.net_compounding_rate) or s < 0:
+        return float('nan'), STATUS_BAD_INPUT
+    growth, annuity = retirement.growth_factors(
+        parameters.net_compounding_rate, parameters.years_of_contribution,
+        parameters.years_till_retirement)
+    shortfall = funds - s * growth
+    if shortfall <= 0:
+        return 0.0, STATUS_OK
+    if not annuity > 0:
+        return float('nan'), STATUS_UNREACHABLE
+    return shortfall / annuity, STATUS_OK
+
+
+def _solve_years(parameters, funds, keep_contributing):
+    """ Returns (whole years till retirement, status).
+
+    For t years of contributions and t till retirement the funds are the
+    series periods_for_growth() solves. Past the years of contribution the
+    funds just compound, so t = n + log(target / funds at n) / log(g).
+    """
+    s = parameters.starting_contribution
+    c = parameters.yearly_contribution
+    g = parameters.net_compounding_rate
+    n = parameters.years_of_contribution
+    if not _finite(funds, s, c, g) or s < 0 or c < 0:
+        return float('nan'), STATUS_BAD_INPUT
+    if s >= funds:
+        return 0.0, STATUS_OK
+    if not keep_contributing:
+        n = max(n, 0)
+        funds_at_n = retirement.retirement_funds_closed_form(s, g, c, n, n)
+        if funds_at_n < funds:
+            if not (g > 1 and funds_at_n > 0):
+                return float('nan'), STATUS_UNREACHABLE
+            return _whole_years(n + math.log(funds / funds_at_n)
+                                / math.log(g)), STATUS_OK
+    if periods_for_growth.periods_status(s, funds, g, c) \
+            != periods_for_growth.STATUS_OK:
+        return float('nan'), STATUS_UNREACHABLE
+    years = periods_for_growth.periods_for_growth(s, funds, g, c)
+    if not years >= 0:
+        return float('nan'), STATUS_UNREACHABLE
+    return _whole_years(years), STATUS_OK
+
+
+def _whole_years(years):
+    return float(math.ceil(years - YEARS_TOLERANCE))
+
+
+def _rate_status(parameters, funds):
+    """ STATUS_OK if some positive net compounding rate reaches funds.
+
+    The funds grow with the rate. As the rate falls to 0 they fall to the
+    last contribution if it's made the year of retirement, and to 0 if not.
+    """
+    s = parameters.starting_contribution
+    c = parameters.yearly_contribution
+    t = max(parameters.years_till_retirement, 0)
+    k = min(max(parameters.years_of_contribution, 0), t)
+    if not _finite(funds, s, c, parameters.inflation_rate) or s < 0 or c < 0:
+        return STATUS_BAD_INPUT
+    if t == 0 or not (s > 0 or (c > 0 and k > 0)):
+        return STATUS_UNREACHABLE
+    lowest_funds = c if k == t else 0.0
+    if funds <= lowest_funds:
+        return STATUS_UNREACHABLE
+    return STATUS_OK
+
+
+class _RateResidual(object):
+    """ log(funds at net compounding rate g / target funds) and its
+    derivative, for newton_bisect().
+
+    With m = t - k years of compounding after the contributions stop, the
+    funds are g^m * e(g), where e is inputstreamcagr's annuity value of the k
+    contributions.
+    """
+    def __init__(self, parameters, funds):
+        self.starting_contribution = parameters.starting_contribution
+        self.yearly_contribution = parameters.yearly_contribution
+        t = max(parameters.years_till_retirement, 0)
+        self.years_of_contribution = min(max(parameters.years_of_contribution,
+                                             0), t)
+        self.years_after_contributions = t - self.years_of_contribution
+        self.log_target = math.log(funds)
+
+    def __call__(self, rate):
+        if rate <= 0:
+            return -math.inf, math.inf
+        value, derivative = annuity_value_and_derivative(
+            self.starting_contribution, self.yearly_contribution,
+            self.years_of_contribution, rate)
+        if value == math.inf:
+            return value, value
+        m = self.years_after_contributions
+        return (math.log(value) + m * math.log(rate) - self.log_target,
+                derivative / value + m / rate)
+
+    def bracket(self):
+        """ Returns (min_rate, max_rate) around the solution, widening out
+        from 1. Raises ArithmeticError if it can't. """
+        min_rate, max_rate = 1.0, 1.05
+        expansions = 0
+        if self(min_rate)[0] < 0:
+            while self(max_rate)[0] < 0:
+                expansions += 1
+                if expansions > MAX_BRACKET_EXPANSIONS:
+                    raise ArithmeticError("Couldn't find a compounding rate "
+                                          "high enough to reach the target")
+                min_rate, max_rate = max_rate, double_rate(max_rate)
+        else:
+            min_rate, max_rate = 0.5, 1.0
+            while self(min_rate)[0] > 0:
+                expansions += 1
+                if expansions > MAX_BRACKET_EXPANSIONS:
+                    raise ArithmeticError("Couldn't find a compounding rate "
+                                          "low enough to reach the target")
+                min_rate, max_rate = min_rate / 2, min_rate
+        return min_rate, max_rate
+
+
+def _solve_rates_in_lockstep(residuals, plans, values, statuses,
+                             relative_tolerance, max_iterations):
+    """ Fills in values and statuses for the plans in residuals (index:
+    _RateResidual), taking one solver step per plan per pass """
+    nan = float('nan')
+    size = len(values)
+    rates = array('d', [nan]) * size
+    min_rates = array('d', [nan]) * size
+    max_rates = array('d', [nan]) * size
+    previous_residuals = array('d', [math.inf]) * size
+    active = []
+    for index, residual in residuals.items():
+        try:
+            min_rates[index], max_rates[index] = residual.bracket()
+        except ArithmeticError:
+            statuses[index] = STATUS_MAX_ITERATIONS
+            continue
+        rates[index] = (min_rates[index] + max_rates[index]) / 2
+        active.append(index)
+
+    for _ in range(max_iterations):
+        if not active:
+            break
+        still_active = []
+        for index in active:
+            rate = rates[index]
+            residual, derivative = residuals[index](rate)
+            next_rate, min_rates[index], max_rates[index] = \
+                _newton_bisect_step(rate, residual, derivative,
+                                    previous_residuals[index],
+                                    min_rates[index], max_rates[index],
+                                    relative_tolerance, relative_tolerance)
+            if next_rate is None:
+                continue
+            previous_residuals[index] = residual
+            rates[index] = next_rate
+            still_active.append(index)
+        active = still_active
+
+    for index in active:
+        statuses[index] = STATUS_MAX_ITERATIONS
+    for index in residuals:
+        if rates[index] == rates[index]:
+            values[index] = rates[index] + plans[index].inflation_rate - 1
+
+
+def main():
+    dataHolder, goal, target = process_opts()
+    printer = retirement.CalcPrinter(
+        retirement.CompoundingCalculator(dataHolder), dataHolder)
+    safe_withdraw_rate = printer._get_safe_withdraw_rate()
+    try:
+        value = solve(goal, dataHolder, target, safe_withdraw_rate)
+    except (ValueError, ArithmeticError) as err:
+        sys.exit(str(err))
+    print("To safely withdraw ${:,.2f} per year (today's currency) at a rate "
+          "of {:1.3%},\nyou need retirement funds of ${:,.2f}. To get there "
+          "you need".format(target, safe_withdraw_rate,
+                            target / safe_withdraw_rate))
+    if goal == 'contribution':
+        print("\n\t${:,.2f} contributed each year for {} years\n".format(
+            value, min(dataHolder.years_of_contribution,
+                       dataHolder.years_till_retirement)))
+    elif goal == 'rate':
+        print("\n\ta compounding rate of {} ({})\n".format(
+            round(value, 6), printer.to_percent_str(value)))
+    else:
+        print("\n\t{:.0f} years till retirement, contributing each year\n"
+              .format(value))
+
+
+if __name__ == '__main__':
+    main()
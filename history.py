@@ -0,0 +1,52 @@
+'''
+Historical returns and inflation
+By: Michael Asnes
+
+Reads a local CSV file of yearly market history. The file needs a header row
+with (at least) these columns:
+
+    year,stocks,bonds,inflation
+
+stocks and bonds are nominal total returns for the year and inflation is the
+change in prices, all given as fractions (0.12) or percents (12%).
+'''
+import collections
+import csv
+
+DEFAULT_STOCK_ALLOCATION = 0.60
+
+HistoryYear = collections.namedtuple('HistoryYear',
+                                     ['year', 'stocks', 'bonds', 'inflation'])
+
+
+def load_history(path):
+    ''' Returns a list of HistoryYear, sorted by year '''
+    def treat_potential_percent(arg):
+        if '%' in arg:
+            return float(arg.replace('%', '')) / 100
+        return float(arg)
+
+    history = []
+    with open(path, newline='') as history_file:
+        for row in csv.DictReader(history_file):
+            history.append(HistoryYear(int(row['year']),
+                                       treat_potential_percent(row['stocks']),
+                                       treat_potential_percent(row['bonds']),
+                                       treat_potential_percent(row['inflation'])))
+    history.sort()
+    for previous, current in zip(history, history[1:]):
+        if current.year != previous.year + 1:
+            raise ValueError("History must cover consecutive years, but jumps "
+                             "from {} to {}".format(previous.year, current.year))
+    return history
+
+
+def compounding_rate(history_year, stock_allocation=DEFAULT_STOCK_ALLOCATION):
+    ''' Nominal compounding rate (ex: 1.07) of a portfolio rebalanced yearly '''
+    return (1 + stock_allocation * history_year.stocks
+            + (1 - stock_allocation) * history_year.bonds)
+
+
+def inflation_rate(history_year):
+    ''' Inflation rate in the repo's format (ex: 1.03) '''
+    return 1 + history_year.inflation
@@ -3,7 +3,28 @@
 Compound Annual Growth Rate (CAGR) Calculator with contributions per period
 By: Michael Asnes
 '''
+import math
 import sys
+import time
+from array import array
+
+DEFAULT_RELATIVE_TOLERANCE = 1e-12
+DEFAULT_MAX_ITERATIONS = 100
+# Hard cap on how many times a bracket is doubled (or halved) looking for the
+# rate. InputStreamCagr stops sooner, once doubling the guess would overflow
+# to inf (about 1,020 doublings of 1.05), so every rate a float can hold is
+# tried before giving up.
+MAX_BRACKET_EXPANSIONS = 1100
+
+# Per-account status codes returned by approximate_growth_rates()
+STATUS_CONVERGED = 0
+STATUS_MAX_ITERATIONS = 1
+STATUS_NO_SOLUTION = 2
+STATUS_BAD_INPUT = 3
+
+# A solver_stats.SolverStats recording every solve, or None. See
+# set_solver_stats()
+solver_stats = None
 
 def usage():
     print(
@@ -44,8 +65,14 @@ class InputStreamCagr(object):
             except the first period), the second will compound n-2 times,
             ... until the last one which doesn't compound.
 
-    This is beyond my current mathematical knowledge. However,
-    I can use a variant on binary search to approximate r.
+    There's no closed form for r, but the right hand side is a geometric
+    series, so it can be evaluated (along with its derivative) in constant
+    time:
+        e = s * r^n + c * (r^n - 1) / (r - 1)
+
+    The value is increasing in r, so r can be found with a few steps of
+    Newton's method, falling back to bisection whenever a Newton step would
+    leave the current bracket.
     """
 
     def __init__(self, begginning_value, ending_value,
@@ -59,33 +86,91 @@ class InputStreamCagr(object):
         yearly_contribution_net = self.contribution_per_period * (self.num_periods - 1)
         return yearly_contribution_net + self.begginning_value
 
-    def approximate_growth_rate(self, allowable_error):
+    def approximate_growth_rate(self, allowable_error=0.0,
+                                relative_tolerance=DEFAULT_RELATIVE_TOLERANCE,
+                                max_iterations=DEFAULT_MAX_ITERATIONS):
+        """ Returns the growth rate r (ex: 1.07) that turns the beginning value
+        and contributions into the ending value.
+
+        Stops once the computed ending value is within
+        max(allowable_error, relative_tolerance * ending_value) of the real
+        one (roughly), or the bracket around r is narrower than
+        relative_tolerance * r.
+        Raises ValueError if no positive rate can produce the ending value,
+        and ArithmeticError if the rate can't be bracketed or doesn't
+        converge within max_iterations steps.
+        """
+        if solver_stats is not None:
+            return self._instrumented_growth_rate(
+                solver_stats, allowable_error, relative_tolerance,
+                max_iterations)
+        return self._solve(self._residual_and_derivative, allowable_error,
+                           relative_tolerance, max_iterations)
+
+    def _solve(self, residual_and_derivative, allowable_error,
+               relative_tolerance, max_iterations):
         min_rate, max_rate = self._get_bounds_on_growth_rate(allowable_error)
         assert isinstance(min_rate, float) and isinstance(max_rate, float)
+        if min_rate == max_rate:
+            return min_rate
+
+        tolerance = max(allowable_error / abs(self.ending_value),
+                        relative_tolerance)
+        return newton_bisect(residual_and_derivative, min_rate, max_rate,
+                             tolerance, relative_tolerance, max_iterations)
+
+    def _instrumented_growth_rate(self, stats, allowable_error,
+                                  relative_tolerance, max_iterations):
+        """ approximate_growth_rate, recording the solve in stats """
+        residual_and_derivative = self._residual_and_derivative
+        # [residual evaluations, last residual]
+        progress = [0, float('nan')]
 
-        mid_rate = (max_rate - min_rate) / 2 + min_rate
-        return_at_mid_rate = self._calculate_return_at_rate(mid_rate)
-        while abs(return_at_mid_rate - self.ending_value) > allowable_error:
-            if return_at_mid_rate > self.ending_value:
-                max_rate = mid_rate
-            else:
-                min_rate = mid_rate
-            mid_rate = (max_rate - min_rate) / 2 + min_rate
-            return_at_mid_rate = self._calculate_return_at_rate(mid_rate)
-        approximate_growth_rate = mid_rate
-        return approximate_growth_rate
+        def counted_residual_and_derivative(rate):
+            residual, derivative = residual_and_derivative(rate)
+            progress[0] += 1
+            progress[1] = residual
+            return residual, derivative
 
+        # ValueErrors (no solution at all) aren't recorded
+        started = time.perf_counter()
+        try:
+            rate = self._solve(counted_residual_and_derivative, allowable_error,
+                               relative_tolerance, max_iterations)
+        except ArithmeticError:
+            iterations, residual = progress
+            stats.record(iterations, self.bracket_evaluations + iterations,
+                         self.bracket_expansions, residual,
+                         time.perf_counter() - started, converged=False)
+            raise
+        seconds = time.perf_counter() - started
+        iterations, residual = progress
+        if iterations == 0:   # the bracket was already tight
+            residual = residual_and_derivative(rate)[0]
+        stats.record(iterations, self.bracket_evaluations + iterations,
+                     self.bracket_expansions, residual, seconds)
+        return rate
 
     def _get_bounds_on_growth_rate(self, allowable_error):
-        """ Returns: (min_rate, max_rate) """
-        min_rate = None
-        max_rate = None
+        """ Returns: (min_rate, max_rate)
 
-        if self.ending_value < self.money_contributed():
-            print("Warning, money shrank. The program cannot handle this")
-            return None, 1.00
+        Leaves the number of times the ending value was evaluated, and the
+        number of times the upper bound was doubled, in bracket_evaluations
+        and bracket_expansions.
+        """
+        self._failsafes()
+
+        self.bracket_evaluations = 1
+        self.bracket_expansions = 0
+        return_at_one = self._calculate_return_at_rate(1.00)
+        if abs(return_at_one - self.ending_value) <= allowable_error:
+            return 1.00, 1.00
+        elif return_at_one > self.ending_value:
+            # Money shrank. Any rate between 0 and 1 is fair game.
+            return 0.00, 1.00
 
         guess_rate = 1.05
+        self.bracket_evaluations = 2
         return_at_rate = self._calculate_return_at_rate(guess_rate)
         if abs(return_at_rate - self.ending_value) <= allowable_error:
             min_rate = max_rate = guess_rate
@@ -96,21 +181,314 @@ class InputStreamCagr(object):
             return min_rate, max_rate
         else:   # return_at_rate < self.ending_value
             while return_at_rate <= self.ending_value:
+                next_rate = double_rate(guess_rate)
+                if (not math.isfinite(next_rate)
+                        or self.bracket_expansions >= MAX_BRACKET_EXPANSIONS):
+                    raise ArithmeticError(
+                        "Couldn't find a growth rate high enough to reach the "
+                        "ending value: still short at a rate of {:.6g} after "
+                        "doubling the guess {} times".format(
+                            guess_rate, self.bracket_expansions))
                 min_rate = guess_rate
-                guess_rate = double_rate(guess_rate)
+                guess_rate = next_rate
                 return_at_rate = self._calculate_return_at_rate(guess_rate)
+                self.bracket_evaluations += 1
+                self.bracket_expansions += 1
             max_rate = guess_rate
             return min_rate, max_rate
 
+    def _failsafes(self):
+        if self.num_periods <= 0:
+            raise ValueError("Growth doesn't make sense over 0 periods")
+        if not all(math.isfinite(value) for value in
+                   (self.begginning_value, self.ending_value,
+                    self.contribution_per_period)):
+            raise ValueError("Values and contributions must be finite numbers")
+        if self.begginning_value < 0 or self.contribution_per_period < 0:
+            raise ValueError("Values and contributions must not be negative")
+        if self.begginning_value == 0 and (self.contribution_per_period == 0
+                                           or self.num_periods == 1):
+            raise ValueError("Nothing was invested long enough to grow, so "
+                             "there is no growth rate")
+        # At a rate of 0 (a -100% return) only the last contribution survives
+        if self.ending_value < self.contribution_per_period:
+            raise ValueError("The ending value is less than the last "
+                             "contribution. No growth rate can explain this")
+        if self.ending_value == 0:
+            raise ValueError("Everything was lost. The growth rate is -100%")
+
     def _calculate_return_at_rate(self, rate):
-        compounded_beg_val = self.begginning_value * (rate ** self.num_periods)
+        return annuity_value_and_derivative(self.begginning_value,
+                                            self.contribution_per_period,
+                                            self.num_periods, rate)[0]
+
+    def _residual_and_derivative(self, rate):
+        """ Residual in log space. With hundreds of periods the ending value
+        is close to exponential in r, and Newton's method on log(e) takes
+        nearly full steps where it would crawl on e itself. """
+        log_value, log_derivative = log_annuity_value_and_derivative(
+            self.begginning_value, self.contribution_per_period,
+            self.num_periods, rate)
+        if log_value == -math.inf:
+            # Nothing survives this rate, so it's below any solution
+            return log_value, 0.0
+        return log_value - math.log(self.ending_value), log_derivative
+
+
+def set_solver_stats(stats):
+    """ Records every solve (single or batch) in stats, a
+    solver_stats.SolverStats. None turns recording off. """
+    global solver_stats
+    solver_stats = stats
+
+
+def annuity_value_and_derivative(begginning_value, contribution_per_period,
+                                 num_periods, rate):
+    """ Returns (e, de/dr) for e = s * r^n + sum_{i=0}^{n-1}(c * r^i)
+
+    Uses expm1/log1p so rates very close to 1 don't lose precision. Returns
+    (inf, inf) if the value is too large to represent.
+    """
+    s = begginning_value
+    c = contribution_per_period
+    n = num_periods
+    x = rate - 1.0
+    if rate <= 0.0:
+        # Only the last contribution survives a -100% return
+        derivative = s if n == 1 else (c if n > 1 else 0.0)
+        return (c if n > 0 else s), derivative
+    try:
+        rate_to_n = rate ** n
+        if abs(x) < 1e-12:
+            series = float(n)
+            series_derivative = n * (n - 1) / 2.0
+        else:
+            series = math.expm1(n * _log_rate(rate)) / x
+            # d/dr (r^n - 1) / (r - 1)
+            series_derivative = (n * rate_to_n / rate - series) / x
+    except OverflowError:
+        return float('inf'), float('inf')
+    value = s * rate_to_n + c * series
+    derivative = s * n * rate_to_n / rate + c * series_derivative
+    return value, derivative
+
+
+def _log_rate(rate):
+    """ log(rate) for rate > 0. log1p keeps precision near 1, but far below
+    1 rate - 1 rounds to -1 for tiny rates, so use log there. """
+    x = rate - 1.0
+    return math.log1p(x) if x > -0.5 else math.log(rate)
 
-        contribution_accumulator = self.contribution_per_period
-        for _ in range(self.num_periods - 1):
-            contribution_accumulator *= rate
-            contribution_accumulator += self.contribution_per_period
-        return contribution_accumulator + compounded_beg_val
 
+def log_annuity_value_and_derivative(begginning_value, contribution_per_period,
+                                     num_periods, rate):
+    """ Returns (log(e), d log(e)/dr) for the e of annuity_value_and_derivative
+
+    Works from the logs of the two terms of e when e itself would overflow
+    or underflow, as it does over thousands of periods. log(e) is -inf if
+    e is 0.
+    """
+    value, derivative = annuity_value_and_derivative(
+        begginning_value, contribution_per_period, num_periods, rate)
+    if sys.float_info.min <= value < math.inf or rate <= 0.0:
+        if value <= 0.0:
+            return -math.inf, 0.0
+        return math.log(value), derivative / value
+
+    s = begginning_value
+    c = contribution_per_period
+    n = num_periods
+    x = rate - 1.0
+    # log(s * r^n) and log(sum_{i=0}^{n-1} r^i), with their slopes
+    log_growth = n * _log_rate(rate)
+    if abs(x) < 1e-12:
+        log_series = math.log(n)
+        log_series_derivative = (n - 1) / 2.0
+    elif x > 0:
+        shrink = -math.expm1(-log_growth)
+        log_series = log_growth + math.log(shrink) - math.log(x)
+        log_series_derivative = n / (rate * shrink) - 1 / x
+    else:
+        shrink = -math.expm1(log_growth)
+        log_series = math.log(shrink) - math.log(-x)
+        log_series_derivative = (-n * math.exp(log_growth) / (rate * shrink)
+                                 - 1 / x)
+    terms = []
+    if s > 0:
+        terms.append((math.log(s) + log_growth, n / rate))
+    if c > 0:
+        terms.append((math.log(c) + log_series, log_series_derivative))
+    if not terms:
+        return -math.inf, 0.0
+    # log-sum-exp of the terms, with the slope weighted by each term's share
+    largest = max(log_term for log_term, _ in terms)
+    total = sum(math.exp(log_term - largest) for log_term, _ in terms)
+    log_value = largest + math.log(total)
+    return log_value, sum(math.exp(log_term - log_value) * slope
+                          for log_term, slope in terms)
+
+
+def newton_bisect(residual_and_derivative, min_rate, max_rate, tolerance,
+                  relative_tolerance=DEFAULT_RELATIVE_TOLERANCE,
+                  max_iterations=DEFAULT_MAX_ITERATIONS):
+    """ Safeguarded Newton's method for an increasing function.
+
+    residual_and_derivative(rate) returns (f(rate), f'(rate)). The root must
+    lie in [min_rate, max_rate]. Newton steps that leave the bracket, or don't
+    at least halve the residual, are replaced with a bisection step.
+    """
+    rate = (min_rate + max_rate) / 2
+    residual, derivative = residual_and_derivative(rate)
+    previous_residual = float('inf')
+    for _ in range(max_iterations):
+        next_rate, min_rate, max_rate = _newton_bisect_step(
+            rate, residual, derivative, previous_residual, min_rate, max_rate,
+            tolerance, relative_tolerance)
+        if next_rate is None:
+            return rate
+        previous_residual = residual
+        rate = next_rate
+        residual, derivative = residual_and_derivative(rate)
+    if abs(residual) <= tolerance:
+        return rate
+    raise ArithmeticError("Growth rate did not converge within {} iterations "
+                          "(last tried {!r}, between {!r} and {!r})".format(
+                              max_iterations, rate, min_rate, max_rate))
+
+def _newton_bisect_step(rate, residual, derivative, previous_residual,
+                        min_rate, max_rate, tolerance, relative_tolerance):
+    """ One step of newton_bisect.
+
+    Returns (next_rate, min_rate, max_rate), with next_rate None once rate
+    has converged.
+    """
+    if abs(residual) <= tolerance:
+        return None, min_rate, max_rate
+    if residual > 0:
+        max_rate = rate
+    else:
+        min_rate = rate
+    if max_rate - min_rate <= relative_tolerance * abs(rate):
+        return None, min_rate, max_rate
+
+    newton_ok = derivative > 0 and abs(residual) <= abs(previous_residual) / 2
+    next_rate = rate - residual / derivative if derivative > 0 else rate
+    if not newton_ok or not min_rate < next_rate < max_rate:
+        next_rate = (min_rate + max_rate) / 2
+    return next_rate, min_rate, max_rate
+
+def approximate_growth_rates(begginning_values, ending_values,
+                             contributions_per_period, num_periods,
+                             relative_tolerance=DEFAULT_RELATIVE_TOLERANCE,
+                             max_iterations=DEFAULT_MAX_ITERATIONS):
+    """ Solves InputStreamCagr.approximate_growth_rate for many accounts.
+
+    Takes four equal length sequences. The accounts are solved in passes:
+    each pass takes one safeguarded Newton step for every account that
+    hasn't converged yet, and converged accounts drop out of later passes.
+    Each step is still worked out one account at a time. A row that can't
+    be read (ex: nan or infinite periods, or text) gets STATUS_BAD_INPUT,
+    and one that has no growth rate STATUS_NO_SOLUTION, without stopping
+    the rest.
+
+    Returns (rates, statuses, iterations):
+        rates: array('d') of growth rates, nan where there is no solution
+        statuses: array('b') of STATUS_* codes
+        iterations: array('l') of solver steps taken per account
+    """
+    stats = solver_stats
+    if stats is not None:
+        started = time.perf_counter()
+        # index: (bracket evaluations, bracket expansions)
+        bracket_counts = {}
+    nan = float('nan')
+    rates = array('d')
+    statuses = array('b')
+    iterations = array('l')
+    # Per account solver state for the accounts still being solved
+    active = []
+    residual_functions = {}
+    brackets = {}
+    residuals = {}
+    previous_residuals = {}
+
+    for index, args in enumerate(zip(begginning_values, ending_values,
+                                     contributions_per_period, num_periods)):
+        iterations.append(0)
+        try:
+            isc = InputStreamCagr(*args)
+        except (TypeError, ValueError, OverflowError):
+            rates.append(nan)
+            statuses.append(STATUS_BAD_INPUT)
+            continue
+        try:
+            min_rate, max_rate = isc._get_bounds_on_growth_rate(0.0)
+        except ValueError:
+            rates.append(nan)
+            statuses.append(STATUS_NO_SOLUTION)
+            continue
+        except ArithmeticError:
+            rates.append(nan)
+            statuses.append(STATUS_MAX_ITERATIONS)
+            if stats is not None:
+                bracket_counts[index] = (isc.bracket_evaluations,
+                                         isc.bracket_expansions)
+            continue
+        rate = (min_rate + max_rate) / 2
+        rates.append(rate)
+        statuses.append(STATUS_CONVERGED)
+        if stats is not None:
+            bracket_counts[index] = (isc.bracket_evaluations,
+                                     isc.bracket_expansions)
+            if min_rate == max_rate:
+                residuals[index] = isc._residual_and_derivative(rate)[0]
+        if min_rate == max_rate:
+            continue
+        residual_functions[index] = isc._residual_and_derivative
+        brackets[index] = (min_rate, max_rate)
+        previous_residuals[index] = float('inf')
+        active.append(index)
+
+    for _ in range(max_iterations):
+        if not active:
+            break
+        still_active = []
+        for index in active:
+            rate = rates[index]
+            try:
+                residual, derivative = residual_functions[index](rate)
+            except ValueError:
+                # Only this account fails, the rest keep going
+                rates[index] = nan
+                statuses[index] = STATUS_NO_SOLUTION
+                continue
+            except ArithmeticError:
+                rates[index] = nan
+                statuses[index] = STATUS_MAX_ITERATIONS
+                continue
+            residuals[index] = residual
+            iterations[index] += 1
+            min_rate, max_rate = brackets[index]
+            next_rate, min_rate, max_rate = _newton_bisect_step(
+                rate, residual, derivative, previous_residuals[index],
+                min_rate, max_rate, relative_tolerance, relative_tolerance)
+            if next_rate is None:
+                continue
+            brackets[index] = (min_rate, max_rate)
+            previous_residuals[index] = residual
+            rates[index] = next_rate
+            still_active.append(index)
+        active = still_active
+
+    for index in active:
+        statuses[index] = STATUS_MAX_ITERATIONS
+    if stats is not None and bracket_counts:
+        seconds = (time.perf_counter() - started) / len(bracket_counts)
+        for index, (evaluations, expansions) in bracket_counts.items():
+            stats.record(iterations[index], evaluations + iterations[index],
+                         expansions, residuals.get(index, nan), seconds,
+                         statuses[index] == STATUS_CONVERGED)
+    return rates, statuses, iterations
 
 def double_rate(rate):
     return ((rate - 1.0) * 2) + 1
@@ -122,8 +500,10 @@ def main():
     inflation_rate = 1.03
     inflation_rate_percent = float_to_percent(inflation_rate)
     isc = InputStreamCagr(*process_opts())
-    acceptable_error = abs(isc.ending_value / 1000)
-    approximate_growth_rate = isc.approximate_growth_rate(acceptable_error)
+    try:
+        approximate_growth_rate = isc.approximate_growth_rate()
+    except (ValueError, ArithmeticError) as err:
+        sys.exit(str(err))
     approximate_growth_rate_percent = float_to_percent(approximate_growth_rate)
     print("Money grew at an approximate growth rate of: {:.2f}%"\
           .format(approximate_growth_rate_percent))
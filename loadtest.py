@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+'''
+Load test client for server.py
+By: Michael Asnes
+
+Opens a number of keep-alive connections to a running calculation server,
+sends random requests as fast as the server answers them, and reports
+latency percentiles and throughput.
+'''
+import asyncio
+import getopt
+import json
+import random
+import sys
+import time
+
+import montecarlo
+import server
+
+DEFAULT_CONCURRENCY = 64
+DEFAULT_REQUESTS = 20000
+DEFAULT_MIX = 'cagr,inputstreamcagr,retirement'
+
+
+def usage():
+    print(''' Usage:
+          -h show this help
+          -a server address (defaults to {})
+          -p server port (defaults to {})
+          -c connections sending requests at once (defaults to {})
+          -n total requests to send (defaults to {:,})
+          -m comma separated commands to send (defaults to {})
+          -e random seed
+          '''.format(server.DEFAULT_HOST, server.DEFAULT_PORT,
+                     DEFAULT_CONCURRENCY, DEFAULT_REQUESTS, DEFAULT_MIX))
+
+
+def process_opts():
+    try:
+        opts, _ = getopt.getopt(sys.argv[1:], "a:p:c:n:m:e:h", ["help"])
+    except getopt.GetoptError as err:
+        print(str(err))
+        usage()
+        sys.exit(2)
+    host = server.DEFAULT_HOST
+    port = server.DEFAULT_PORT
+    concurrency = DEFAULT_CONCURRENCY
+    num_requests = DEFAULT_REQUESTS
+    mix = DEFAULT_MIX
+    seed = None
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            usage()
+            sys.exit()
+        elif o == "-a":
+            host = a
+        elif o == "-p":
+            port = int(a)
+        elif o == "-c":
+            concurrency = int(a)
+        elif o == "-n":
+            num_requests = int(a)
+        elif o == "-m":
+            mix = a
+        elif o == "-e":
+            seed = int(a)
+        else:
+            assert False, "unhandled option"
+    commands = mix.split(',')
+    for command in commands:
+        if command not in REQUEST_MAKERS:
+            sys.exit("Can't generate {!r} requests".format(command))
+    return host, port, concurrency, num_requests, commands, seed
+
+
+REQUEST_MAKERS = {
+    'cagr': lambda rng: {
+        'command': 'cagr', 'beginning_value': rng.uniform(1000, 100000),
+        'ending_value': rng.uniform(1000, 400000),
+        'num_periods': rng.randint(1, 40)},
+    'inputstreamcagr': lambda rng: {
+        'command': 'inputstreamcagr', 'beginning_value': rng.uniform(0, 100000),
+        'ending_value': rng.uniform(200000, 2000000),
+        'contribution_per_period': rng.uniform(1000, 20000),
+        'num_periods': rng.randint(10, 480)},
+    'retirement': lambda rng: {
+        'command': 'retirement',
+        'compounding_rate': rng.uniform(1.03, 1.12),
+        'yearly_contribution': rng.randrange(1000, 30000),
+        'years_till_retirement': rng.randint(10, 45)},
+}
+
+
+async def _client(host, port, requests, latencies, statuses):
+    reader, writer = await asyncio.open_connection(host, port)
+    loop = asyncio.get_running_loop()
+    try:
+        for request in requests:
+            body = json.dumps(request).encode()
+            started = loop.time()
+            writer.write('POST /calculate HTTP/1.1\r\nHost: {}\r\n'
+                         'Content-Type: application/json\r\n'
+                         'Content-Length: {}\r\n\r\n'.format(host, len(body))
+                         .encode('latin1') + body)
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                name, _, value = line.decode('latin1').partition(':')
+                if name.strip().lower() == 'content-length':
+                    length = int(value)
+            await reader.readexactly(length)
+            latencies.append(loop.time() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+    finally:
+        writer.close()
+
+
+async def run_load_test(host, port, concurrency, num_requests, commands,
+                        seed=None):
+    ''' Returns a dict of latency percentiles (seconds), throughput
+    (requests / second) and counts of each http status '''
+    rng = random.Random(seed)
+    requests = [REQUEST_MAKERS[rng.choice(commands)](rng)
+                for _ in range(num_requests)]
+    latencies = []
+    statuses = {}
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        _client(host, port, requests[i::concurrency], latencies, statuses)
+        for i in range(min(concurrency, num_requests))))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {'requests': len(latencies),
+            'seconds': elapsed,
+            'throughput': len(latencies) / elapsed if elapsed else float('nan'),
+            'p50': montecarlo.percentile(latencies, 50),
+            'p99': montecarlo.percentile(latencies, 99),
+            'max': latencies[-1] if latencies else float('nan'),
+            'statuses': statuses}
+
+
+def main():
+    host, port, concurrency, num_requests, commands, seed = process_opts()
+    try:
+        report = asyncio.run(run_load_test(host, port, concurrency,
+                                           num_requests, commands, seed))
+    except OSError as err:
+        sys.exit("Couldn't reach the server at {}:{}: {}".format(host, port, err))
+    print("{:,} requests over {} connections in {:.2f}s".format(
+        report['requests'], concurrency, report['seconds']))
+    print("    throughput: {:,.0f} requests/s".format(report['throughput']))
+    print("    latency p50: {:.2f}ms  p99: {:.2f}ms  max: {:.2f}ms".format(
+        report['p50'] * 1000, report['p99'] * 1000, report['max'] * 1000))
+    print("    responses: {}".format(', '.join(
+        '{} x {:,}'.format(status, count)
+        for status, count in sorted(report['statuses'].items()))))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+'''
+Monte Carlo retirement simulator
+By: Michael Asnes
+
+CompoundingCalculator assumes the same net compounding rate every year. Real
+markets don't work that way. This module simulates many possible paths of
+yearly compounding and inflation rates for the same plan, and reports
+percentiles of the ending funds, along with how often they reach a target
+when one is given.
+
+Paths are simulated a year at a time: each year draws a rate for every path
+of the chunk and updates every balance with array-wide map()s, instead of
+walking each path through its years.
+'''
+import bisect
+import collections
+import concurrent.futures
+import itertools
+import math
+import operator
+import random
+from array import array
+
+import history
+
+DISTRIBUTIONS = ('normal', 'lognormal', 'bootstrap')
+DEFAULT_DISTRIBUTION = 'normal'
+DEFAULT_RETURN_VOLATILITY = 0.15
+DEFAULT_INFLATION_VOLATILITY = 0.01
+DEFAULT_CHUNK_SIZE = 10000
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+
+MonteCarloResult = collections.namedtuple(
+    'MonteCarloResult',
+    ['paths', 'seed', 'target_funds', 'success_probability', 'percentiles'])
+
+
+class MonteCarloSimulator(object):
+    ''' Simulates a retirement plan (a DataHolder) over many random paths.
+
+    Each path draws a compounding rate and an inflation rate for every year
+    until retirement. Paths are simulated in chunks of chunk_size, so memory
+    use stays flat however many paths are asked for, and chunks can be
+    spread across a process pool with workers > 1. Every chunk gets its own
+    random generator derived from the seed, so results are the same for a
+    given seed no matter how many workers are used.
+
+    A path succeeds if it retires with at least target_funds, the funds the
+    plan actually needs. Without a target there is nothing to succeed at
+    (money isn't withdrawn before retirement, so no path runs out), and
+    success_probability is None.
+    '''
+    def __init__(self, dataHolder, paths, seed=None,
+                 distribution=DEFAULT_DISTRIBUTION,
+                 return_volatility=DEFAULT_RETURN_VOLATILITY,
+                 inflation_volatility=DEFAULT_INFLATION_VOLATILITY,
+                 history_years=None,
+                 stock_allocation=history.DEFAULT_STOCK_ALLOCATION,
+                 target_funds=None, workers=1, chunk_size=DEFAULT_CHUNK_SIZE):
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError("Unknown distribution {!r}, expected one of {}"
+                             .format(distribution, ', '.join(DISTRIBUTIONS)))
+        if distribution == 'bootstrap' and not history_years:
+            raise ValueError("The bootstrap distribution needs history to "
+                             "sample from")
+        self.dataHolder = dataHolder
+        self.paths = int(paths)
+        self.seed = seed if seed is not None else random.randrange(2 ** 32)
+        self.distribution = distribution
+        self.return_volatility = return_volatility
+        self.inflation_volatility = inflation_volatility
+        self.history_years = history_years
+        self.stock_allocation = stock_allocation
+        self.target_funds = target_funds
+        self.workers = workers
+        self.chunk_size = chunk_size
+
+    def run(self, percentiles=DEFAULT_PERCENTILES):
+        ''' Returns a MonteCarloResult '''
+        target_funds = self.target_funds
+        ending_funds = array('d')
+        for chunk_funds in self._map_chunks():
+            ending_funds.extend(chunk_funds)
+        ending_funds = sorted(ending_funds)
+
+        if target_funds is None:
+            success_probability = None
+        elif ending_funds:
+            successes = len(ending_funds) - bisect.bisect_left(ending_funds,
+                                                               target_funds)
+            success_probability = successes / len(ending_funds)
+        else:
+            success_probability = float('nan')
+        return MonteCarloResult(
+            self.paths, self.seed, target_funds, success_probability,
+            collections.OrderedDict((p, percentile(ending_funds, p))
+                                    for p in percentiles))
+
+    def _map_chunks(self):
+        chunks = [(self._plan(), self._sampler_settings(), self.seed, index,
+                   min(self.chunk_size, self.paths - start))
+                  for index, start in enumerate(range(0, self.paths,
+                                                      self.chunk_size))]
+        if self.workers <= 1 or len(chunks) <= 1:
+            return map(simulate_chunk, chunks)
+        executor = concurrent.futures.ProcessPoolExecutor(self.workers)
+        return _shutdown_after(executor, executor.map(simulate_chunk, chunks))
+
+    def _plan(self):
+        dh = self.dataHolder
+        return (float(dh.starting_contribution), float(dh.yearly_contribution),
+                dh.years_of_contribution, dh.years_till_retirement)
+
+    def _sampler_settings(self):
+        dh = self.dataHolder
+        if self.distribution == 'bootstrap':
+            rates = [(history.compounding_rate(year, self.stock_allocation),
+                      history.inflation_rate(year))
+                     for year in self.history_years]
+        else:
+            rates = None
+        return (self.distribution, dh.compounding_rate, self.return_volatility,
+                dh.inflation_rate, self.inflation_volatility, rates)
+
+
+def simulate_chunk(chunk):
+    ''' Simulates one chunk of paths. Returns array('d') of ending funds.
+
+    Lives at module level so it can be sent to a process pool.
+    '''
+    plan, sampler_settings, seed, chunk_index, num_paths = chunk
+    starting_contribution, yearly_contribution, years_of_contribution, \
+        years_till_retirement = plan
+    rng = random.Random('{}:{}'.format(seed, chunk_index))
+    draw_net_rates = _net_rates_sampler(rng, *sampler_settings)
+
+    contribution_years = max(min(years_of_contribution,
+                                 years_till_retirement), 0)
+    funds = array('d', [starting_contribution]) * num_paths
+    for year in range(max(years_till_retirement, 0)):
+        grown = map(operator.mul, funds, draw_net_rates(num_paths))
+        if year < contribution_years:
+            grown = map(yearly_contribution.__add__, grown)
+        funds = array('d', grown)
+    return funds
+
+
+def _net_rate_sampler(rng, distribution, compounding_rate, return_volatility,
+                      inflation_rate, inflation_volatility, rates):
+    ''' Returns a function drawing one year's net compounding rate.
+
+    Like DataHolder, the net rate is compounding - inflation + 1, which keeps
+    every balance in today's currency.
+    '''
+    if distribution == 'bootstrap':
+        choice = rng.choice
+        def draw_net_rate():
+            compounding, inflation = choice(rates)
+            return compounding - inflation + 1
+    elif distribution == 'lognormal':
+        return_mu, return_sigma = _lognormal_parameters(compounding_rate,
+                                                        return_volatility)
+        inflation_mu, inflation_sigma = _lognormal_parameters(inflation_rate,
+                                                              inflation_volatility)
+        lognormvariate = rng.lognormvariate
+        def draw_net_rate():
+            return (lognormvariate(return_mu, return_sigma)
+                    - lognormvariate(inflation_mu, inflation_sigma) + 1)
+    else:
+        gauss = rng.gauss
+        def draw_net_rate():
+            return (gauss(compounding_rate, return_volatility)
+                    - gauss(inflation_rate, inflation_volatility) + 1)
+    return draw_net_rate
+
+
+def _net_rates_sampler(rng, distribution, compounding_rate, return_volatility,
+                       inflation_rate, inflation_volatility, rates):
+    ''' Like _net_rate_sampler(), but the function returned takes a count and
+    draws that many net compounding rates at once, as a list '''
+    if distribution == 'bootstrap':
+        net_rates = [compounding - inflation + 1
+                     for compounding, inflation in rates]
+        choices = rng.choices
+        def draw_net_rates(count):
+            return choices(net_rates, k=count)
+        return draw_net_rates
+    repeat = itertools.repeat
+    if distribution == 'lognormal':
+        return_mu, return_sigma = _lognormal_parameters(compounding_rate,
+                                                        return_volatility)
+        inflation_mu, inflation_sigma = _lognormal_parameters(inflation_rate,
+                                                              inflation_volatility)
+        lognormvariate = rng.lognormvariate
+        def draw_net_rates(count):
+            compounding = map(lognormvariate, repeat(return_mu, count),
+                              repeat(return_sigma, count))
+            inflation = map(lognormvariate, repeat(inflation_mu, count),
+                            repeat(inflation_sigma, count))
+            return [c - i + 1 for c, i in zip(compounding, inflation)]
+        return draw_net_rates
+    # The difference of two independent normals is itself normal, so one
+    # draw per rate is enough
+    mean = compounding_rate - inflation_rate + 1
+    stdev = math.hypot(return_volatility, inflation_volatility)
+    gauss = rng.gauss
+    def draw_net_rates(count):
+        return list(map(gauss, repeat(mean, count), repeat(stdev, count)))
+    return draw_net_rates
+
+
+def _lognormal_parameters(mean, stdev):
+    ''' mu and sigma of a lognormal with the given mean and stdev '''
+    sigma_squared = math.log(1 + (stdev / mean) ** 2)
+    return math.log(mean) - sigma_squared / 2, math.sqrt(sigma_squared)
+
+
+def _shutdown_after(executor, results):
+    with executor:
+        for result in results:
+            yield result
+
+
+def percentile(sorted_values, pct):
+    ''' Linearly interpolated percentile (0-100) of an already sorted list '''
+    if not sorted_values:
+        return float('nan')
+    position = (len(sorted_values) - 1) * pct / 100
+    lower = int(math.floor(position))
+    upper = min(lower + 1, len(sorted_values) - 1)
+    fraction = position - lower
+    return sorted_values[lower] * (1 - fraction) + sorted_values[upper] * fraction
@@ -10,6 +10,10 @@ def usage():
     sys.exit("""Usage:
 \tpython net_increase.py <Rate of Increase> <Periods>""")
 
+def net_increase(rate, periods):
+    ''' How many times something grows compounding at rate (ex: 1.07) '''
+    return math.pow(rate, periods)
+
 def main():
     try:
         if '%' in sys.argv[1]:
@@ -19,7 +23,7 @@ def main():
         periods = float(sys.argv[2])
     except IndexError:
         usage()
-    print("Increased {:.3f} times".format(math.pow(rate, periods)))
+    print("Increased {:.3f} times".format(net_increase(rate, periods)))
 
 if __name__ == '__main__':
     main()
@@ -3,14 +3,33 @@
 Calculate number of periods required to grow a certain amount at a certain rate
 By: Michael Asnes
 '''
+import itertools
 import sys
 import math
+from array import array
+
+# Per-element status codes returned by periods_batch()
+STATUS_OK = 0
+STATUS_ZERO_RATE = 1
+STATUS_NEGATIVE_RATE = 2
+STATUS_UNREACHABLE = 3
+STATUS_NOT_FINITE = 4
+STATUS_NEGATIVE_CONTRIBUTION = 5
+
+FAILSAFE_MESSAGES = {
+    STATUS_ZERO_RATE: "Infinite periods are required with a zero rate of change",
+    STATUS_NEGATIVE_RATE: "The rate of change must be positive (ex: 1.07)",
+    STATUS_UNREACHABLE: "The ending value is never reached at this rate",
+    STATUS_NOT_FINITE: "Values, contributions and rates must be finite numbers",
+    STATUS_NEGATIVE_CONTRIBUTION: "Contributions must not be negative",
+}
 
 def usage():
     print(
         '''Usage:
 \t-h show this help
-\t<Beginning Value>, <Ending Value>, <Rate of Change>'''
+\t<Beginning Value>, <Ending Value>, <Rate of Change>,
+\t[Contribution per period]'''
     )
 
 def process_opts():
@@ -26,16 +45,38 @@ def process_opts():
             rate_of_change = sys.argv[3]
     except IndexError:
         sys.exit(usage())
-    return beginning_value, ending_value, rate_of_change
+    contribution_per_period = sys.argv[4] if len(sys.argv) > 4 else 0
+    return beginning_value, ending_value, rate_of_change, contribution_per_period
 
 class PeriodsForGrowthCalc(object):
-    def __init__(self, beginning_value, ending_value, rate_of_change):
+    """ Periods for a beginning value to grow into an ending value, with an
+    optional contribution at the end of every period.
+
+    With contributions, the ending value is the same geometric series
+    InputStreamCagr solves (r = rate of change, s = beginning value,
+    c = contribution, n = periods):
+        e = s * r^n + c * (r^n - 1) / (r - 1)
+    so r^n * (s * (r - 1) + c) = e * (r - 1) + c, and
+        n = log((e * (r - 1) + c) / (s * (r - 1) + c)) / log(r)
+    which is the formula below when c is 0.
+
+    n is negative when the ending value was only passed going back in time.
+    If the ending value is at or below the beginning value, that means it's
+    already reached, and it takes 0 periods (ex: a growing balance that
+    starts above the target). Otherwise it's never reached. A balance that
+    shrinks toward a lower ending value (a rate below 1, with too little
+    added to keep up) gets a positive n: the periods it takes to fall there.
+    """
+    def __init__(self, beginning_value, ending_value, rate_of_change,
+                 contribution_per_period=0):
         self.beginning_value = float(beginning_value)
         self.ending_value = float(ending_value)
         self.rate_of_change = float(rate_of_change)
+        self.contribution_per_period = float(contribution_per_period)
 
     def get_parameters(self):
-        return self.beginning_value, self.ending_value, self.rate_of_change
+        return (self.beginning_value, self.ending_value, self.rate_of_change,
+                self.contribution_per_period)
 
     # rate of change = (ending value / beginning value) ^ (1 / periods)
     # 1 / periods = log(rate of change) / log(ending_value / beginning_value)
@@ -43,13 +84,104 @@ class PeriodsForGrowthCalc(object):
     # log(ending value / beginning value) / log(rate of change) = periods
     # periods = log(ending value / beginning value) / log(rate of change)
     def periods(self):
+        """ Raises ValueError if the ending value can't be reached """
         self._failsafes()
-        print("beginning: {}, ending: {}, rate of change: {}".format(self.beginning_value, self.ending_value, self.rate_of_change))
-        return math.log(self.ending_value / self.beginning_value) / math.log(self.rate_of_change)
+        return periods_for_growth(*self.get_parameters())
 
     def _failsafes(self):
-        if self.rate_of_change == 0 and self.beginning_value != self.ending_value:
-            sys.exit("Infinite periods are required with a zero rate of change")
+        status = periods_status(*self.get_parameters())
+        if status != STATUS_OK:
+            raise ValueError(FAILSAFE_MESSAGES[status])
+
+def periods_status(beginning_value, ending_value, rate_of_change,
+                   contribution_per_period=0):
+    """ Returns the STATUS_* code describing whether the periods can be
+    computed """
+    s = beginning_value
+    e = ending_value
+    c = contribution_per_period
+    if not all(math.isfinite(value) for value in (s, e, rate_of_change, c)):
+        return STATUS_NOT_FINITE
+    if rate_of_change == 0:
+        return STATUS_ZERO_RATE
+    if rate_of_change < 0:
+        return STATUS_NEGATIVE_RATE
+    if c < 0:
+        return STATUS_NEGATIVE_CONTRIBUTION
+    x = rate_of_change - 1
+    if x == 0:
+        if c == 0 and e != s:
+            return STATUS_UNREACHABLE
+    else:
+        denominator = s * x + c
+        if denominator == 0 or (e * x + c) / denominator <= 0:
+            return STATUS_UNREACHABLE
+    if e > s and _periods(s, e, rate_of_change, c) < 0:
+        return STATUS_UNREACHABLE
+    return STATUS_OK
+
+def periods_for_growth(beginning_value, ending_value, rate_of_change,
+                       contribution_per_period=0):
+    """ Periods to grow beginning_value into ending_value (see
+    PeriodsForGrowthCalc). The inputs must pass periods_status(). """
+    return max(_periods(beginning_value, ending_value, rate_of_change,
+                        contribution_per_period), 0.0)
+
+def _periods(beginning_value, ending_value, rate_of_change,
+             contribution_per_period):
+    """ The n solving the formula, which may be negative """
+    s = beginning_value
+    c = contribution_per_period
+    x = rate_of_change - 1
+    if x == 0:
+        return (ending_value - s) / c if c else 0.0
+    # log1p keeps precision for rates very close to 1
+    return math.log1p((ending_value - s) * x / (s * x + c)) / math.log1p(x)
+
+def periods_batch(beginning_values, ending_values, rates_of_change,
+                  contributions_per_period=None):
+    """ Computes the periods for many accounts in a single pass.
+
+    Takes equal length sequences (leave out contributions_per_period for
+    lump sums) and returns (periods, statuses):
+        periods: array('d') of periods, nan where they can't be computed
+        statuses: array('b') of STATUS_* codes, one per account
+
+    Bad rows are flagged in statuses instead of raising, so one bad
+    account doesn't stop the rest of the batch.
+    """
+    if contributions_per_period is None:
+        contributions_per_period = itertools.repeat(0.0)
+    periods = array('d')
+    statuses = array('b')
+    append_periods = periods.append
+    append_status = statuses.append
+    log1p = math.log1p
+    isfinite = math.isfinite
+    nan = float('nan')
+    for s, e, r, c in zip(beginning_values, ending_values, rates_of_change,
+                          contributions_per_period):
+        s = float(s)
+        e = float(e)
+        r = float(r)
+        c = float(c)
+        x = r - 1
+        # The common case inline, everything else through periods_status()
+        if x != 0 and r > 0 and c >= 0 and isfinite(s + e + c):
+            denominator = s * x + c
+            if denominator:
+                growth = (e - s) * x / denominator
+                if growth > -1:
+                    n = log1p(growth) / log1p(x)
+                    if n >= 0:
+                        append_periods(n)
+                        append_status(STATUS_OK)
+                        continue
+        status = periods_status(s, e, r, c)
+        append_periods(periods_for_growth(s, e, r, c) if status == STATUS_OK
+                       else nan)
+        append_status(status)
+    return periods, statuses
 
 # source:
 # http://stackoverflow.com/questions/4028889/floating-point-equality-in-python
@@ -59,10 +191,16 @@ def approx_equal(a, b, tol=0.000001):
 
 def main():
     periods_for_growth_calc = PeriodsForGrowthCalc(*process_opts())
-    periods = periods_for_growth_calc.periods()
+    try:
+        periods = periods_for_growth_calc.periods()
+    except ValueError as err:
+        sys.exit(str(err))
     print(("You've given a beginning value of {1}, an ending value of {2}, "
            "and a rate of change of {3}.\nIt took {0:.2f} periods to grow "
            "your investment this much").format(periods, *periods_for_growth_calc.get_parameters()))
+    if periods_for_growth_calc.contribution_per_period:
+        print("That's with {:,.2f} added at the end of every period".format(
+            periods_for_growth_calc.contribution_per_period))
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+'''
+Multi-account portfolio projections
+By: Michael Asnes
+
+Projects every account of many households to retirement at once. A household
+usually has a mix of:
+    taxable       growth is taxed every year (tax drag)
+    tax_deferred  contributions are capped, and withdrawals are taxed
+    tax_free      contributions are capped, and nothing is taxed after that
+
+Accounts are kept as a struct of arrays, one array per field with an entry
+per account. Every account gets retirement.py's closed form, after the
+contributions are capped and the growth is reduced by the tax drag. Accounts
+with the same net rate and years share one evaluation of the growth factors,
+so there is no loop over years. All amounts are in today's currency.
+'''
+import collections
+import csv
+import getopt
+import math
+import sys
+from array import array
+
+import retirement
+
+ACCOUNT_TYPES = ('taxable', 'tax_deferred', 'tax_free')
+
+# Yearly contribution limits, in today's currency
+DEFAULT_CONTRIBUTION_LIMITS = {'taxable': math.inf, 'tax_deferred': 23000,
+                               'tax_free': 7000}
+# Share of each year's (nominal) growth paid in taxes
+DEFAULT_TAX_DRAG = {'taxable': 0.15, 'tax_deferred': 0.0, 'tax_free': 0.0}
+# Share of the funds paid in taxes when they're withdrawn
+DEFAULT_WITHDRAWAL_TAX = {'taxable': 0.0, 'tax_deferred': 0.22,
+                          'tax_free': 0.0}
+
+# Array typecode of every per account field
+FIELDS = collections.OrderedDict([
+    ('household', 'l'),
+    ('account_type', 'b'),
+    ('starting_balance', 'd'),
+    ('yearly_contribution', 'd'),
+    ('years_of_contribution', 'l'),
+    ('years_till_retirement', 'l'),
+    ('compounding_rate', 'd'),
+    ('inflation_rate', 'd'),
+    ('contribution_limit', 'd'),
+    ('tax_drag', 'd'),
+    ('withdrawal_tax', 'd'),
+])
+RATE_FIELDS = ('compounding_rate', 'inflation_rate')
+
+PortfolioProjection = collections.namedtuple(
+    'PortfolioProjection',
+    ['account_funds', 'account_after_tax', 'account_contributed',
+     'household_funds', 'household_after_tax', 'household_withdraw_per_year'])
+PortfolioProjection.__doc__ = ''' Result of project(). The account_ arrays
+have a value per account, and the household_ arrays a value per household,
+in the order of Portfolio.households. '''
+
+
+def usage():
+    print(''' Usage: portfolio.py [options] <accounts.csv>
+          -h show this help
+          -w safe withdraw rate (defaults to {}) (float <= 1.00 or 'x%')
+
+          accounts.csv has a row per account, with a household and an
+          account_type ({}) column. These columns are optional:
+          {}
+          Rates may be given as 'x%'. Missing values use retirement.py's
+          defaults, or the account type's defaults for the contribution
+          limit and taxes.
+
+          Prints a csv row per household with its funds at retirement,
+          what's left of them after taxes and what it can withdraw per year.
+          '''.format(retirement.SAFE_WITHDRAW_RATE, ', '.join(ACCOUNT_TYPES),
+                     ', '.join(list(FIELDS)[2:])))
+
+
+def process_opts():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'hw:')
+    except getopt.GetoptError as err:
+        print(err)
+        usage()
+        sys.exit(2)
+    safe_withdraw_rate = retirement.SAFE_WITHDRAW_RATE
+    for opt, arg in opts:
+        if opt == '-h':
+            usage()
+            sys.exit()
+        elif opt == '-w':
+            if '%' in arg:
+                safe_withdraw_rate = float(arg.replace('%', '')) / 100
+            else:
+                safe_withdraw_rate = float(arg)
+    if len(args) != 1:
+        usage()
+        sys.exit(2)
+    return args[0], safe_withdraw_rate
+
+
+class Portfolio(object):
+    ''' Every account of a set of households, as a struct of arrays.
+
+    Each field of FIELDS is an attribute holding an array with a value per
+    account. household is an index into households, the list of household
+    labels, and account_type an index into ACCOUNT_TYPES.
+    '''
+    def __init__(self):
+        self.households = []
+        self._household_indexes = {}
+        for field, typecode in FIELDS.items():
+            setattr(self, field, array(typecode))
+
+    def __len__(self):
+        return len(self.household)
+
+    def add_account(self, household, account_type,
+                    starting_balance=retirement.DEFAULT_STARTING_CONTRIBUTION,
+                    yearly_contribution=retirement.DEFAULT_YEARLY_CONTRIBUTION,
+                    years_of_contribution=retirement.DEFAULT_YEARS_OF_CONTRIBUTION,
+                    years_till_retirement=retirement.DEFAULT_YEARS_TILL_RETIREMENT,
+                    compounding_rate=retirement.DEFAULT_COMPOUNDING_RATE,
+                    inflation_rate=retirement.DEFAULT_INFLATION_RATE,
+                    contribution_limit=None, tax_drag=None,
+                    withdrawal_tax=None):
+        ''' Adds an account for household (any hashable label). The limit
+        and taxes default to the account type's. '''
+        if account_type not in ACCOUNT_TYPES:
+            raise ValueError("Unknown account type {!r}, expected one of {}"
+                             .format(account_type, ', '.join(ACCOUNT_TYPES)))
+        if contribution_limit is None:
+            contribution_limit = DEFAULT_CONTRIBUTION_LIMITS[account_type]
+        if tax_drag is None:
+            tax_drag = DEFAULT_TAX_DRAG[account_type]
+        if withdrawal_tax is None:
+            withdrawal_tax = DEFAULT_WITHDRAWAL_TAX[account_type]
+        if contribution_limit < 0:
+            raise ValueError("Contribution limit must not be negative")
+        for name, value in (('Tax drag', tax_drag),
+                            ('Withdrawal tax', withdrawal_tax)):
+            if not 0 <= value <= 1:
+                raise ValueError("{} must be between 0 and 1".format(name))
+        index = self._household_indexes.get(household)
+        if index is None:
+            index = self._household_indexes[household] = len(self.households)
+            self.households.append(household)
+        self.household.append(index)
+        self.account_type.append(ACCOUNT_TYPES.index(account_type))
+        self.starting_balance.append(starting_balance)
+        self.yearly_contribution.append(yearly_contribution)
+        self.years_of_contribution.append(years_of_contribution)
+        self.years_till_retirement.append(years_till_retirement)
+        self.compounding_rate.append(compounding_rate)
+        self.inflation_rate.append(inflation_rate)
+        self.contribution_limit.append(contribution_limit)
+        self.tax_drag.append(tax_drag)
+        self.withdrawal_tax.append(withdrawal_tax)
+
+
+def read_accounts(input_file):
+    ''' A Portfolio from a csv file with a row per account (see usage()) '''
+    portfolio = Portfolio()
+    reader = csv.DictReader(input_file)
+    for line_num, row in enumerate(reader, start=2):
+        values = {}
+        for field, value in row.items():
+            if field not in FIELDS:
+                raise ValueError("Line {}: unknown column {!r}".format(
+                    line_num, field))
+            value = (value or '').strip()
+            if not value or field in ('household', 'account_type'):
+                continue
+            try:
+                if field in RATE_FIELDS and '%' in value:
+                    values[field] = float(value.replace('%', '')) / 100 + 1
+                elif FIELDS[field] == 'l':
+                    values[field] = int(value)
+                else:
+                    values[field] = float(value)
+            except ValueError:
+                raise ValueError("Line {}: {} must be a number, got {!r}"
+                                 .format(line_num, field, value))
+        try:
+            portfolio.add_account(row.get('household'),
+                                  (row.get('account_type') or '').strip(),
+                                  **values)
+        except ValueError as err:
+            raise ValueError("Line {}: {}".format(line_num, err))
+    return portfolio
+
+
+def after_tax_growth_rates(portfolio):
+    ''' The net compounding rate of every account once the tax drag is taken
+    out of its nominal growth, as an array('d') '''
+    return array('d', [1 + (compounding_rate - 1) * (1 - tax_drag)
+                       - (inflation_rate - 1)
+                       for compounding_rate, inflation_rate, tax_drag
+                       in zip(portfolio.compounding_rate,
+                              portfolio.inflation_rate, portfolio.tax_drag)])
+
+
+def project(portfolio, safe_withdraw_rate=retirement.SAFE_WITHDRAW_RATE):
+    ''' Projects every account to its retirement. Returns a
+    PortfolioProjection.
+
+    Contributions above an account's limit are dropped, and contributions
+    stop at retirement. Accounts sharing a net rate and years share one
+    evaluation of retirement.growth_factors().
+    '''
+    factors_by_key = {}
+    account_funds = array('d')
+    account_contributed = array('d')
+    for rate, s, c, limit, n, t in zip(
+            after_tax_growth_rates(portfolio), portfolio.starting_balance,
+            portfolio.yearly_contribution, portfolio.contribution_limit,
+            portfolio.years_of_contribution,
+            portfolio.years_till_retirement):
+        key = (rate, n, t)
+        factors = factors_by_key.get(key)
+        if factors is None:
+            factors = factors_by_key[key] = retirement.growth_factors(*key)
+        growth, annuity = factors
+        c = min(c, limit)
+        account_funds.append(s * growth + c * annuity)
+        account_contributed.append(s + c * min(max(n, 0), max(t, 0)))
+    account_after_tax = array('d', [
+        funds * (1 - tax) for funds, tax
+        in zip(account_funds, portfolio.withdrawal_tax)])
+    household_funds = array('d', bytes(8 * len(portfolio.households)))
+    household_after_tax = array('d', household_funds)
+    for household, funds, after_tax in zip(portfolio.household, account_funds,
+                                           account_after_tax):
+        household_funds[household] += funds
+        household_after_tax[household] += after_tax
+    return PortfolioProjection(
+        account_funds, account_after_tax, account_contributed,
+        household_funds, household_after_tax,
+        array('d', [after_tax * safe_withdraw_rate
+                    for after_tax in household_after_tax]))
+
+
+def main():
+    input_path, safe_withdraw_rate = process_opts()
+    try:
+        with open(input_path, newline='') as input_file:
+            portfolio = read_accounts(input_file)
+    except (OSError, ValueError) as err:
+        sys.exit(str(err))
+    projection = project(portfolio, safe_withdraw_rate)
+    writer = csv.writer(sys.stdout)
+    writer.writerow(['household', 'retirement_funds', 'after_tax',
+                     'withdraw_per_year'])
+    for row in zip(portfolio.households, projection.household_funds,
+                   projection.household_after_tax,
+                   projection.household_withdraw_per_year):
+        writer.writerow(['{:.2f}'.format(value) if isinstance(value, float)
+                         else value for value in row])
+
+
+if __name__ == '__main__':
+    main()
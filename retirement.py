@@ -3,8 +3,15 @@
 Retirement calculator
 By: Michael Asnes
 '''
+import collections
 import getopt
+import itertools
+import math
+import operator
 import sys
+from array import array
+
+import history
 
 DEFAULT_INFLATION_RATE = 1.03
 DEFAULT_COMPOUNDING_RATE = 1.095
@@ -18,6 +25,12 @@ DEFAULT_SHOW_MULTIPLIERS = False
 DEFAULT_NUM_MULTIPLIERS = 3
 DEFAULT_WITHDRAW_RATE = 0.04
 SAFE_WITHDRAW_RATE = 0.04
+DEFAULT_SUCCESS_RATE = 0.99
+DEFAULT_STOCK_ALLOCATION = history.DEFAULT_STOCK_ALLOCATION
+
+# Net compounding rates closer to 1 than this sum the annuity's series
+# term by term when taking its derivatives
+SERIES_LOOP_THRESHOLD = 1e-4
 
 
 def usage():
@@ -33,14 +46,36 @@ def usage():
           -r years of retirement (defaults to {})
           -m show how much your investments multiply over each of
              [num] periods of time over your investment (off by default)
+          --sensitivities show how much your retirement funds change with
+             each input
+
+          Historical safe withdrawal rates (see safe_withdrawal.py):
+          --withdraw-index=<file> look up the safe withdrawal rate in an index
+             built from historical returns instead of the builtin table
+          --success-rate=<fraction> share of historical retirements that must
+             survive (defaults to {}) (float <= 1.00 or 'x%')
+          --stock-allocation=<fraction> share of stocks in the portfolio
+             (defaults to {}) (float <= 1.00 or 'x%')
+
+          Monte Carlo mode:
+          --monte-carlo=<paths> simulate [paths] random market paths
+          --distribution=<name> normal, lognormal or bootstrap (defaults to normal)
+          --volatility=<stdev> yearly stdev of the compounding rate (defaults to 0.15)
+          --inflation-volatility=<stdev> yearly stdev of inflation (defaults to 0.01)
+          --history=<csv> year,stocks,bonds,inflation file to bootstrap from
+          --seed=<int> random seed, for reproducible runs
+          --workers=<num> processes to spread the paths across (defaults to 1)
+          --target=<funds> also report how many paths retire with at least
+             this much (today's currency)
           '''.format(DEFAULT_STARTING_CONTRIBUTION, DEFAULT_INFLATION_RATE,
                      DEFAULT_COMPOUNDING_RATE, DEFAULT_YEARLY_CONTRIBUTION,
                      DEFAULT_YEARS_OF_CONTRIBUTION,
                      DEFAULT_YEARS_TILL_RETIREMENT,
-                     DEFAULT_YEARS_OF_RETIREMENT))
+                     DEFAULT_YEARS_OF_RETIREMENT, DEFAULT_SUCCESS_RATE,
+                     DEFAULT_STOCK_ALLOCATION))
 
 
-def process_opts():
+def process_opts(argv=None):
     def treat_potential_percent(arg, set_to_one=True):
         if '%' in arg:
             arg = arg.replace('%', '')
@@ -52,7 +87,13 @@ def process_opts():
             return float(arg)
 
     try:
-        opts, _ = getopt.getopt(sys.argv[1:], "s:i:c:w:n:t:r:m:ho:v", ["help"])
+        opts, _ = getopt.getopt(sys.argv[1:] if argv is None else argv,
+                                "s:i:c:w:n:t:r:m:ho:v",
+                                ["help", "monte-carlo=", "distribution=",
+                                 "volatility=", "inflation-volatility=",
+                                 "history=", "stock-allocation=", "seed=",
+                                 "workers=", "target=", "withdraw-index=",
+                                 "success-rate=", "sensitivities"])
     except getopt.GetoptError as err:
         # print help information and exit:
         print(str(err)) # will print something like "option -a not recognized"
@@ -67,7 +108,12 @@ def process_opts():
     years_of_retirement = DEFAULT_YEARS_OF_RETIREMENT
     show_multipliers = DEFAULT_SHOW_MULTIPLIERS
     num_multipliers = 0
+    show_sensitivities = False
     withdraw_rate = DEFAULT_WITHDRAW_RATE
+    withdraw_index = None
+    success_rate = DEFAULT_SUCCESS_RATE
+    stock_allocation = DEFAULT_STOCK_ALLOCATION
+    monte_carlo_options = {}
     for o, a in opts:
         if o in ("-h", "--help"):
             usage()
@@ -89,16 +135,116 @@ def process_opts():
         elif o == "-m":
             show_multipliers = True
             num_multipliers = int(a)
+        elif o == "--sensitivities":
+            show_sensitivities = True
+        elif o == "--withdraw-index":
+            withdraw_index = a
+        elif o == "--success-rate":
+            success_rate = treat_potential_percent(a, set_to_one=False)
+        elif o == "--stock-allocation":
+            stock_allocation = treat_potential_percent(a, set_to_one=False)
+        elif o.startswith("--"):
+            monte_carlo_options[o[2:].replace('-', '_')] = a
         else:
             assert False, "unhandled option"
+    if monte_carlo_options and 'monte_carlo' not in monte_carlo_options:
+        # They'd be silently ignored otherwise
+        print("--{} only applies with --monte-carlo".format(
+            ', --'.join(sorted(name.replace('_', '-')
+                               for name in monte_carlo_options))))
+        usage()
+        sys.exit(2)
 
     return (starting_contribution, inflation_rate, compounding_rate,
             yearly_contribution, years_of_contribution, years_till_retirement,
             years_of_retirement, show_multipliers, num_multipliers,
-            withdraw_rate)
+            show_sensitivities, withdraw_rate, withdraw_index, success_rate,
+            stock_allocation,
+            monte_carlo_options if 'monte_carlo' in monte_carlo_options else None)
+
+PARAMETER_FIELDS = ('starting_contribution', 'inflation_rate',
+                    'compounding_rate', 'yearly_contribution',
+                    'years_of_contribution', 'years_till_retirement',
+                    'years_of_retirement')
+
+# Retirement funds with the partial derivative of the funds with respect to
+# each of the plan's inputs, under the input's name
+FundsSensitivities = collections.namedtuple(
+    'FundsSensitivities', ('retirement_funds',) + PARAMETER_FIELDS)
+
+# One year of a plan's projection. balance is in today's currency and
+# nominal_balance in the currency of that year, contributed is the money put
+# in so far and growth is what the market added on top of it
+LedgerRow = collections.namedtuple(
+    'LedgerRow',
+    ['year', 'balance', 'contributed', 'growth', 'nominal_balance'])
+
+# The same columns for every year at once, as arrays
+Ledger = collections.namedtuple('Ledger', LedgerRow._fields)
+
+RetirementResult = collections.namedtuple(
+    'RetirementResult',
+    ['retirement_funds', 'money_contributed', 'safe_withdraw_rate',
+     'withdraw_per_year', 'multipliers'])
+
+
+class RetirementParameters(object):
+    """ Immutable inputs to the retirement calculator.
+
+    Unlike DataHolder this never looks at sys.argv, so it's cheap to build
+    one per calculation. Use replace() to get a copy with some values
+    changed.
+    """
+    __slots__ = PARAMETER_FIELDS + ('net_compounding_rate',)
+
+    def __init__(self, starting_contribution=DEFAULT_STARTING_CONTRIBUTION,
+                 inflation_rate=DEFAULT_INFLATION_RATE,
+                 compounding_rate=DEFAULT_COMPOUNDING_RATE,
+                 yearly_contribution=DEFAULT_YEARLY_CONTRIBUTION,
+                 years_of_contribution=DEFAULT_YEARS_OF_CONTRIBUTION,
+                 years_till_retirement=DEFAULT_YEARS_TILL_RETIREMENT,
+                 years_of_retirement=DEFAULT_YEARS_OF_RETIREMENT):
+        set_value = object.__setattr__
+        set_value(self, 'starting_contribution', starting_contribution)
+        set_value(self, 'inflation_rate', inflation_rate)
+        set_value(self, 'compounding_rate', compounding_rate)
+        set_value(self, 'yearly_contribution', yearly_contribution)
+        set_value(self, 'years_of_contribution', years_of_contribution)
+        set_value(self, 'years_till_retirement', years_till_retirement)
+        set_value(self, 'years_of_retirement', years_of_retirement)
+        set_value(self, 'net_compounding_rate',
+                  compounding_rate - inflation_rate + 1)
+
+    def __setattr__(self, attr, value):
+        raise Exception("Attempting to alter read-only value")
+
+    def __delattr__(self, attr):
+        raise Exception("Attempting to alter read-only value")
+
+    def replace(self, **changes):
+        values = dict(zip(PARAMETER_FIELDS, self.values()))
+        values.update(changes)
+        return RetirementParameters(**values)
+
+    def values(self):
+        return tuple(getattr(self, field) for field in PARAMETER_FIELDS)
+
+    def __eq__(self, other):
+        if not isinstance(other, RetirementParameters):
+            return NotImplemented
+        return self.values() == other.values()
+
+    def __hash__(self):
+        return hash(self.values())
+
+    def __repr__(self):
+        return 'RetirementParameters({})'.format(', '.join(
+            '{}={!r}'.format(field, value)
+            for field, value in zip(PARAMETER_FIELDS, self.values())))
+
 
 class DataHolder(object):
-    def __init__(self):
+    def __init__(self, argv=None):
         (self.starting_contribution,
          self.inflation_rate,
          self.compounding_rate,
@@ -108,9 +254,19 @@ class DataHolder(object):
          self.years_of_retirement,
          self.show_multipliers,
          self.num_multipliers,
-         self.withdraw_rate) = process_opts()
-
-        self.net_compounding_rate = self.compounding_rate - self.inflation_rate + 1
+         self.show_sensitivities,
+         self.withdraw_rate,
+         self.withdraw_index,
+         self.success_rate,
+         self.stock_allocation,
+         self.monte_carlo_options) = process_opts(argv)
+
+        self.parameters = RetirementParameters(
+            self.starting_contribution, self.inflation_rate,
+            self.compounding_rate, self.yearly_contribution,
+            self.years_of_contribution, self.years_till_retirement,
+            self.years_of_retirement)
+        self.net_compounding_rate = self.parameters.net_compounding_rate
 
     def __setattr__(self, attr, value):
         if hasattr(self, attr):
@@ -120,35 +276,169 @@ class DataHolder(object):
 
 
 class CompoundingCalculator(object):
+    """ Caches results of the module level functions for one plan.
+
+    dataHolder can be a DataHolder or RetirementParameters.
+    """
     def __init__(self, dataHolder):
         self.dataHolder = dataHolder
         self.retirement_funds = None
         self.multipliers_list = []
+        self.sensitivities = None
+        self.ledger = None
 
     def get_retirement_funds(self):
         if self.retirement_funds is None:
-            compound = self.dataHolder.starting_contribution
-            for i in range(0, self.dataHolder.years_till_retirement):
-                compound *= self.dataHolder.net_compounding_rate
-                if i < self.dataHolder.years_of_contribution:
-                    compound += self.dataHolder.yearly_contribution
-
-            self.retirement_funds = compound
+            self.retirement_funds = retirement_funds(self.dataHolder)
 
         return self.retirement_funds
 
     def get_multipliers(self, num_multipliers):
-        period_length = self.dataHolder.years_of_contribution // (num_multipliers-1)
         if len(self.multipliers_list) == 0:
-            for n in range(0, num_multipliers):
-                years_used = n * period_length
-                multiplier = compound(1, self.dataHolder.net_compounding_rate, self.dataHolder.years_till_retirement - years_used)
-                muliplier_package = (multiplier, years_used)
-                self.multipliers_list.append(muliplier_package)
+            self.multipliers_list = multipliers(self.dataHolder, num_multipliers)
         return self.multipliers_list
 
+    def get_ledger(self):
+        if self.ledger is None:
+            self.ledger = ledger_arrays(self.dataHolder)
+        return self.ledger
+
+    def get_sensitivities(self):
+        if self.sensitivities is None:
+            self.sensitivities = funds_sensitivities(self.dataHolder)
+            self.retirement_funds = self.sensitivities.retirement_funds
+        return self.sensitivities
+
     def money_contributed(self):
-        return (self.dataHolder.yearly_contribution * self.dataHolder.years_of_contribution) + self.dataHolder.starting_contribution
+        return money_contributed(self.dataHolder)
+
+
+def calculate(parameters, num_multipliers=0, safe_withdraw_rate=None):
+    """ Runs the whole calculator for one plan. Returns a RetirementResult.
+
+    safe_withdraw_rate defaults to the builtin table's rate for the plan's
+    years of retirement.
+    """
+    if safe_withdraw_rate is None:
+        safe_withdraw_rate = safe_withdraw_rate_for(parameters.years_of_retirement)
+    funds = retirement_funds(parameters)
+    return RetirementResult(funds, money_contributed(parameters),
+                            safe_withdraw_rate, funds * safe_withdraw_rate,
+                            multipliers(parameters, num_multipliers)
+                            if num_multipliers else [])
+
+def retirement_funds(parameters):
+    """ Funds at retirement, in today's currency """
+    return retirement_funds_closed_form(parameters.starting_contribution,
+                                        parameters.net_compounding_rate,
+                                        parameters.yearly_contribution,
+                                        parameters.years_of_contribution,
+                                        parameters.years_till_retirement)
+
+def money_contributed(parameters):
+    return (parameters.yearly_contribution * parameters.years_of_contribution) + parameters.starting_contribution
+
+def withdraw_per_year(parameters, safe_withdraw_rate=None):
+    if safe_withdraw_rate is None:
+        safe_withdraw_rate = safe_withdraw_rate_for(parameters.years_of_retirement)
+    return retirement_funds(parameters) * safe_withdraw_rate
+
+def multipliers(parameters, num_multipliers):
+    """ Returns [(multiplier, years_used), ...]: how much money invested
+    years_used years after the start grows by before retirement, for
+    num_multipliers evenly spaced points over the years of contribution """
+    if num_multipliers > 1:
+        period_length = parameters.years_of_contribution // (num_multipliers-1)
+    else:
+        period_length = 0
+    powers = cumulative_growth(parameters.net_compounding_rate,
+                               parameters.years_till_retirement)
+    multipliers_list = []
+    for n in range(0, num_multipliers):
+        years_used = n * period_length
+        years_left = parameters.years_till_retirement - years_used
+        multipliers_list.append((powers[years_left] if years_left > 0 else 1,
+                                 years_used))
+    return multipliers_list
+
+def cumulative_growth(rate, years):
+    """ array('d') of rate**0, rate**1, ... rate**years, as a running
+    product (the same as compound(1, rate, year) for each year) """
+    return array('d', itertools.accumulate(
+        itertools.chain((1.0,), itertools.repeat(rate, max(years, 0))),
+        operator.mul))
+
+def ledger(parameters):
+    """ Yields a LedgerRow for the start (year 0) and the end of every year
+    until retirement, computing each year as it's needed """
+    g = parameters.net_compounding_rate
+    s = parameters.starting_contribution
+    c = parameters.yearly_contribution
+    balance = contributed = s
+    nominal_factor = 1.0
+    for year in range(max(parameters.years_till_retirement, 0) + 1):
+        if year:
+            balance *= g
+            nominal_factor *= parameters.inflation_rate
+            if year <= parameters.years_of_contribution:
+                balance += c
+                contributed += c
+        yield LedgerRow(year, balance, contributed, balance - contributed,
+                        balance * nominal_factor)
+
+def ledger_arrays(parameters):
+    """ The whole ledger() as a Ledger of arrays, from running products and
+    sums instead of a python loop per year.
+
+    With powers[y] = g^y, the contributions made by the end of year y <= k
+    (k = min(years_of_contribution, years_till_retirement)) are worth
+    c * (powers[0] + ... + powers[y-1]), and after year k that total just
+    compounds, so
+        balance[y] = s * powers[y] + c * annuity[y]
+    """
+    t = max(parameters.years_till_retirement, 0)
+    k = min(max(parameters.years_of_contribution, 0), t)
+    s = parameters.starting_contribution
+    c = parameters.yearly_contribution
+    powers = cumulative_growth(parameters.net_compounding_rate, t)
+    annuity = array('d', itertools.accumulate(
+        itertools.chain((0.0,), powers[:k])))
+    annuity_at_k = annuity[-1]
+    annuity.extend(annuity_at_k * power for power in powers[1:t - k + 1])
+    balance = array('d', [s * power + c * sum_of_powers
+                          for power, sum_of_powers in zip(powers, annuity)])
+    contributed = array('d', [s + c * min(year, k) for year in range(t + 1)])
+    inflation = cumulative_growth(parameters.inflation_rate, t)
+    return Ledger(
+        array('i', range(t + 1)), balance, contributed,
+        array('d', map(operator.sub, balance, contributed)),
+        array('d', map(operator.mul, balance, inflation)))
+
+def safe_withdraw_rate_for(years_of_retirement):
+    """ Historically safe withdrawal rate from the builtin table """
+    # See http://www.retireearlyhomepage.com/restud1.html
+    # (Or Google the numbers: 8.47% 4.78% 3.81% 3.54% 3.35% 3.24%)
+    years_to_safe_withdraw_rates = {
+        10: .0847,
+        20: .0478,
+        30: .0381,
+        40: .0354,
+        50: .0335,
+        60: .0324,
+    }
+
+    withdrawal_rate_keys = sorted(years_to_safe_withdraw_rates.keys())
+
+    # Best to round up eagerly. Rounding down can give an unsafe impression.
+    approximate_years_of_retirement = (round(years_of_retirement)
+                                       if years_of_retirement <= 3
+                                       else round_up_to_nearest_ten(years_of_retirement))
+
+    if approximate_years_of_retirement < withdrawal_rate_keys[0]:
+        approximate_years_of_retirement = withdrawal_rate_keys[0]
+    elif approximate_years_of_retirement > withdrawal_rate_keys[-1]:
+        approximate_years_of_retirement = withdrawal_rate_keys[-1]
+    return years_to_safe_withdraw_rates[approximate_years_of_retirement]
 
 class CalcPrinter(object):
     def __init__(self, compoundingCalculator, dataHolder):
@@ -189,31 +479,33 @@ class CalcPrinter(object):
         self.print_withdraw_rate()
 
     def _get_safe_withdraw_rate(self):
-        # See http://www.retireearlyhomepage.com/restud1.html
-        # (Or Google the numbers: 8.47% 4.78% 3.81% 3.54% 3.35% 3.24%)
-        years_to_safe_withdraw_rates = {
-            10: .0847,
-            20: .0478,
-            30: .0381,
-            40: .0354,
-            50: .0335,
-            60: .0324,
-        }
-
-        withdrawal_rate_keys = sorted(years_to_safe_withdraw_rates.keys())
-
-        years_of_retirement = self.dataHolder.years_of_retirement
-        # Best to round up eagerly. Rounding down can give an unsafe impression.
-        approximate_years_of_retirement = (round(years_of_retirement)
-                                           if years_of_retirement <= 3
-                                           else round_up_to_nearest_ten(years_of_retirement))
-
-        if approximate_years_of_retirement < withdrawal_rate_keys[0]:
-            approximate_years_of_retirement = withdrawal_rate_keys[0]
-        elif approximate_years_of_retirement > withdrawal_rate_keys[-1]:
-            approximate_years_of_retirement = withdrawal_rate_keys[-1]
-        return years_to_safe_withdraw_rates[approximate_years_of_retirement]
-
+        if self.dataHolder.withdraw_index is not None:
+            return self._get_historical_withdraw_rate()
+        return safe_withdraw_rate_for(self.dataHolder.years_of_retirement)
+
+    def _get_historical_withdraw_rate(self):
+        import safe_withdrawal
+        try:
+            with safe_withdrawal.SafeWithdrawIndex(self.dataHolder.withdraw_index) as index:
+                years_of_retirement = min(max(int(math.ceil(self.dataHolder.years_of_retirement)), 1),
+                                          index.max_years)
+                rate = index.lookup(years_of_retirement,
+                                    index.nearest_allocation(self.dataHolder.stock_allocation),
+                                    self.dataHolder.success_rate)
+        except KeyError as err:
+            sys.exit(err.args[0])
+        except (OSError, ValueError) as err:
+            sys.exit(str(err))
+        if math.isnan(rate):
+            sys.exit("The withdraw index doesn't have enough history for {} "
+                     "years of retirement".format(years_of_retirement))
+        return rate
+
+    def _safety_description(self):
+        if self.dataHolder.withdraw_index is not None:
+            return "Historically, this rate has been safe in {:.0%} of retirements of this length. \n".format(
+                self.dataHolder.success_rate)
+        return "Historically, this rate has been >99% safe for the given duration. \n"
 
     def print_withdraw_rate(self):
         safe_withdraw_rate = self._get_safe_withdraw_rate()
@@ -223,7 +515,7 @@ class CalcPrinter(object):
               "\n"
               "\t${:,.2f} per year (today's currency)\n"
               "\n"
-              "Historically, this rate has been >99% safe for the given duration. \n"
+              "{}"
               #TODO
               #"To get the 100%% safe rate, use the "--safe" option\n"
               "\n"
@@ -233,7 +525,8 @@ class CalcPrinter(object):
               "\n"
               "These calculations do not factor in taxes, pensions, or social security."
               "".format(self.dataHolder.years_of_retirement,
-                        safe_withdraw_rate, withdraw_per_year))
+                        safe_withdraw_rate, withdraw_per_year,
+                        self._safety_description()))
 
 
 
@@ -246,6 +539,34 @@ class CalcPrinter(object):
             print("    {:5.2f} times if you invest it".format(multiple),
                   "{:2} years after the start of your retirement savings".format(years))
 
+    def print_sensitivities(self):
+        sensitivities = self.compounding_calc.get_sensitivities()
+        print("")
+        print("Your retirement funds (today's currency) change by about:")
+        print("    ${:,.2f} per extra dollar of starting contribution".format(
+            sensitivities.starting_contribution))
+        print("    ${:,.2f} per extra dollar of yearly contribution".format(
+            sensitivities.yearly_contribution))
+        print("    ${:,.2f} per extra 1% of compounding rate".format(
+            sensitivities.compounding_rate / 100))
+        print("    ${:,.2f} per extra 1% of inflation".format(
+            sensitivities.inflation_rate / 100))
+        print("    ${:,.2f} per extra year of contribution".format(
+            sensitivities.years_of_contribution))
+        print("    ${:,.2f} per extra year till retirement".format(
+            sensitivities.years_till_retirement))
+
+    def print_monte_carlo(self, result):
+        print("")
+        print("Simulating {:,} random market paths (seed {}):".format(
+            result.paths, result.seed))
+        if result.success_probability is not None:
+            print("    {:.1%} of them retire with at least ${:,.2f}".format(
+                result.success_probability, result.target_funds))
+        print("    Retirement funds (today's currency) by percentile:")
+        for pct, funds in result.percentiles.items():
+            print("        {:3}th: ${:,.2f}".format(pct, funds))
+
     def to_percent_str(self, num, set_to_one=True):
         if num <= 0.00:
             return "-infinity%"
@@ -260,6 +581,136 @@ def round_up_to_nearest_ten(num):
         return num
     return (int(num / 10) + 1) * 10
 
+def retirement_funds_closed_form(starting_contribution, net_compounding_rate,
+                                 yearly_contribution, years_of_contribution,
+                                 years_till_retirement):
+    growth, annuity = growth_factors(net_compounding_rate, years_of_contribution,
+                                     years_till_retirement)
+    return starting_contribution * growth + yearly_contribution * annuity
+
+def growth_factors(net_compounding_rate, years_of_contribution,
+                   years_till_retirement):
+    """ Returns (growth, annuity) so that retirement funds are
+        starting_contribution * growth + yearly_contribution * annuity
+
+    Each year the funds compound, then that year's contribution is added.
+    The starting contribution compounds every year until retirement, and the
+    k = min(years_of_contribution, years_till_retirement) contributions form
+    a geometric series:
+        growth = g^t
+        annuity = sum_{i=0}^{k-1} g^(t-1-i) = g^(t-k) * (g^k - 1) / (g - 1)
+    """
+    g = net_compounding_rate
+    t = max(years_till_retirement, 0)
+    k = min(max(years_of_contribution, 0), t)
+    growth = g ** t
+    x = g - 1
+    if x == 0:
+        annuity = float(k)
+    elif g > 0:
+        # expm1/log1p keep precision when g is very close to 1
+        annuity = g ** (t - k) * math.expm1(k * math.log1p(x)) / x
+    else:
+        annuity = (growth - g ** (t - k)) / x
+    return growth, annuity
+
+def growth_factor_derivatives(net_compounding_rate, years_of_contribution,
+                              years_till_retirement):
+    """ Returns (growth, annuity, d growth / dg, d annuity / dg,
+    d growth / dt, d annuity / dt, d annuity / dn) for growth_factors().
+
+    With m = t - k, the annuity is g^m * S, where S = sum_{i=0}^{k-1} g^i.
+    Years are treated as continuous, and where contributions stop right at
+    retirement the derivatives with respect to them are one sided (adding
+    a year till retirement doesn't add a contribution, and adding a year of
+    contribution does nothing).
+    """
+    g = net_compounding_rate
+    t = max(years_till_retirement, 0)
+    n = max(years_of_contribution, 0)
+    k = min(n, t)
+    m = t - k
+    x = g - 1
+    growth = g ** t
+    growth_slope = t * g ** (t - 1) if t else 0.0
+    if (abs(x) < SERIES_LOOP_THRESHOLD or g <= 0) and k == int(k):
+        # (g^k - 1) / (g - 1) and its derivative cancel badly close to 1
+        series = series_slope = 0.0
+        for _ in range(int(k)):
+            series_slope = series_slope * g + series
+            series = series * g + 1
+    else:
+        series = math.expm1(k * math.log1p(x)) / x
+        series_slope = (k * g ** (k - 1) - series) / x
+    tail = g ** m
+    annuity = tail * series
+    annuity_slope = (m * g ** (m - 1) * series if m else 0.0) + tail * series_slope
+    if g > 0:
+        log_g = math.log1p(x)
+        # log(g) / (g - 1), the derivative of the annuity's g^k - 1 over k
+        log_ratio = log_g / x if x else 1.0
+    else:
+        log_g = log_ratio = float('nan')
+    growth_by_years = growth * log_g
+    if n <= t:
+        annuity_by_years = annuity * log_g
+    else:
+        annuity_by_years = growth * log_ratio
+    annuity_by_contribution_years = tail * log_ratio if n < t else 0.0
+    return (growth, annuity, growth_slope, annuity_slope, growth_by_years,
+            annuity_by_years, annuity_by_contribution_years)
+
+def funds_sensitivities(parameters):
+    """ Retirement funds and their exact partial derivatives with respect to
+    every input, from one evaluation. Returns a FundsSensitivities.
+
+    parameters can be RetirementParameters or a DataHolder. See
+    growth_factor_derivatives() for how the years are handled.
+    """
+    return _funds_sensitivities(
+        parameters, growth_factor_derivatives(parameters.net_compounding_rate,
+                                              parameters.years_of_contribution,
+                                              parameters.years_till_retirement))
+
+def _funds_sensitivities(parameters, factors):
+    (growth, annuity, growth_slope, annuity_slope, growth_by_years,
+     annuity_by_years, annuity_by_contribution_years) = factors
+    s = parameters.starting_contribution
+    c = parameters.yearly_contribution
+    # The net compounding rate is compounding_rate - inflation_rate + 1
+    rate_slope = s * growth_slope + c * annuity_slope
+    return FundsSensitivities(
+        retirement_funds=s * growth + c * annuity,
+        starting_contribution=growth,
+        inflation_rate=-rate_slope,
+        compounding_rate=rate_slope,
+        yearly_contribution=annuity,
+        years_of_contribution=c * annuity_by_contribution_years,
+        years_till_retirement=s * growth_by_years + c * annuity_by_years,
+        years_of_retirement=0.0)
+
+def sensitivities_batch(plans):
+    """ funds_sensitivities() for a sequence of plans. Returns a
+    FundsSensitivities holding an array('d') per field, one value per plan.
+
+    The growth factors only depend on the net compounding rate and the
+    years, so plans that share those share one evaluation.
+    """
+    columns = FundsSensitivities(*(array('d') for _ in FundsSensitivities._fields))
+    appends = [column.append for column in columns]
+    factors_by_key = {}
+    for parameters in plans:
+        key = (parameters.net_compounding_rate,
+               parameters.years_of_contribution,
+               parameters.years_till_retirement)
+        factors = factors_by_key.get(key)
+        if factors is None:
+            factors = factors_by_key[key] = growth_factor_derivatives(*key)
+        for append, value in zip(appends,
+                                 _funds_sensitivities(parameters, factors)):
+            append(value)
+    return columns
+
 def compound(start, compounding_rate, years_to_compound):
     for _ in range(years_to_compound):
         start *= compounding_rate
@@ -282,6 +733,33 @@ def main():
     if dataHolder.show_multipliers:
         printer.print_multipliers()
 
+    if dataHolder.show_sensitivities:
+        printer.print_sensitivities()
+
+    if dataHolder.monte_carlo_options is not None:
+        printer.print_monte_carlo(run_monte_carlo(dataHolder))
+
+def run_monte_carlo(dataHolder):
+    import montecarlo
+    options = dict(dataHolder.monte_carlo_options)
+    paths = int(options.pop('monte_carlo', 10000))
+    converters = {'seed': int, 'workers': int, 'volatility': float,
+                  'inflation_volatility': float, 'target': float}
+    kwargs = {name: converters.get(name, str)(value)
+              for name, value in options.items()}
+    kwargs['stock_allocation'] = dataHolder.stock_allocation
+    if 'volatility' in kwargs:
+        kwargs['return_volatility'] = kwargs.pop('volatility')
+    if 'history' in kwargs:
+        kwargs['history_years'] = history.load_history(kwargs.pop('history'))
+    if 'target' in kwargs:
+        kwargs['target_funds'] = kwargs.pop('target')
+    try:
+        simulator = montecarlo.MonteCarloSimulator(dataHolder, paths, **kwargs)
+    except ValueError as err:
+        sys.exit(str(err))
+    return simulator.run()
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+'''
+Rolling window CAGR over long price histories
+By: Michael Asnes
+
+For every price in a series, computes the trailing CAGR over several windows
+(ex: 1, 3, 5 and 10 years) in a single pass. The CAGR from price a to price
+b over y years is exp((log(b) - log(a)) / y) - 1, the same as
+cagr.CagrCalc(a, b, y).cagr(), so only the last (longest window) log prices
+need to be kept, in a ring buffer. Prices are read a chunk at a time, so
+files larger than memory are fine.
+
+Input is either a CSV file with a header row and a price column (plus
+optional date and ticker columns, passed through to the output), or a raw
+file of native float64 prices, which is memory mapped.
+'''
+import csv
+import getopt
+import math
+import mmap
+import os
+import sys
+from array import array
+
+DEFAULT_WINDOWS = (1, 3, 5, 10)     # years
+DEFAULT_PERIODS_PER_YEAR = 252      # trading days
+DEFAULT_CHUNK_SIZE = 65536          # prices
+DEFAULT_PRICE_COLUMN = 'price'
+
+
+def usage():
+    print(
+        '''Usage:
+\t-h show this help
+\t-w comma separated window lengths in years (defaults to {})
+\t-p prices per year (defaults to {})
+\t-k name of the price column in csv input (defaults to {})
+\t-c prices read at a time (defaults to {:,})
+\t<prices> [output]
+\t\tprices is a csv file (ending in .csv) or a file of raw float64
+\t\tprices. csv input gives csv output (to stdout if no output file is
+\t\tgiven), with a cagr_<years>y column per window. Raw input needs an
+\t\toutput file, which gets one float64 per window for every price.
+\t\tRows without a full window (or a positive price) get no CAGR.'''
+        .format(','.join(str(w) for w in DEFAULT_WINDOWS),
+                DEFAULT_PERIODS_PER_YEAR, DEFAULT_PRICE_COLUMN,
+                DEFAULT_CHUNK_SIZE)
+    )
+
+
+def process_opts():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "w:p:k:c:h", ["help"])
+    except getopt.GetoptError as err:
+        print(str(err))
+        usage()
+        sys.exit(2)
+    windows = DEFAULT_WINDOWS
+    periods_per_year = DEFAULT_PERIODS_PER_YEAR
+    price_column = DEFAULT_PRICE_COLUMN
+    chunk_size = DEFAULT_CHUNK_SIZE
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            usage()
+            sys.exit()
+        elif o == "-w":
+            windows = tuple(float(w) for w in a.split(','))
+        elif o == "-p":
+            periods_per_year = float(a)
+        elif o == "-k":
+            price_column = a
+        elif o == "-c":
+            chunk_size = int(a)
+        else:
+            assert False, "unhandled option"
+    if len(args) not in (1, 2):
+        sys.exit(usage())
+    input_path = args[0]
+    output_path = args[1] if len(args) == 2 else None
+    if not input_path.endswith('.csv') and output_path is None:
+        sys.exit("Raw float64 input needs an output file")
+    return (windows, periods_per_year, price_column, chunk_size, input_path,
+            output_path)
+
+
+class RollingCagr(object):
+    """ Trailing CAGR over several windows for one series of prices.
+
+    windows are in years, and each is periods_per_year * years prices long
+    (rounded). Feed prices in order with update() or update_chunk(). Call
+    reset() before starting a new series.
+    """
+    def __init__(self, windows=DEFAULT_WINDOWS,
+                 periods_per_year=DEFAULT_PERIODS_PER_YEAR):
+        self.windows = tuple(float(w) for w in windows)
+        self.lags = tuple(int(round(w * periods_per_year))
+                          for w in self.windows)
+        if not self.lags or min(self.lags) < 1:
+            raise ValueError("Windows must each span at least one price")
+        self.max_lag = max(self.lags)
+        self.reset()
+
+    def reset(self):
+        # Log prices of the last max_lag prices. _position is where the next
+        # one goes, and _count how many are real.
+        self._ring = array('d', [math.nan]) * self.max_lag
+        self._position = 0
+        self._count = 0
+
+    def update(self, price):
+        """ Adds one price. Returns a tuple with the CAGR for each window
+        ending at it (nan where the window isn't full yet). """
+        value = math.log(price) if price > 0 else math.nan
+        ring = self._ring
+        position = self._position
+        rates = tuple(
+            _annualize(value - ring[(position - lag) % self.max_lag], years)
+            if lag <= self._count else math.nan
+            for years, lag in zip(self.windows, self.lags))
+        ring[position] = value
+        self._position = (position + 1) % self.max_lag
+        self._count = min(self._count + 1, self.max_lag)
+        return rates
+
+    def update_chunk(self, prices):
+        """ Adds a sequence of prices. Returns a list with an array('d') of
+        CAGRs per window, each holding one CAGR per price. """
+        log = math.log
+        nan = math.nan
+        ring = self._ring
+        if self._count == self.max_lag:
+            logs = ring[self._position:] + ring[:self._position]
+        else:
+            logs = ring[:self._count]
+        offset = len(logs)
+        logs.extend([log(price) if price > 0 else nan for price in prices])
+        num_prices = len(logs) - offset
+
+        results = []
+        for years, lag in zip(self.windows, self.lags):
+            # The first prices don't have lag prices before them
+            missing = min(max(lag - offset, 0), num_prices)
+            rates = array('d', [nan]) * missing
+            starts = logs[offset + missing - lag:offset + num_prices - lag]
+            ends = logs[offset + missing:]
+            inverse = 1 / years
+            expm1 = math.expm1
+            try:
+                rates.extend([expm1((end - start) * inverse)
+                              for start, end in zip(starts, ends)])
+            except OverflowError:
+                rates.extend([_annualize(end - start, years)
+                              for start, end in zip(starts, ends)])
+            results.append(rates)
+
+        if len(logs) >= self.max_lag:
+            self._ring = logs[len(logs) - self.max_lag:]
+            self._position = 0
+            self._count = self.max_lag
+        else:
+            ring[:len(logs)] = logs
+            self._position = self._count = len(logs)
+        return results
+
+
+def _annualize(log_growth, years):
+    try:
+        return math.expm1(log_growth / years)
+    except OverflowError:
+        return math.inf
+
+
+def binary_price_chunks(price_file, chunk_size=DEFAULT_CHUNK_SIZE):
+    """ Yields chunks of a file of native float64 prices (opened in binary
+    mode) as memoryviews of a memory map, so nothing is copied and the file
+    can be larger than memory. Each chunk is only valid until the next one
+    is asked for. """
+    size = os.fstat(price_file.fileno()).st_size
+    if size % 8:
+        raise ValueError("A raw price file holds 8 byte floats, but this one "
+                         "is {:,} bytes long".format(size))
+    if size == 0:
+        return
+    with mmap.mmap(price_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        prices = memoryview(mapped).cast('d')
+        try:
+            for start in range(0, len(prices), chunk_size):
+                chunk = prices[start:start + chunk_size]
+                try:
+                    yield chunk
+                finally:
+                    chunk.release()
+        finally:
+            prices.release()
+
+
+def csv_price_chunks(price_file, chunk_size=DEFAULT_CHUNK_SIZE,
+                     price_column=DEFAULT_PRICE_COLUMN):
+    """ Yields (header, ticker, rows, prices) for chunks of a price csv file.
+
+    rows are the csv rows (lists of strings) and prices an array('d') of
+    their prices. A chunk never mixes tickers. ticker is None if the file
+    has no ticker column.
+    """
+    reader = csv.reader(price_file)
+    header = next(reader, None)
+    if header is None:
+        return
+    if price_column not in header:
+        raise ValueError("No {!r} column in the price file".format(price_column))
+    price_index = header.index(price_column)
+    ticker_index = header.index('ticker') if 'ticker' in header else None
+    ticker = None
+    rows = []
+    prices = array('d')
+    for row in reader:
+        if not row:
+            continue
+        row_ticker = row[ticker_index] if ticker_index is not None else None
+        if rows and (row_ticker != ticker or len(rows) >= chunk_size):
+            yield header, ticker, rows, prices
+            rows = []
+            prices = array('d')
+        ticker = row_ticker
+        rows.append(row)
+        try:
+            prices.append(float(row[price_index]))
+        except ValueError:
+            prices.append(math.nan)
+    if rows:
+        yield header, ticker, rows, prices
+
+
+def rolling_cagr_csv(input_file, output_file, windows=DEFAULT_WINDOWS,
+                     periods_per_year=DEFAULT_PERIODS_PER_YEAR,
+                     chunk_size=DEFAULT_CHUNK_SIZE,
+                     price_column=DEFAULT_PRICE_COLUMN):
+    """ Copies a price csv file to output_file with a CAGR column added for
+    each window. Each ticker's series starts over. """
+    rolling = RollingCagr(windows, periods_per_year)
+    writer = csv.writer(output_file)
+    previous_ticker = None
+    wrote_header = False
+    for header, ticker, rows, prices in csv_price_chunks(input_file, chunk_size,
+                                                         price_column):
+        if not wrote_header:
+            writer.writerow(header + ['cagr_{:g}y'.format(years)
+                                      for years in rolling.windows])
+            wrote_header = True
+        if ticker != previous_ticker:
+            rolling.reset()
+            previous_ticker = ticker
+        columns = rolling.update_chunk(prices)
+        writer.writerows(row + ['{:.10g}'.format(rate) if rate == rate else ''
+                                for rate in rates]
+                         for row, rates in zip(rows, zip(*columns)))
+
+
+def rolling_cagr_binary(input_file, output_file, windows=DEFAULT_WINDOWS,
+                        periods_per_year=DEFAULT_PERIODS_PER_YEAR,
+                        chunk_size=DEFAULT_CHUNK_SIZE):
+    """ Reads raw float64 prices and writes raw float64 CAGRs, one per
+    window for every price (price major). """
+    rolling = RollingCagr(windows, periods_per_year)
+    num_windows = len(rolling.windows)
+    for prices in binary_price_chunks(input_file, chunk_size):
+        columns = rolling.update_chunk(prices)
+        interleaved = array('d', [0.0]) * (len(prices) * num_windows)
+        for window, rates in enumerate(columns):
+            interleaved[window::num_windows] = rates
+        interleaved.tofile(output_file)
+
+
+def main():
+    (windows, periods_per_year, price_column, chunk_size, input_path,
+     output_path) = process_opts()
+    try:
+        if input_path.endswith('.csv'):
+            with open(input_path, newline='') as input_file:
+                if output_path is None:
+                    rolling_cagr_csv(input_file, sys.stdout, windows,
+                                     periods_per_year, chunk_size, price_column)
+                else:
+                    with open(output_path, 'w', newline='') as output_file:
+                        rolling_cagr_csv(input_file, output_file, windows,
+                                         periods_per_year, chunk_size,
+                                         price_column)
+        else:
+            with open(input_path, 'rb') as input_file, \
+                    open(output_path, 'wb') as output_file:
+                rolling_cagr_binary(input_file, output_file, windows,
+                                    periods_per_year, chunk_size)
+    except (OSError, ValueError) as err:
+        sys.exit(str(err))
+
+if __name__ == '__main__':
+    main()
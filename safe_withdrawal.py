@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+'''
+Historical safe withdrawal rates
+By: Michael Asnes
+
+Computes safe withdrawal rates from a local history file (see history.py)
+instead of a hardcoded table. Every rolling start year ("cohort") retires
+with a balance of 1 and withdraws the same inflation adjusted amount at the
+start of each year. With real returns g_0, g_1, ... the balance after the
+last year is
+
+    prod(1 + g_t) * (1 - w * sum_{t=0}^{L-1} 1 / prod_{k<t}(1 + g_k))
+
+so the largest withdrawal rate a cohort survives for L years is simply
+1 / sum_{t=0}^{L-1} 1 / prod_{k<t}(1 + g_k). No searching is needed.
+
+Results are stored in an index file, keyed by (years of retirement, stock
+allocation, success rate). The file is memory-mapped, so a lookup is a
+single read at a computed offset. Updating the index after appending years
+to the history only computes the new cohorts.
+'''
+import bisect
+import math
+import mmap
+import os
+import struct
+import sys
+import zlib
+
+import history
+
+MAGIC = b'SWRIDX01'
+HEADER = struct.Struct('<8sIiIIII')
+DEFAULT_MAX_YEARS = 60
+DEFAULT_ALLOCATIONS = tuple(i / 10 for i in range(11))
+DEFAULT_SUCCESS_RATES = (0.90, 0.95, 0.99, 1.00)
+
+
+def usage():
+    print(
+        '''Usage:
+\t-h show this help
+\tbuild <history.csv> <index file> [max years of retirement]
+\tupdate <history.csv> <index file>
+\tlookup <index file> <years of retirement> <stock allocation> <success rate>'''
+    )
+
+
+def real_returns(history_years, stock_allocation):
+    ''' Yearly real returns of a portfolio rebalanced to stock_allocation '''
+    return [history.compounding_rate(year, stock_allocation)
+            / history.inflation_rate(year) - 1 for year in history_years]
+
+
+def cohort_rates(returns, start, min_years, max_years):
+    ''' Max safe withdrawal rate of the cohort retiring at index start, for
+    each retirement length min_years..max_years that fits in returns '''
+    rates = []
+    discount = 1.0
+    discounted_years = 0.0
+    for years in range(1, min(max_years, len(returns) - start) + 1):
+        discounted_years += discount
+        if years >= min_years:
+            rates.append(1 / discounted_years)
+        growth = 1 + returns[start + years - 1]
+        # A 100% loss ends the cohort. Every later year is worthless.
+        discount = discount / growth if growth > 0 else float('inf')
+    return rates
+
+
+def success_rate_index(num_cohorts, success_rate):
+    ''' Index into the sorted cohort rates of the largest rate at which at
+    least success_rate of the cohorts survive '''
+    index = int(math.floor(num_cohorts * (1 - success_rate) + 1e-9))
+    return min(max(index, 0), num_cohorts - 1)
+
+
+class SafeWithdrawIndex(object):
+    ''' Memory-mapped table of safe withdrawal rates.
+
+    File layout (little endian):
+        header: magic, version, first year, years of data, max years,
+                number of allocations, number of success rates
+        crc32 of the history the index was built from
+        allocations, success rates (doubles)
+        table[years - 1][allocation][success rate] (doubles, nan if there
+            isn't enough history for that many years)
+        sorted cohort rates for each (years, allocation), used for updates
+    '''
+    VERSION = 1
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as index_file:
+            self._mmap = mmap.mmap(index_file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+        (magic, version, self.first_year, self.data_years, self.max_years,
+         num_allocations, num_success_rates) = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != self.VERSION:
+            raise ValueError("{} is not a safe withdrawal index".format(path))
+        offset = HEADER.size
+        self.history_crc, = struct.unpack_from('<I', self._mmap, offset)
+        offset += 8
+        self.allocations = struct.unpack_from('<{}d'.format(num_allocations),
+                                              self._mmap, offset)
+        offset += 8 * num_allocations
+        self.success_rates = struct.unpack_from(
+            '<{}d'.format(num_success_rates), self._mmap, offset)
+        offset += 8 * num_success_rates
+        self._table_offset = offset
+        self._allocation_positions = {round(a, 6): i
+                                      for i, a in enumerate(self.allocations)}
+        self._success_rate_positions = {round(r, 6): i for i, r
+                                        in enumerate(self.success_rates)}
+
+    def close(self):
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def lookup(self, years, stock_allocation, success_rate):
+        ''' Safe withdrawal rate (ex: 0.04). nan if the history is too short.
+
+        stock_allocation and success_rate must be values the index was built
+        with, and years must be between 1 and the index's max years.
+        '''
+        if not 1 <= years <= self.max_years:
+            raise KeyError("Index covers 1 to {} years of retirement, not {}"
+                           .format(self.max_years, years))
+        try:
+            allocation = self._allocation_positions[round(stock_allocation, 6)]
+            success = self._success_rate_positions[round(success_rate, 6)]
+        except KeyError:
+            raise KeyError("Index has no entry for a stock allocation of {} "
+                           "and a success rate of {}".format(stock_allocation,
+                                                             success_rate))
+        position = (((years - 1) * len(self.allocations) + allocation)
+                    * len(self.success_rates) + success)
+        return struct.unpack_from('<d', self._mmap,
+                                  self._table_offset + 8 * position)[0]
+
+    def nearest_allocation(self, stock_allocation):
+        return min(self.allocations, key=lambda a: abs(a - stock_allocation))
+
+    def _cohort_rates(self):
+        ''' {(years, allocation position): sorted cohort rates} '''
+        offset = (self._table_offset + 8 * self.max_years
+                  * len(self.allocations) * len(self.success_rates))
+        cohorts = {}
+        for years in range(1, self.max_years + 1):
+            count = max(0, self.data_years - years + 1)
+            for allocation in range(len(self.allocations)):
+                cohorts[years, allocation] = list(struct.unpack_from(
+                    '<{}d'.format(count), self._mmap, offset))
+                offset += 8 * count
+        return cohorts
+
+
+def build_index(history_years, path, max_years=DEFAULT_MAX_YEARS,
+                allocations=DEFAULT_ALLOCATIONS,
+                success_rates=DEFAULT_SUCCESS_RATES):
+    ''' Runs every cohort in history_years and writes an index to path '''
+    cohorts = {}
+    for position, allocation in enumerate(allocations):
+        returns = real_returns(history_years, allocation)
+        for years in range(1, max_years + 1):
+            cohorts[years, position] = []
+        for start in range(len(returns)):
+            for years, rate in enumerate(cohort_rates(returns, start, 1,
+                                                      max_years), 1):
+                cohorts[years, position].append(rate)
+    for rates in cohorts.values():
+        rates.sort()
+    _write_index(path, history_years, max_years, allocations, success_rates,
+                 cohorts)
+
+
+def update_index(history_years, path):
+    ''' Brings the index at path up to date with history_years.
+
+    If history_years only adds years to the end of the history the index was
+    built from, only the new cohorts are computed. Otherwise the index is
+    rebuilt from scratch.
+    '''
+    with SafeWithdrawIndex(path) as index:
+        max_years = index.max_years
+        allocations = index.allocations
+        success_rates = index.success_rates
+        old_years = index.data_years
+        appended = (len(history_years) >= old_years
+                    and history_years[0].year == index.first_year
+                    and _history_crc(history_years[:old_years]) == index.history_crc)
+        if appended:
+            cohorts = index._cohort_rates()
+    if not appended:
+        build_index(history_years, path, max_years, allocations, success_rates)
+        return
+    if len(history_years) == old_years:
+        return
+
+    for position, allocation in enumerate(allocations):
+        returns = real_returns(history_years, allocation)
+        # Only cohorts that run past the old end of the history are new
+        for start in range(max(0, old_years - max_years + 1), len(returns)):
+            min_years = max(1, old_years - start + 1)
+            for years, rate in enumerate(cohort_rates(returns, start, min_years,
+                                                      max_years), min_years):
+                bisect.insort(cohorts[years, position], rate)
+    _write_index(path, history_years, max_years, allocations, success_rates,
+                 cohorts)
+
+
+def _write_index(path, history_years, max_years, allocations, success_rates,
+                 cohorts):
+    nan = float('nan')
+    table = []
+    for years in range(1, max_years + 1):
+        for position in range(len(allocations)):
+            rates = cohorts[years, position]
+            for success_rate in success_rates:
+                table.append(rates[success_rate_index(len(rates), success_rate)]
+                             if rates else nan)
+
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as index_file:
+        index_file.write(HEADER.pack(MAGIC, SafeWithdrawIndex.VERSION,
+                                     history_years[0].year if history_years else 0,
+                                     len(history_years), max_years,
+                                     len(allocations), len(success_rates)))
+        index_file.write(struct.pack('<I4x', _history_crc(history_years)))
+        for values in [allocations, success_rates, table]:
+            index_file.write(struct.pack('<{}d'.format(len(values)), *values))
+        for years in range(1, max_years + 1):
+            for position in range(len(allocations)):
+                rates = cohorts[years, position]
+                index_file.write(struct.pack('<{}d'.format(len(rates)), *rates))
+    os.replace(temp_path, path)
+
+
+def _history_crc(history_years):
+    crc = 0
+    for year in history_years:
+        crc = zlib.crc32(struct.pack('<i3d', *year), crc)
+    return crc
+
+
+def main():
+    args = sys.argv[1:]
+    if not args or args[0] in ('-h', '--help'):
+        sys.exit(usage())
+    command = args[0]
+    try:
+        if command == 'build' and len(args) in (3, 4):
+            max_years = int(args[3]) if len(args) == 4 else DEFAULT_MAX_YEARS
+            build_index(history.load_history(args[1]), args[2], max_years)
+        elif command == 'update' and len(args) == 3:
+            update_index(history.load_history(args[1]), args[2])
+        elif command == 'lookup' and len(args) == 5:
+            with SafeWithdrawIndex(args[1]) as index:
+                rate = index.lookup(int(args[2]), float(args[3]), float(args[4]))
+            print("{:.3%}".format(rate))
+        else:
+            sys.exit(usage())
+    except KeyError as err:
+        sys.exit(err.args[0])
+    except ValueError as err:
+        sys.exit(str(err))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+'''
+Local HTTP/JSON calculation server
+By: Michael Asnes
+
+POST a fincalc batch request (see fincalc.py) to /calculate:
+
+    {"command": "cagr", "beginning_value": 100, "ending_value": 200,
+     "num_periods": 10}
+
+and get back {"result": {...}} or {"error": "..."}. Requests arriving close
+together are grouped into micro-batches, and each batch is evaluated with
+the calculators' batch functions instead of one request at a time. When
+more requests are waiting than the queue allows, new ones get a 503 right
+away rather than piling up.
+'''
+import asyncio
+import getopt
+import json
+import sys
+
+import fincalc
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_LATENCY_BUDGET = 0.002  # seconds to wait for a batch to fill up
+DEFAULT_MAX_QUEUE = 10000
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+               405: 'Method Not Allowed', 500: 'Internal Server Error',
+               503: 'Service Unavailable'}
+
+
+def usage():
+    print(''' Usage:
+          -h show this help
+          -a address to listen on (defaults to {})
+          -p port to listen on (defaults to {})
+          -b most requests evaluated together (defaults to {})
+          -l milliseconds to wait for a batch to fill up (defaults to {})
+          -q most requests waiting before new ones are turned away
+             (defaults to {})
+          -C remember the results of this many distinct requests
+          -F keep remembered results in this sqlite file between runs
+          '''.format(DEFAULT_HOST, DEFAULT_PORT, DEFAULT_BATCH_SIZE,
+                     DEFAULT_LATENCY_BUDGET * 1000, DEFAULT_MAX_QUEUE))
+
+
+def process_opts():
+    try:
+        opts, _ = getopt.getopt(sys.argv[1:], "a:p:b:l:q:C:F:h", ["help"])
+    except getopt.GetoptError as err:
+        print(str(err))
+        usage()
+        sys.exit(2)
+    host = DEFAULT_HOST
+    port = DEFAULT_PORT
+    batch_size = DEFAULT_BATCH_SIZE
+    latency_budget = DEFAULT_LATENCY_BUDGET
+    max_queue = DEFAULT_MAX_QUEUE
+    cache_size = None
+    cache_file = None
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            usage()
+            sys.exit()
+        elif o == "-a":
+            host = a
+        elif o == "-p":
+            port = int(a)
+        elif o == "-b":
+            batch_size = int(a)
+        elif o == "-l":
+            latency_budget = float(a) / 1000
+        elif o == "-q":
+            max_queue = int(a)
+        elif o == "-C":
+            cache_size = int(a)
+        elif o == "-F":
+            cache_file = a
+        else:
+            assert False, "unhandled option"
+    return (host, port, batch_size, latency_budget, max_queue, cache_size,
+            cache_file)
+
+
+class QueueFull(Exception):
+    pass
+
+
+class MicroBatcher(object):
+    ''' Collects requests into batches and evaluates each batch together.
+
+    A batch is evaluated once it holds batch_size requests, or latency_budget
+    seconds after its first request arrived, whichever comes first.
+    '''
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE,
+                 latency_budget=DEFAULT_LATENCY_BUDGET,
+                 max_queue=DEFAULT_MAX_QUEUE):
+        self.batch_size = batch_size
+        self.latency_budget = latency_budget
+        self.queue = asyncio.Queue(max_queue)
+        self.batches = 0
+        self.requests = 0
+        self._worker = None
+
+    def start(self):
+        self._worker = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+
+    def submit(self, request):
+        ''' Returns a future for the response dict. Raises QueueFull. '''
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((request, future))
+        except asyncio.QueueFull:
+            raise QueueFull()
+        return future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.latency_budget
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(),
+                                                        remaining))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                responses = evaluate_batch([request for request, _ in batch])
+            except Exception as err:
+                responses = [{'error': "Internal error: {}".format(err)}] * len(batch)
+            for (_, future), response in zip(batch, responses):
+                if not future.done():
+                    future.set_result(response)
+            self.batches += 1
+            self.requests += len(batch)
+
+
+def evaluate_batch(requests):
+    ''' Returns a response dict for each request dict.
+
+    Requests are grouped by command. Commands with a vectorized kernel are
+    evaluated in one call; the rest go through fincalc.evaluate one by one.
+    Results already in fincalc's result cache aren't recalculated.
+    '''
+    cache = fincalc.result_cache
+    responses = [None] * len(requests)
+    groups = {}
+    for index, request in enumerate(requests):
+        if not isinstance(request, dict):
+            responses[index] = {'error': "Requests must be JSON objects"}
+            continue
+        parameters = dict(request)
+        name = parameters.pop('command', None)
+        if not isinstance(name, str) or name not in fincalc.BATCH_COMMANDS:
+            responses[index] = {
+                'error': "Unknown batch command {!r}".format(name)}
+            continue
+        if cache is not None:
+            result = cache.get(name, parameters)
+            if result is not None:
+                responses[index] = {'result': result}
+                continue
+        groups.setdefault(name, []).append((index, parameters))
+
+    for name, group in groups.items():
+        members = group
+        kernel = BATCH_KERNELS.get(name)
+        if kernel is not None:
+            members = _run_kernel(kernel, group, responses)
+            if cache is not None:
+                # Leftover members are cached by fincalc.evaluate below
+                for index, parameters in group:
+                    if responses[index] is not None and 'result' in responses[index]:
+                        cache.put(name, parameters, responses[index]['result'])
+        for index, parameters in members:
+            try:
+                responses[index] = {'result': fincalc.evaluate(name, parameters)}
+            except ValueError as err:
+                responses[index] = {'error': str(err)}
+            except Exception as err:
+                responses[index] = {'error': "Internal error: {}".format(err)}
+    return responses
+
+
+def _run_kernel(kernel, members, responses):
+    ''' Fills in responses for the members kernel can handle. Returns the
+    members it couldn't (their parameters didn't fit the kernel, or the
+    kernel returned None for them), so they can be evaluated one by one and
+    get a proper error. If the kernel raises, that's every member. '''
+    fields, evaluate = kernel
+    members_by_index = dict(members)
+    columns = [[] for _ in fields]
+    handled = []
+    leftover = []
+    for index, parameters in members:
+        try:
+            if set(parameters) != set(fields):
+                raise ValueError
+            values = [float(parameters[field]) for field in fields]
+        except (TypeError, ValueError):
+            leftover.append((index, parameters))
+            continue
+        for column, value in zip(columns, values):
+            column.append(value)
+        handled.append(index)
+    if handled:
+        try:
+            kernel_responses = evaluate(*columns)
+        except Exception:
+            return members
+        for index, response in zip(handled, kernel_responses):
+            if response is None:
+                leftover.append((index, members_by_index[index]))
+            else:
+                responses[index] = response
+    return leftover
+
+
+def _cagr_kernel(beginning_values, ending_values, num_periods):
+    import cagr
+    rates, statuses = cagr.cagr_batch(beginning_values, ending_values,
+                                      num_periods)
+    return [{'result': {'rate': rate}} if status == cagr.STATUS_OK
+            else {'error': cagr.FAILSAFE_MESSAGES[status]}
+            for rate, status in zip(rates, statuses)]
+
+
+def _inputstreamcagr_kernel(beginning_values, ending_values,
+                            contributions_per_period, num_periods):
+    import inputstreamcagr
+    rates, statuses, _ = inputstreamcagr.approximate_growth_rates(
+        beginning_values, ending_values, contributions_per_period,
+        [int(periods) for periods in num_periods])
+    # Failures are rare, so let them rerun one by one for the exact message
+    return [{'result': {'rate': rate}}
+            if status == inputstreamcagr.STATUS_CONVERGED else None
+            for rate, status in zip(rates, statuses)]
+
+
+# command: (parameter names, function taking one column per parameter and
+# returning a response dict, or None, for each row)
+BATCH_KERNELS = {
+    'cagr': (('beginning_value', 'ending_value', 'num_periods'), _cagr_kernel),
+    'inputstreamcagr': (('beginning_value', 'ending_value',
+                         'contribution_per_period', 'num_periods'),
+                        _inputstreamcagr_kernel),
+}
+
+
+class CalculationServer(object):
+    def __init__(self, batcher):
+        self.batcher = batcher
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(
+                    int(headers.get('content-length', 0)))
+                status, response = await self.respond(method, path, body)
+                try:
+                    payload = json.dumps(response, allow_nan=False)
+                except ValueError as err:
+                    status = 500
+                    payload = json.dumps(
+                        {'error': "Internal error: {}".format(err)})
+                payload = payload.encode()
+                writer.write('HTTP/1.1 {} {}\r\nContent-Type: application/json'
+                             '\r\nContent-Length: {}\r\n\r\n'.format(
+                                 status, STATUS_TEXT[status], len(payload))
+                             .encode('latin1') + payload)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, method, path, body):
+        ''' Returns (http status, response dict) '''
+        if path == '/health':
+            health = {'status': 'ok', 'queued': self.batcher.queue.qsize(),
+                      'batches': self.batcher.batches,
+                      'requests': self.batcher.requests}
+            if fincalc.result_cache is not None:
+                health['cache'] = fincalc.result_cache.stats()
+            return 200, health
+        if path != '/calculate':
+            return 404, {'error': "Unknown path {}".format(path)}
+        if method != 'POST':
+            return 405, {'error': "Use POST"}
+        try:
+            request = json.loads(body.decode('utf8'))
+        except ValueError as err:
+            return 400, {'error': str(err)}
+        try:
+            response = await self.batcher.submit(request)
+        except QueueFull:
+            return 503, {'error': "Server is busy, try again later"}
+        return (200 if 'result' in response else 400), response
+
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT,
+                batch_size=DEFAULT_BATCH_SIZE,
+                latency_budget=DEFAULT_LATENCY_BUDGET,
+                max_queue=DEFAULT_MAX_QUEUE, ready=None):
+    ''' Runs the server until cancelled. ready (an asyncio.Event) is set
+    once it's listening. '''
+    batcher = MicroBatcher(batch_size, latency_budget, max_queue)
+    batcher.start()
+    server = await asyncio.start_server(
+        CalculationServer(batcher).handle_connection, host, port)
+    if ready is not None:
+        ready.set()
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await batcher.stop()
+
+
+def main():
+    (host, port, batch_size, latency_budget, max_queue, cache_size,
+     cache_file) = process_opts()
+    if cache_size is not None or cache_file is not None:
+        import cache
+        fincalc.set_cache(cache.ResultCache(
+            cache_size or cache.DEFAULT_MAX_ENTRIES, cache_file))
+    print("Listening on http://{}:{}/calculate".format(host, port))
+    try:
+        asyncio.run(serve(host, port, batch_size, latency_budget, max_queue))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if fincalc.result_cache is not None:
+            fincalc.result_cache.close()
+
+if __name__ == '__main__':
+    main()
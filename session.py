@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+'''
+Interactive what-if sessions for the retirement calculator
+By: Michael Asnes
+
+Keeps the balance at the end of every year until retirement. When one input
+changes, only the years after the first one it affects are recomputed. The
+rest of the trajectory is reused. For example, going from 40 to 35 years of
+contribution reuses the first 35 years, and retiring later only computes the
+years added.
+
+    $ ./session.py -s 50000 -o 8%
+    > n 35
+    > t 45
+    > trajectory
+'''
+import cmd
+import collections
+import math
+from array import array
+
+import retirement
+
+# Shorthands for the inputs, the same letters as retirement.py's options
+SHORTHANDS = collections.OrderedDict([
+    ('s', 'starting_contribution'),
+    ('i', 'inflation_rate'),
+    ('o', 'compounding_rate'),
+    ('c', 'yearly_contribution'),
+    ('n', 'years_of_contribution'),
+    ('t', 'years_till_retirement'),
+    ('r', 'years_of_retirement'),
+])
+
+RATE_FIELDS = ('inflation_rate', 'compounding_rate')
+YEAR_FIELDS = ('years_of_contribution', 'years_till_retirement',
+               'years_of_retirement')
+
+SessionUpdate = collections.namedtuple('SessionUpdate',
+                                       ['years_reused', 'years_computed'])
+
+
+class RetirementSession(object):
+    ''' A retirement plan that remembers its year by year balances.
+
+    balances[y] is the funds (today's currency) after y years, up to the
+    years till retirement. change() swaps in new inputs and recomputes only
+    the years they affect. Each year the funds compound, then that year's
+    contribution is added, as in retirement.growth_factors().
+    '''
+    def __init__(self, parameters=None):
+        self.parameters = (parameters if parameters is not None
+                           else retirement.RetirementParameters())
+        self.balances = array('d')
+        # powers[y] is the net compounding rate to the y, for multipliers
+        self.powers = array('d')
+        self.last_update = self._extend()
+
+    def change(self, **changes):
+        ''' Changes some inputs (see RetirementParameters.replace()).
+        Returns a SessionUpdate. '''
+        old = self.parameters
+        new = old.replace(**changes)
+        valid_years = _unchanged_years(old, new)
+        years = max(new.years_till_retirement, 0)
+        del self.balances[min(valid_years, years) + 1:]
+        if new.net_compounding_rate != old.net_compounding_rate:
+            del self.powers[1:]
+        del self.powers[years + 1:]
+        self.parameters = new
+        self.last_update = self._extend()
+        return self.last_update
+
+    def _extend(self):
+        ''' Computes the missing years at the end of the trajectory '''
+        p = self.parameters
+        g = p.net_compounding_rate
+        c = p.yearly_contribution
+        years = max(p.years_till_retirement, 0)
+        balances = self.balances
+        if not balances:
+            balances.append(p.starting_contribution)
+        reused = len(balances) - 1
+        balance = balances[-1]
+        for year in range(reused, years):
+            balance *= g
+            if year < p.years_of_contribution:
+                balance += c
+            balances.append(balance)
+        powers = self.powers
+        if not powers:
+            powers.append(1.0)
+        power = powers[-1]
+        for _ in range(len(powers) - 1, years):
+            power *= g
+            powers.append(power)
+        return SessionUpdate(reused, years - reused)
+
+    def retirement_funds(self):
+        return self.balances[-1]
+
+    def multipliers(self, num_multipliers):
+        ''' Same as retirement.multipliers(), from the saved powers '''
+        p = self.parameters
+        if num_multipliers > 1:
+            period_length = p.years_of_contribution // (num_multipliers - 1)
+        else:
+            period_length = 0
+        multipliers_list = []
+        for n in range(num_multipliers):
+            years_used = n * period_length
+            years_left = p.years_till_retirement - years_used
+            multiplier = (self.powers[years_left] if years_left > 0 else 1.0)
+            multipliers_list.append((multiplier, years_used))
+        return multipliers_list
+
+    def result(self, num_multipliers=0, safe_withdraw_rate=None):
+        ''' The same RetirementResult retirement.calculate() gives '''
+        p = self.parameters
+        if safe_withdraw_rate is None:
+            safe_withdraw_rate = retirement.safe_withdraw_rate_for(
+                p.years_of_retirement)
+        funds = self.retirement_funds()
+        return retirement.RetirementResult(
+            funds, retirement.money_contributed(p), safe_withdraw_rate,
+            funds * safe_withdraw_rate,
+            self.multipliers(num_multipliers) if num_multipliers else [])
+
+
+def _unchanged_years(old, new):
+    ''' How many of the first years' balances are the same for both plans.
+
+    A year's balance depends on the starting contribution, the net rate and
+    the contributions made before it, which are yearly_contribution for the
+    first years_of_contribution years and nothing after.
+    '''
+    if (new.starting_contribution != old.starting_contribution
+            or new.net_compounding_rate != old.net_compounding_rate):
+        return 0
+    shorter = max(min(old.years_of_contribution, new.years_of_contribution), 0)
+    if new.yearly_contribution != old.yearly_contribution and shorter > 0:
+        return 0
+    if old.years_of_contribution > new.years_of_contribution:
+        longer = old
+    else:
+        longer = new
+    if longer.years_of_contribution != shorter and longer.yearly_contribution:
+        return shorter
+    return math.inf
+
+
+class SessionShell(cmd.Cmd):
+    intro = ("Change an input with '<input> <value>' (ex: 'n 35' or "
+             "'compounding_rate 7%').\nType help for the other commands.")
+    prompt = '> '
+
+    def __init__(self, session, stdin=None, stdout=None):
+        super().__init__(stdin=stdin, stdout=stdout)
+        if stdin is not None:
+            self.use_rawinput = False
+        self.session = session
+
+    def print(self, *lines):
+        for line in lines:
+            self.stdout.write(line + '\n')
+
+    def default(self, line):
+        name, _, value = line.strip().partition(' ')
+        field = SHORTHANDS.get(name, name)
+        if field not in retirement.PARAMETER_FIELDS or not value.strip():
+            self.print("Unknown command {!r}. Type help for the commands."
+                       .format(line.strip()))
+            return
+        try:
+            update = self.session.change(**{field: _parse_value(field, value)})
+        except ValueError as err:
+            self.print(str(err))
+            return
+        self.show_funds()
+        self.print(_describe_update(update))
+
+    def do_show(self, _):
+        ''' show the inputs and what they give '''
+        for name, field in SHORTHANDS.items():
+            self.print("    {} {}: {}".format(
+                name, field, getattr(self.session.parameters, field)))
+        self.show_funds()
+
+    def show_funds(self):
+        result = self.session.result()
+        self.print("You will retire with ${:,.2f} (today's currency), and can "
+                   "safely withdraw ${:,.2f} per year".format(
+                       result.retirement_funds, result.withdraw_per_year))
+
+    def do_trajectory(self, _):
+        ''' show the funds at the end of every year '''
+        for year, balance in enumerate(self.session.balances):
+            self.print("    year {:3}: ${:,.2f}".format(year, balance))
+
+    def do_multipliers(self, arg):
+        ''' multipliers <num>: how much money invested at <num> points grows '''
+        try:
+            num_multipliers = int(arg or retirement.DEFAULT_NUM_MULTIPLIERS)
+        except ValueError:
+            self.print("multipliers takes a number")
+            return
+        for multiple, years in self.session.multipliers(num_multipliers):
+            self.print("    {:5.2f} times if you invest it {:2} years after "
+                       "the start".format(multiple, years))
+
+    def do_quit(self, _):
+        ''' leave the session '''
+        return True
+
+    def do_EOF(self, _):
+        self.print('')
+        return True
+
+    def emptyline(self):
+        pass
+
+
+def _parse_value(field, value):
+    value = value.strip().replace(',', '')
+    if field in RATE_FIELDS and '%' in value:
+        return float(value.replace('%', '')) / 100 + 1
+    if field in YEAR_FIELDS:
+        return int(value)
+    return float(value)
+
+
+def _describe_update(update):
+    total = update.years_reused + update.years_computed
+    if not total:
+        return "(nothing to recompute)"
+    return "(reused {} of {} years, recomputed {})".format(
+        update.years_reused, total, update.years_computed)
+
+
+def main():
+    dataHolder = retirement.DataHolder()
+    shell = SessionShell(RetirementSession(dataHolder.parameters))
+    shell.do_show('')
+    try:
+        shell.cmdloop()
+    except KeyboardInterrupt:
+        print('')
+
+
+if __name__ == '__main__':
+    main()
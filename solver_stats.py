@@ -0,0 +1,114 @@
+'''
+Growth rate solver statistics
+By: Michael Asnes
+
+Collects counters from every solve of the growth rate solver into
+histograms: steps taken, value evaluations, bracket expansions, final
+residual and wall time. Turn it on with inputstreamcagr.set_solver_stats()
+and dump it as JSON or in the Prometheus text format.
+'''
+import bisect
+import collections
+import json
+
+# Histogram: upper bounds of its buckets (values above the last one are
+# counted in a final +Inf bucket)
+BUCKETS = collections.OrderedDict([
+    ('iterations', (0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30, 50, 100)),
+    ('evaluations', (1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30, 50, 100, 200)),
+    ('bracket_expansions', (0, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512)),
+    # |log(computed ending value / ending value)|, about the relative error
+    ('residual', (1e-16, 1e-14, 1e-12, 1e-10, 1e-8, 1e-6, 1e-4, 1e-2, 1)),
+    ('seconds', (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 1e-3,
+                 1e-2, 0.1, 1)),
+])
+
+DESCRIPTIONS = {
+    'iterations': "Newton/bisection steps per solve",
+    'evaluations': "Evaluations of the ending value at a rate per solve",
+    'bracket_expansions': "Doublings of the upper bound on the rate per solve",
+    'residual': "Final |log(computed ending value / ending value)| per solve",
+    'seconds': "Wall time per solve (batches are split evenly per account)",
+}
+
+
+class Histogram(object):
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def labels(self):
+        ''' Names of the buckets, as Prometheus labels them '''
+        return [repr(bound) for bound in self.bounds] + ['+Inf']
+
+    def to_dict(self):
+        ''' Bucket counts keyed by upper bound (not cumulative) '''
+        return {'buckets': collections.OrderedDict(
+                    (label, count) for label, count
+                    in zip(self.labels(), self.counts)),
+                'count': self.count, 'sum': self.sum, 'max': self.max}
+
+
+class SolverStats(object):
+    ''' Histograms of per-solve solver counters, plus counts of solves and of
+    solves that failed to converge '''
+    def __init__(self):
+        self.solves = 0
+        self.failures = 0
+        self.histograms = collections.OrderedDict(
+            (name, Histogram(bounds)) for name, bounds in BUCKETS.items())
+
+    def record(self, iterations, evaluations, bracket_expansions, residual,
+               seconds=None, converged=True):
+        self.solves += 1
+        if not converged:
+            self.failures += 1
+        histograms = self.histograms
+        histograms['iterations'].observe(iterations)
+        histograms['evaluations'].observe(evaluations)
+        histograms['bracket_expansions'].observe(bracket_expansions)
+        if residual == residual:   # not nan
+            histograms['residual'].observe(abs(residual))
+        if seconds is not None:
+            histograms['seconds'].observe(seconds)
+
+    def to_dict(self):
+        return {'solves': self.solves, 'failures': self.failures,
+                'histograms': collections.OrderedDict(
+                    (name, histogram.to_dict())
+                    for name, histogram in self.histograms.items())}
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=1)
+
+    def to_prometheus(self, prefix='fincalc_solver'):
+        ''' Returns the stats in the Prometheus text exposition format '''
+        lines = ['# HELP {0}_solves_total Growth rate solves'.format(prefix),
+                 '# TYPE {0}_solves_total counter'.format(prefix),
+                 '{0}_solves_total {1}'.format(prefix, self.solves),
+                 '# HELP {0}_failures_total Solves that did not converge'
+                 .format(prefix),
+                 '# TYPE {0}_failures_total counter'.format(prefix),
+                 '{0}_failures_total {1}'.format(prefix, self.failures)]
+        for name, histogram in self.histograms.items():
+            metric = '{}_{}'.format(prefix, name)
+            lines.append('# HELP {} {}'.format(metric, DESCRIPTIONS[name]))
+            lines.append('# TYPE {} histogram'.format(metric))
+            cumulative = 0
+            for label, count in zip(histogram.labels(), histogram.counts):
+                cumulative += count
+                lines.append('{}_bucket{{le="{}"}} {}'.format(metric, label,
+                                                            cumulative))
+            lines.append('{}_sum {!r}'.format(metric, histogram.sum))
+            lines.append('{}_count {}'.format(metric, histogram.count))
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+'''
+Retirement parameter sweep
+By: Michael Asnes
+
+Evaluates the retirement calculator over every combination of a range of
+inputs (compounding rate x inflation x yearly contribution x ...) and
+streams the retirement funds to a CSV or .npy file.
+'''
+import csv
+import getopt
+import itertools
+import json
+import struct
+import sys
+from array import array
+
+import retirement
+
+DEFAULT_CHUNK_CELLS = 1000000
+
+# Axis order of the result. Funds only depend on the first four through
+# growth_factors(), so those are the outer loops and each (starting, yearly)
+# block is just a multiply-add.
+AXES = ('inflation_rate', 'compounding_rate', 'years_of_contribution',
+        'years_till_retirement', 'starting_contribution', 'yearly_contribution')
+
+DEFAULT_VALUES = {
+    'inflation_rate': retirement.DEFAULT_INFLATION_RATE,
+    'compounding_rate': retirement.DEFAULT_COMPOUNDING_RATE,
+    'years_of_contribution': retirement.DEFAULT_YEARS_OF_CONTRIBUTION,
+    'years_till_retirement': retirement.DEFAULT_YEARS_TILL_RETIREMENT,
+    'starting_contribution': retirement.DEFAULT_STARTING_CONTRIBUTION,
+    'yearly_contribution': retirement.DEFAULT_YEARLY_CONTRIBUTION,
+}
+
+INTEGER_AXES = ('years_of_contribution', 'years_till_retirement')
+
+
+def usage():
+    print(''' Usage: sweep.py [options] <output file>
+          -h show this help
+          -s starting contribution range
+          -i inflation rate range
+          -o compounding rate range
+          -c yearly contribution range
+          -n years of contribution range
+          -t years till retirement range
+          -f output format, csv or npy (defaults to the output file's extension)
+          -k cells to hold in memory before writing (defaults to {:,})
+
+          A range is start:stop:step (stop included), a comma separated
+          list of values, or a single value. Rates may be given as 'x%'.
+          Anything not given uses retirement.py's default.
+
+          npy output has axes ordered {}.
+          The values along each axis are written to <output file>.axes.json
+          '''.format(DEFAULT_CHUNK_CELLS, ', '.join(AXES)))
+
+
+def parse_range(arg, is_rate=False, is_integer=False):
+    ''' Returns the list of values described by a range argument '''
+    def to_number(value, set_to_one=is_rate):
+        if '%' in value:
+            return float(value.replace('%', '')) / 100 + (1 if set_to_one else 0)
+        return int(value) if is_integer else float(value)
+
+    if ':' in arg:
+        start, stop, step = arg.split(':')
+        start, stop, step = to_number(start), to_number(stop), to_number(step, False)
+        if step <= 0:
+            raise ValueError("Range step must be positive: {}".format(arg))
+        count = int((stop - start) / step + 1e-9) + 1
+        return [round(start + i * step, 12) for i in range(count)]
+    return [to_number(value) for value in arg.split(',')]
+
+
+def process_opts():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "s:i:o:c:n:t:f:k:h", ["help"])
+    except getopt.GetoptError as err:
+        print(str(err))
+        usage()
+        sys.exit(2)
+    option_axes = {'-s': 'starting_contribution', '-i': 'inflation_rate',
+                   '-o': 'compounding_rate', '-c': 'yearly_contribution',
+                   '-n': 'years_of_contribution', '-t': 'years_till_retirement'}
+    ranges = {axis: [value] for axis, value in DEFAULT_VALUES.items()}
+    output_format = None
+    chunk_cells = DEFAULT_CHUNK_CELLS
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            usage()
+            sys.exit()
+        elif o in option_axes:
+            axis = option_axes[o]
+            try:
+                ranges[axis] = parse_range(a, is_rate=axis.endswith('_rate'),
+                                           is_integer=axis in INTEGER_AXES)
+            except ValueError as err:
+                sys.exit(str(err))
+        elif o == "-f":
+            output_format = a
+        elif o == "-k":
+            chunk_cells = int(a)
+        else:
+            assert False, "unhandled option"
+    if len(args) != 1:
+        usage()
+        sys.exit(2)
+    output_path = args[0]
+    if output_format is None:
+        output_format = 'npy' if output_path.endswith('.npy') else 'csv'
+    if output_format not in ('csv', 'npy'):
+        sys.exit("Unknown output format {!r}".format(output_format))
+    return ranges, output_path, output_format, chunk_cells
+
+
+def sweep_blocks(ranges, chunk_cells=None):
+    ''' Yields (parameters, offset, funds) for each block of the grid, in
+    AXES order.
+
+    parameters holds the values of the first four axes. funds is an
+    array('d') of retirement funds for the cells offset, offset + 1, ... of
+    the len(starting_contribution) * len(yearly_contribution) inner grid,
+    starting contribution major. A block has at most chunk_cells values, so
+    large inner grids are split over several blocks.
+    '''
+    starting_contributions = ranges['starting_contribution']
+    yearly_contributions = ranges['yearly_contribution']
+    row_length = len(yearly_contributions)
+    inner_cells = len(starting_contributions) * row_length
+    block_cells = max(chunk_cells or inner_cells, 1)
+    for parameters in itertools.product(*(ranges[axis] for axis in AXES[:4])):
+        inflation_rate, compounding_rate, years_of_contribution, \
+            years_till_retirement = parameters
+        growth, annuity = retirement.growth_factors(
+            compounding_rate - inflation_rate + 1, years_of_contribution,
+            years_till_retirement)
+        for offset in range(0, inner_cells, block_cells):
+            end = min(offset + block_cells, inner_cells)
+            funds = array('d')
+            cell = offset
+            while cell < end:
+                row, column = divmod(cell, row_length)
+                stop = min(column + end - cell, row_length)
+                base = starting_contributions[row] * growth
+                funds.extend([base + c * annuity
+                              for c in yearly_contributions[column:stop]])
+                cell += stop - column
+            yield parameters, offset, funds
+
+
+def sweep(ranges, output_file, output_format,
+          chunk_cells=DEFAULT_CHUNK_CELLS):
+    ''' Streams the full grid to output_file (opened in binary mode for npy,
+    text mode for csv), holding at most chunk_cells values at once. '''
+    if output_format == 'npy':
+        write_npy_header(output_file, [len(ranges[axis]) for axis in AXES])
+        buffered = array('d')
+        for _, _, funds in sweep_blocks(ranges, chunk_cells):
+            if len(buffered) + len(funds) > chunk_cells:
+                write_npy_data(output_file, buffered)
+                buffered = array('d')
+            buffered.extend(funds)
+        write_npy_data(output_file, buffered)
+    else:
+        writer = csv.writer(output_file)
+        writer.writerow(AXES + ('retirement_funds',))
+        starting_contributions = ranges['starting_contribution']
+        yearly_contributions = ranges['yearly_contribution']
+        row_length = len(yearly_contributions)
+        rows = []
+        for parameters, offset, funds in sweep_blocks(ranges, chunk_cells):
+            if len(rows) + len(funds) > chunk_cells:
+                writer.writerows(rows)
+                rows = []
+            for cell, value in enumerate(funds, start=offset):
+                row, column = divmod(cell, row_length)
+                rows.append(parameters + (starting_contributions[row],
+                                          yearly_contributions[column], value))
+        writer.writerows(rows)
+
+
+def write_npy_header(output_file, shape):
+    ''' Writes a version 1.0 .npy header for a C ordered float64 array '''
+    if len(shape) == 1:
+        shape_str = '({},)'.format(shape[0])
+    else:
+        shape_str = '({})'.format(', '.join(str(size) for size in shape))
+    header = "{{'descr': '<f8', 'fortran_order': False, 'shape': {}, }}".format(
+        shape_str)
+    magic = b'\x93NUMPY\x01\x00'
+    # The header ends in a newline and the data starts on a 64 byte boundary
+    padding = -(len(magic) + 2 + len(header) + 1) % 64
+    header += ' ' * padding + '\n'
+    output_file.write(magic + struct.pack('<H', len(header))
+                      + header.encode('latin1'))
+
+
+def write_npy_data(output_file, values):
+    if sys.byteorder == 'big':
+        values = array('d', values)
+        values.byteswap()
+    output_file.write(values.tobytes())
+
+
+def main():
+    ranges, output_path, output_format, chunk_cells = process_opts()
+    cells = 1
+    for axis in AXES:
+        cells *= len(ranges[axis])
+    if output_format == 'npy':
+        with open(output_path, 'wb') as output_file:
+            sweep(ranges, output_file, output_format, chunk_cells)
+        with open(output_path + '.axes.json', 'w') as axes_file:
+            json.dump({'axes': AXES, 'values': ranges}, axes_file, indent=2)
+    else:
+        with open(output_path, 'w', newline='') as output_file:
+            sweep(ranges, output_file, output_format, chunk_cells)
+    print("Wrote {:,} retirement projections to {}".format(cells, output_path))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+'''
+tests for the sharded batch runner
+By: Michael Asnes
+'''
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import batch_runner
+import columnar
+import fincalc
+
+class TestCases(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.input_path = os.path.join(self.directory, 'requests.csv')
+        with open(self.input_path, 'w', newline='') as input_file:
+            input_file.write('command,beginning_value,ending_value,'
+                             'num_periods,note\n')
+            for i in range(1, 101):
+                # A note is an unknown parameter, so those rows are errors
+                input_file.write('cagr,{},{},{},{}\n'.format(
+                    i, 2 * i, i % 7, '"row\n{}"'.format(i) if i % 10 == 0
+                    else ''))
+        with open(self.input_path, newline='') as input_file:
+            expected = io.StringIO()
+            fincalc.run_batch(input_file, expected, 'csv')
+        self.expected = expected.getvalue().encode('utf-8')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def output(self, output_path):
+        with open(output_path, 'rb') as output_file:
+            return output_file.read()
+
+    def test_matches_fincalc_batch(self):
+        for workers in (1, 2):
+            output_path = os.path.join(self.directory, 'out.csv')
+            rows = batch_runner.run(self.input_path, output_path,
+                                    workers=workers, shard_rows=7,
+                                    progress_seconds=None)
+            self.assertEqual(rows, 100)
+            self.assertEqual(self.output(output_path), self.expected)
+            self.assertFalse(os.path.exists(
+                output_path + batch_runner.CHECKPOINT_SUFFIX))
+
+    def test_resume(self):
+        output_path = os.path.join(self.directory, 'out.csv')
+        evaluate_csv_row = fincalc.evaluate_csv_row
+        answered = []
+        def crash_midway(row, default_command=None):
+            if len(answered) == 45:
+                raise RuntimeError("crash")
+            answered.append(row)
+            evaluate_csv_row(row, default_command)
+        fincalc.evaluate_csv_row = crash_midway
+        try:
+            with self.assertRaises(RuntimeError):
+                batch_runner.run(self.input_path, output_path, workers=1,
+                                 shard_rows=10, progress_seconds=None)
+        finally:
+            fincalc.evaluate_csv_row = evaluate_csv_row
+        checkpoint = batch_runner.load_checkpoint(
+            output_path + batch_runner.CHECKPOINT_SUFFIX)
+        self.assertTrue(0 < checkpoint['rows'] <= 45)
+        # The crashed shard was never written
+        self.assertEqual(self.output(output_path).count(b'\ncagr,'),
+                         checkpoint['rows'])
+        rows = batch_runner.run(self.input_path, output_path, workers=1,
+                                shard_rows=10, resume=True,
+                                progress_seconds=None)
+        self.assertEqual(rows, 100)
+        self.assertEqual(self.output(output_path), self.expected)
+
+    def test_columnar_output(self):
+        output_path = os.path.join(self.directory, 'out.fcol')
+        batch_runner.run(self.input_path, output_path, default_command='cagr',
+                         workers=1, shard_rows=30, progress_seconds=None)
+        with columnar.ColumnarReader(output_path) as reader:
+            self.assertEqual(reader.columns, [('rate', 'd'), ('status', 'b')])
+            rates = reader.column('rate')
+            statuses = reader.column('status')
+        self.assertEqual(len(rates), 100)
+        # Every 7th row has 0 periods, and every 10th a note
+        self.assertEqual([i for i, status in enumerate(statuses, 1)
+                          if status == batch_runner.STATUS_ERROR],
+                         [i for i in range(1, 101) if i % 7 == 0 or i % 10 == 0])
+        self.assertAlmostEqual(rates[0], 1.0)
+        self.assertAlmostEqual(rates[1], 2 ** 0.5 - 1)
+
+    def test_progress(self):
+        progress = batch_runner.Progress(1000, output=io.StringIO())
+        progress.started -= 10
+        self.assertEqual(progress.describe(500, 250),
+                         '500 rows (25.0%), 50 rows/s, about 0:00:30 left')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+'''
+tests for the benchmark suite
+By: Michael Asnes
+'''
+import io
+import unittest
+import benchmark
+
+class TestCases(unittest.TestCase):
+    def test_run_and_save(self):
+        results = benchmark.run_benchmarks(['retirement.compound'], max_size=40,
+                                           repeats=2, max_seconds=0.5)
+        self.assertEqual([(r.name, r.size) for r in results],
+                         [('retirement.compound', 1), ('retirement.compound', 40)])
+        self.assertTrue(all(0 < r.best <= r.median for r in results))
+        saved = io.StringIO()
+        benchmark.save_results(results, saved)
+        saved.seek(0)
+        self.assertEqual(benchmark.load_results(saved), results)
+
+    def test_benchmarks_clean_up(self):
+        results = benchmark.run_benchmarks(
+            ['safe_withdrawal.SafeWithdrawIndex.lookup'], max_size=1,
+            repeats=1, max_seconds=0)
+        self.assertEqual(len(results), 1)
+
+    def test_compare(self):
+        def result(name, best):
+            return benchmark.BenchmarkResult(name, 10, 'inputs', 1, best, best)
+        baseline = [result('same', 1.0), result('slower', 1.0),
+                    result('faster', 1.0), result('gone', 1.0)]
+        current = [result('same', 1.05), result('slower', 1.2),
+                   result('faster', 0.5), result('added', 1.0)]
+        statuses = {c.name: c.status
+                    for c in benchmark.compare(baseline, current, 0.10)}
+        self.assertEqual(statuses, {'same': 'ok', 'slower': 'regression',
+                                    'faster': 'faster', 'added': 'new',
+                                    'gone': 'missing'})
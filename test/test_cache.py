@@ -0,0 +1,78 @@
+'''
+tests for the result cache
+By: Michael Asnes
+'''
+import os
+import shutil
+import tempfile
+import unittest
+import cache
+import fincalc
+
+class TestCases(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        fincalc.set_cache(None)
+        shutil.rmtree(self.directory)
+
+    def test_equivalent_parameters_share_a_key(self):
+        self.assertEqual(cache.canonical_key('net_increase',
+                                             {'rate': '7%', 'periods': '40'}),
+                         cache.canonical_key('net_increase',
+                                             {'periods': 40, 'rate': 1.07}))
+        self.assertNotEqual(cache.canonical_key('cagr', {'num_periods': '7%'}),
+                            cache.canonical_key('cagr', {'num_periods': 1.07}))
+
+    def test_lru_eviction(self):
+        results = cache.ResultCache(max_entries=2)
+        results.put('cagr', {'a': 1}, {'rate': 1})
+        results.put('cagr', {'a': 2}, {'rate': 2})
+        self.assertEqual(results.get('cagr', {'a': 1}), {'rate': 1})
+        results.put('cagr', {'a': 3}, {'rate': 3})
+        self.assertIsNone(results.get('cagr', {'a': 2}))
+        self.assertEqual(results.get('cagr', {'a': 1}), {'rate': 1})
+        self.assertEqual(results.stats()['evictions'], 1)
+        self.assertEqual(results.stats()['hits'], 2)
+        self.assertEqual(results.stats()['misses'], 1)
+
+    def test_persistence(self):
+        path = os.path.join(self.directory, 'results.sqlite')
+        with cache.ResultCache(path=path) as results:
+            results.put('net_increase', {'rate': '7%', 'periods': 40},
+                        {'multiple': 14.97})
+        with cache.ResultCache(path=path) as results:
+            self.assertEqual(results.get('net_increase',
+                                         {'rate': 1.07, 'periods': 40}),
+                             {'multiple': 14.97})
+            self.assertEqual(results.stats()['disk_hits'], 1)
+
+    def test_nearby_values_dont_share_a_key(self):
+        self.assertNotEqual(
+            cache.canonical_key('net_increase', {'rate': 1.0700000000001}),
+            cache.canonical_key('net_increase', {'rate': 1.07}))
+
+    def test_stale_versions_are_cleared(self):
+        path = os.path.join(self.directory, 'results.sqlite')
+        with cache.ResultCache(path=path, version=1) as results:
+            results.put('net_increase', {'rate': 1.07, 'periods': 40},
+                        {'multiple': 14.0})
+        with cache.ResultCache(path=path, version=1) as results:
+            self.assertIsNotNone(results.get('net_increase',
+                                             {'rate': 1.07, 'periods': 40}))
+        with cache.ResultCache(path=path, version=2) as results:
+            self.assertIsNone(results.get('net_increase',
+                                          {'rate': 1.07, 'periods': 40}))
+
+    def test_fincalc_uses_cache(self):
+        results = cache.ResultCache()
+        fincalc.set_cache(results)
+        first = fincalc.evaluate('net_increase', {'rate': '7%', 'periods': 40})
+        second = fincalc.evaluate('net_increase', {'rate': 1.07, 'periods': 40})
+        self.assertEqual(first, second)
+        self.assertEqual(results.stats()['hits'], 1)
+        with self.assertRaises(ValueError):
+            fincalc.evaluate('cagr', {'beginning_value': 0, 'ending_value': 1,
+                                      'num_periods': 1})
+        self.assertEqual(results.stats()['entries'], 1)
@@ -2,6 +2,7 @@
 tests for cagr calculator
 By: Michael Asnes
 '''
+import math
 import unittest
 import cagr
 
@@ -13,5 +14,40 @@ class TestCases(unittest.TestCase):
         pass
 
     def test_div_zero(self):
-        zero_begginning_value = cagr.cagr(1, 0, 1)
-        zero_periods = cagr.cagr(1, 1, 0)
+        with self.assertRaises(SystemExit):
+            cagr.CagrCalc(0, 1, 1).cagr()
+        with self.assertRaises(SystemExit):
+            cagr.CagrCalc(1, 1, 0).cagr()
+
+    def test_batch_matches_scalar(self):
+        beginning = [10000, 1, 250.5]
+        ending = [20000, 2, 100]
+        periods = [10, 1, 3]
+        rates, statuses = cagr.cagr_batch(beginning, ending, periods)
+        self.assertEqual(list(statuses), [cagr.STATUS_OK] * 3)
+        for rate, args in zip(rates, zip(beginning, ending, periods)):
+            self.assertAlmostEqual(rate, cagr.CagrCalc(*args).cagr())
+
+    def test_batch_bad_rows(self):
+        rates, statuses = cagr.cagr_batch([0, 0, 1, 1, -1, 100],
+                                          [0, 1, 1, 2, 1, 121],
+                                          [1, 1, 0, 1, 1, 2])
+        self.assertEqual(list(statuses), [cagr.STATUS_ZERO_TO_ZERO,
+                                          cagr.STATUS_INFINITE,
+                                          cagr.STATUS_ZERO_PERIODS,
+                                          cagr.STATUS_OK,
+                                          cagr.STATUS_NEGATIVE_RATIO,
+                                          cagr.STATUS_OK])
+        self.assertTrue(all(math.isnan(rate) for rate in rates[:3]))
+        self.assertAlmostEqual(rates[3], 1.0)
+        self.assertTrue(math.isnan(rates[4]))
+        self.assertAlmostEqual(rates[5], 0.1)
+
+    def test_batch_overflow(self):
+        rates, statuses = cagr.cagr_batch([1, 100, 1e-300], [1e10, 200, 1e300],
+                                          [0.001, 2, 0.5])
+        self.assertEqual(list(statuses), [cagr.STATUS_INFINITE, cagr.STATUS_OK,
+                                          cagr.STATUS_INFINITE])
+        self.assertTrue(math.isnan(rates[0]) and math.isnan(rates[2]))
+        self.assertAlmostEqual(rates[1], math.sqrt(2) - 1)
+        self.assertEqual(cagr.cagr_status(1, 1e10, 0.001), cagr.STATUS_INFINITE)
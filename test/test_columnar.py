@@ -0,0 +1,62 @@
+'''
+tests for the columnar results format
+By: Michael Asnes
+'''
+import os
+import shutil
+import tempfile
+import unittest
+from array import array
+import columnar
+
+COLUMNS = [('rate', 'd'), ('iterations', 'q'), ('status', 'b')]
+
+class TestCases(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'results.fcol')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip_and_append(self):
+        with open(self.path, 'wb') as output_file:
+            writer = columnar.ColumnarWriter(output_file, COLUMNS,
+                                             {0: 'ok', 1: 'failed'})
+            writer.write_chunk([array('d', [1.07, 0.5, 2.0]), [3, 4, 5],
+                                [0, 1, 0]])
+        with open(self.path, 'ab') as output_file:
+            columnar.ColumnarWriter(output_file, COLUMNS,
+                                    append=True).write_chunk([[1.1], [7], [0]])
+        with columnar.ColumnarReader(self.path) as reader:
+            self.assertEqual(reader.columns, COLUMNS)
+            self.assertEqual(reader.status_codes, {0: 'ok', 1: 'failed'})
+            self.assertEqual(len(reader), 4)
+            chunks = list(reader.chunks())
+            self.assertEqual([len(chunk['rate']) for chunk in chunks], [3, 1])
+            self.assertEqual(chunks[0]['rate'].format, 'd')
+            self.assertEqual(list(chunks[0]['iterations']), [3, 4, 5])
+            self.assertEqual(reader.column('rate'),
+                             array('d', [1.07, 0.5, 2.0, 1.1]))
+            self.assertEqual(list(reader.column('status')), [0, 1, 0, 0])
+            # Every chunk (and so every column) starts 8 byte aligned
+            for offset, _ in reader._chunk_rows():
+                self.assertEqual(offset % columnar.ALIGNMENT, 0)
+
+    def test_bad_files(self):
+        with open(self.path, 'wb') as output_file:
+            output_file.write(b'not a results file')
+        with self.assertRaises(ValueError):
+            columnar.ColumnarReader(self.path)
+        with open(self.path, 'wb') as output_file:
+            writer = columnar.ColumnarWriter(output_file, COLUMNS)
+            writer.write_chunk([[1.0, 2.0], [1, 2], [0, 0]])
+            output_file.truncate(output_file.tell() - 4)
+        with columnar.ColumnarReader(self.path) as reader:
+            with self.assertRaises(ValueError):
+                list(reader.chunks())
+        with self.assertRaises(ValueError):
+            columnar.encode_chunk(COLUMNS, [[1.0], [1, 2], [0]])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+'''
+tests for the retirement drawdown simulator
+By: Michael Asnes
+'''
+import unittest
+import decumulation
+import retirement
+
+PLAN = retirement.RetirementParameters(years_of_retirement=30)
+
+def steady(strategy, withdraw_rate, compounding_rate, **options):
+    ''' Every path gets the same yearly rates '''
+    return decumulation.DecumulationSimulator(
+        PLAN, 20, strategy, withdraw_rate, starting_funds=1000000,
+        compounding_rate=compounding_rate, seed=1, return_volatility=0.0,
+        inflation_volatility=0.0, **options).run()
+
+class TestCases(unittest.TestCase):
+    def test_inflation_adjusted_depletes(self):
+        # No real growth: 4.5% a year lasts 22 full years, then the rest
+        result = steady('inflation_adjusted', 0.045, PLAN.inflation_rate)
+        self.assertEqual(result.success_probability, 0)
+        self.assertEqual(result.depletion_years[22], 20)
+        self.assertEqual(sum(result.depletion_years), 20)
+        self.assertAlmostEqual(result.withdrawal_percentiles[50],
+                               1000000 / 30)
+        self.assertEqual(result.ending_funds_percentiles[95], 0)
+
+    def test_fixed_percent(self):
+        result = steady('fixed_percent', 0.04, 1.08)
+        self.assertEqual(result.success_probability, 1)
+        # 1.08 less 3% inflation
+        self.assertAlmostEqual(result.ending_funds_percentiles[50] / 1000000,
+                               (0.96 * 1.05) ** 30, places=9)
+
+    def test_guardrail_cuts_withdrawals(self):
+        # Losing 5% a year, guardrails make the money last longer
+        adjusted = steady('inflation_adjusted', 0.05, 0.98)
+        guarded = steady('guardrail', 0.05, 0.98)
+        self.assertEqual(adjusted.success_probability, 0)
+        self.assertEqual(guarded.success_probability, 1)
+        self.assertLess(guarded.withdrawal_percentiles[50],
+                        adjusted.first_withdrawal)
+
+    def test_seed_is_reproducible_across_chunks_and_workers(self):
+        single = decumulation.DecumulationSimulator(
+            PLAN, 500, 'guardrail', seed=7, chunk_size=100).run()
+        pooled = decumulation.DecumulationSimulator(
+            PLAN, 500, 'guardrail', seed=7, chunk_size=100, workers=2).run()
+        self.assertEqual(single, pooled)
+        self.assertAlmostEqual(single.success_probability,
+                               1 - sum(single.depletion_years) / 500)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+'''
+tests for the fincalc entry point
+By: Michael Asnes
+'''
+import io
+import json
+import unittest
+from unittest import mock
+import fincalc
+
+class TestCases(unittest.TestCase):
+    def test_json_batch(self):
+        requests = io.StringIO(
+            '{"command": "cagr", "beginning_value": 100, "ending_value": 121,'
+            ' "num_periods": 2}\n'
+            '\n'
+            '{"command": "net_increase", "rate": "10%", "periods": 2}\n'
+            '{"command": "cagr", "beginning_value": 0, "ending_value": 1,'
+            ' "num_periods": 1}\n'
+            '{"command": "retirement", "bad_parameter": 1}\n'
+            '{"command": ["cagr"]}\n'
+            '{"command": "net_increase", "rate": "10%", "periods": 1}\n')
+        output = io.StringIO()
+        fincalc.run_batch(requests, output)
+        responses = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(len(responses), 6)
+        self.assertEqual(responses[4],
+                         {'error': "Unknown batch command ['cagr']"})
+        self.assertAlmostEqual(responses[5]['result']['multiple'], 1.1)
+        self.assertAlmostEqual(responses[0]['result']['rate'], 0.1)
+        self.assertAlmostEqual(responses[1]['result']['multiple'], 1.21)
+        self.assertIn('error', responses[2])
+        self.assertIn('error', responses[3])
+
+    def test_batch_survives_unexpected_errors(self):
+        def broken(**parameters):
+            raise RuntimeError("broken calculator")
+        output = io.StringIO()
+        with mock.patch.dict(fincalc.BATCH_COMMANDS, {'broken': broken}):
+            fincalc.run_batch(io.StringIO(
+                '{"command": "broken"}\n'
+                '{"command": "net_increase", "rate": "10%", "periods": 2}\n'),
+                output)
+        responses = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(responses[0],
+                         {'error': "Internal error: broken calculator"})
+        self.assertIn('result', responses[1])
+
+    def test_non_finite_results_are_errors(self):
+        def reject(constant):
+            raise ValueError("Not JSON: {}".format(constant))
+        output = io.StringIO()
+        fincalc.run_batch(io.StringIO(
+            '{"command": "retirement", "starting_contribution": 1e308}\n'
+            '{"command": "net_increase", "rate": NaN, "periods": 2}\n'), output)
+        responses = [json.loads(line, parse_constant=reject)
+                     for line in output.getvalue().splitlines()]
+        self.assertEqual(responses[0], {
+            'error': "The retirement_funds is too large to calculate"})
+        self.assertIn('error', responses[1])
+        self.assertIn('Internal error',
+                      fincalc.dump_response({'result': {'rate': float('inf')}}))
+
+    def test_csv_batch(self):
+        requests = io.StringIO('beginning_value,ending_value,rate_of_change\n'
+                               '1,4,2\n'
+                               '1,4,0\n')
+        output = io.StringIO()
+        fincalc.run_batch(requests, output, 'csv', default_command='periods')
+        lines = output.getvalue().splitlines()
+        self.assertEqual(lines[0], 'beginning_value,ending_value,'
+                                   'rate_of_change,periods,error')
+        self.assertEqual(lines[1], '1,4,2,2.0,')
+        self.assertTrue(lines[2].startswith('1,4,0,,'))
@@ -0,0 +1,84 @@
+'''
+tests for the retirement goal seek
+By: Michael Asnes
+'''
+import io
+import json
+import unittest
+import fincalc
+import goal_seek
+import retirement
+
+PLAN = retirement.RetirementParameters(
+    starting_contribution=50000, compounding_rate=1.08,
+    yearly_contribution=10000, years_of_contribution=15,
+    years_till_retirement=30)
+
+class TestCases(unittest.TestCase):
+    def test_round_trips(self):
+        withdraw_per_year = retirement.withdraw_per_year(PLAN)
+        self.assertAlmostEqual(
+            goal_seek.required_contribution(PLAN, withdraw_per_year), 10000,
+            places=6)
+        self.assertAlmostEqual(
+            goal_seek.required_compounding_rate(PLAN, withdraw_per_year), 1.08,
+            places=10)
+        self.assertEqual(goal_seek.required_years_till_retirement(
+            PLAN, withdraw_per_year, keep_contributing=False), 30)
+        # Near a zero net rate, where the annuity formulas lose precision
+        flat = PLAN.replace(compounding_rate=1.0300001)
+        self.assertAlmostEqual(goal_seek.required_compounding_rate(
+            flat, retirement.withdraw_per_year(flat)), 1.0300001, places=10)
+
+    def test_whole_years(self):
+        withdraw_per_year = retirement.withdraw_per_year(PLAN) * 1.5
+        years = goal_seek.required_years_till_retirement(PLAN,
+                                                         withdraw_per_year)
+        def withdrawal_after(years):
+            return retirement.withdraw_per_year(PLAN.replace(
+                years_till_retirement=years, years_of_contribution=years))
+        self.assertGreaterEqual(withdrawal_after(int(years)), withdraw_per_year)
+        self.assertLess(withdrawal_after(int(years) - 1), withdraw_per_year)
+
+    def test_unreachable(self):
+        with self.assertRaises(ValueError):
+            goal_seek.required_contribution(
+                PLAN.replace(years_till_retirement=0), 100000)
+        with self.assertRaises(ValueError):
+            goal_seek.required_compounding_rate(
+                PLAN.replace(starting_contribution=0, yearly_contribution=0),
+                100000)
+        with self.assertRaises(ValueError):
+            # Losing money every year never gets there
+            goal_seek.required_years_till_retirement(
+                PLAN.replace(compounding_rate=0.9), 100000)
+        self.assertEqual(goal_seek.required_contribution(PLAN, 1), 0)
+
+    def test_batch(self):
+        plans = [PLAN, PLAN.replace(compounding_rate=1.05),
+                 PLAN.replace(years_till_retirement=0), PLAN]
+        withdrawals = [retirement.withdraw_per_year(plan) for plan in plans]
+        withdrawals[-1] = -1
+        rates, statuses = goal_seek.goal_seek_batch('rate', plans, withdrawals)
+        self.assertEqual(list(statuses), [
+            goal_seek.STATUS_OK, goal_seek.STATUS_OK,
+            goal_seek.STATUS_UNREACHABLE, goal_seek.STATUS_BAD_INPUT])
+        self.assertAlmostEqual(rates[0], 1.08, places=10)
+        self.assertAlmostEqual(rates[1], 1.05, places=10)
+        contributions, statuses = goal_seek.goal_seek_batch(
+            'contribution', plans[:2], withdrawals[:2])
+        self.assertEqual(list(statuses), [goal_seek.STATUS_OK] * 2)
+        self.assertAlmostEqual(contributions[1], 10000, places=6)
+
+        output_file = io.StringIO()
+        fincalc.run_batch(io.StringIO(json.dumps(
+            {'command': 'goal_seek', 'solve_for': 'contribution',
+             'withdraw_per_year': withdrawals[0], 'starting_contribution': 50000,
+             'compounding_rate': '8%', 'years_of_contribution': 15,
+             'years_till_retirement': 30}) + '\n'), output_file)
+        self.assertAlmostEqual(
+            json.loads(output_file.getvalue())['result']['required'], 10000,
+            places=6)
+
+if __name__ == '__main__':
+    unittest.main()
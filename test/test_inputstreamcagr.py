@@ -0,0 +1,124 @@
+'''
+tests for input stream cagr calculator
+By: Michael Asnes
+'''
+import math
+import unittest
+from unittest import mock
+import inputstreamcagr
+
+def loop_return_at_rate(begginning_value, contribution_per_period,
+                        num_periods, rate):
+    compounded_beg_val = begginning_value * (rate ** num_periods)
+    contribution_accumulator = contribution_per_period
+    for _ in range(num_periods - 1):
+        contribution_accumulator *= rate
+        contribution_accumulator += contribution_per_period
+    return contribution_accumulator + compounded_beg_val
+
+class TestCases(unittest.TestCase):
+    def test_closed_form_matches_loop(self):
+        for rate in (0.5, 0.999999, 1.0, 1.0000001, 1.07, 2.0):
+            for num_periods in (1, 10, 480):
+                value, _ = inputstreamcagr.annuity_value_and_derivative(
+                    10000, 500, num_periods, rate)
+                expected = loop_return_at_rate(10000, 500, num_periods, rate)
+                self.assertAlmostEqual(value / expected, 1.0, places=9)
+
+    def test_derivative(self):
+        step = 1e-6
+        for rate in (0.9, 1.0, 1.07):
+            _, derivative = inputstreamcagr.annuity_value_and_derivative(
+                10000, 500, 40, rate)
+            high, _ = inputstreamcagr.annuity_value_and_derivative(
+                10000, 500, 40, rate + step)
+            low, _ = inputstreamcagr.annuity_value_and_derivative(
+                10000, 500, 40, rate - step)
+            self.assertAlmostEqual(derivative / ((high - low) / (2 * step)),
+                                   1.0, places=5)
+
+    def test_round_trip(self):
+        for rate in (0.92, 1.0, 1.004, 1.07, 1.5):
+            for num_periods in (10, 480, 12000):
+                if num_periods * math.log(rate) > 700:
+                    continue    # ending value would overflow a float
+                ending_value = loop_return_at_rate(10000, 100, num_periods, rate)
+                isc = inputstreamcagr.InputStreamCagr(10000, ending_value, 100,
+                                                      num_periods)
+                self.assertAlmostEqual(isc.approximate_growth_rate(), rate,
+                                       places=9)
+
+    def test_shrinking_over_many_periods(self):
+        # s * r^n underflows to 0 partway through the solve
+        for num_periods in (2000, 12000):
+            isc = inputstreamcagr.InputStreamCagr(10000, 5000, 0, num_periods)
+            self.assertAlmostEqual(isc.approximate_growth_rate(),
+                                   0.5 ** (1 / num_periods), places=12)
+            rate = inputstreamcagr.InputStreamCagr(
+                10000, 5000, 1, num_periods).approximate_growth_rate()
+            self.assertAlmostEqual(
+                loop_return_at_rate(10000, 1, num_periods, rate) / 5000, 1.0,
+                places=9)
+
+    def test_tiny_and_zero_rates(self):
+        # rate - 1 rounds to -1 below about 1e-16
+        for rate in (0.0, 5e-324, 1e-300, 1e-17, 1e-16):
+            value, _ = inputstreamcagr.annuity_value_and_derivative(
+                10, 100, 3, rate)
+            self.assertAlmostEqual(value, 100, places=9)
+            log_value, _ = inputstreamcagr.log_annuity_value_and_derivative(
+                10, 100, 3000, rate)
+            self.assertAlmostEqual(log_value, math.log(100), places=9)
+        # Only the last contribution is left: a -100% return
+        self.assertAlmostEqual(inputstreamcagr.InputStreamCagr(
+            0, 100, 100, 2).approximate_growth_rate(), 0.0, places=9)
+
+    def test_impossible_inputs(self):
+        with self.assertRaises(ValueError):
+            inputstreamcagr.InputStreamCagr(10000, 50, 100, 10).approximate_growth_rate()
+        with self.assertRaises(ValueError):
+            inputstreamcagr.InputStreamCagr(10000, 20000, 100, 0).approximate_growth_rate()
+
+    def test_batch(self):
+        rates = [0.95, 1.0, 1.07]
+        endings = [loop_return_at_rate(10000, 100, 40, rate) for rate in rates]
+        solved, statuses, iterations = inputstreamcagr.approximate_growth_rates(
+            [10000] * 4, endings + [50], [100] * 4, [40] * 4)
+        for expected, rate in zip(rates, solved):
+            self.assertAlmostEqual(rate, expected, places=9)
+        self.assertTrue(math.isnan(solved[3]))
+        self.assertEqual(list(statuses), [inputstreamcagr.STATUS_CONVERGED] * 3
+                         + [inputstreamcagr.STATUS_NO_SOLUTION])
+        self.assertEqual(iterations[1], 0)
+        self.assertEqual(iterations[3], 0)
+        self.assertTrue(0 < iterations[2] < 20)
+
+        _, statuses, iterations = inputstreamcagr.approximate_growth_rates(
+            [10000], endings[2:], [100], [40], max_iterations=1)
+        self.assertEqual(list(statuses), [inputstreamcagr.STATUS_MAX_ITERATIONS])
+        self.assertEqual(list(iterations), [1])
+
+    def test_batch_bad_input(self):
+        solved, statuses, _ = inputstreamcagr.approximate_growth_rates(
+            [10000] * 4, [20000] * 4, [100, 100, 100, 'abc'],
+            [10, float('nan'), float('inf'), 10])
+        self.assertEqual(list(statuses), [inputstreamcagr.STATUS_CONVERGED]
+                         + [inputstreamcagr.STATUS_BAD_INPUT] * 3)
+        self.assertTrue(all(math.isnan(rate) for rate in solved[1:]))
+
+    def test_batch_failure_stays_with_its_account(self):
+        log_annuity = inputstreamcagr.log_annuity_value_and_derivative
+        def failing_for_long_accounts(s, c, num_periods, rate):
+            if num_periods == 2000:
+                raise ValueError("math domain error")
+            return log_annuity(s, c, num_periods, rate)
+        with mock.patch.object(inputstreamcagr,
+                               'log_annuity_value_and_derivative',
+                               failing_for_long_accounts):
+            solved, statuses, _ = inputstreamcagr.approximate_growth_rates(
+                [10000, 10000], [20000, 5000], [100, 0], [10, 2000])
+        self.assertEqual(list(statuses), [inputstreamcagr.STATUS_CONVERGED,
+                                          inputstreamcagr.STATUS_NO_SOLUTION])
+        self.assertAlmostEqual(
+            loop_return_at_rate(10000, 100, 10, solved[0]), 20000, places=6)
+        self.assertTrue(math.isnan(solved[1]))
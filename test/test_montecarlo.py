@@ -0,0 +1,76 @@
+'''
+tests for the monte carlo retirement simulator
+By: Michael Asnes
+'''
+import math
+import types
+import unittest
+import history
+import montecarlo
+import retirement
+
+def make_plan(**overrides):
+    fields = dict(starting_contribution=5000, inflation_rate=1.03,
+                  compounding_rate=1.08, yearly_contribution=10000,
+                  years_of_contribution=20, years_till_retirement=30)
+    fields.update(overrides)
+    fields['net_compounding_rate'] = (fields['compounding_rate']
+                                      - fields['inflation_rate'] + 1)
+    return types.SimpleNamespace(**fields)
+
+class TestCases(unittest.TestCase):
+    def test_no_volatility_matches_calculator(self):
+        plan = make_plan()
+        expected = retirement.CompoundingCalculator(plan).get_retirement_funds()
+        result = montecarlo.MonteCarloSimulator(
+            plan, 100, seed=1, return_volatility=0.0,
+            inflation_volatility=0.0).run()
+        self.assertEqual(result.paths, 100)
+        for funds in result.percentiles.values():
+            self.assertAlmostEqual(funds / expected, 1.0, places=9)
+
+    def test_seed_is_reproducible_across_chunks_and_workers(self):
+        plan = make_plan()
+        single = montecarlo.MonteCarloSimulator(plan, 500, seed=7,
+                                                chunk_size=100).run()
+        pooled = montecarlo.MonteCarloSimulator(plan, 500, seed=7,
+                                                chunk_size=100,
+                                                workers=2).run()
+        self.assertEqual(single, pooled)
+
+    def test_bootstrap(self):
+        years = [history.HistoryYear(2000 + i, 0.10, 0.04, 0.02)
+                 for i in range(5)]
+        plan = make_plan(compounding_rate=1.076, inflation_rate=1.02)
+        result = montecarlo.MonteCarloSimulator(
+            plan, 50, seed=2, distribution='bootstrap', history_years=years,
+            stock_allocation=0.6).run()
+        expected = retirement.CompoundingCalculator(
+            make_plan(compounding_rate=1.076, inflation_rate=1.02)
+        ).get_retirement_funds()
+        self.assertAlmostEqual(result.percentiles[5] / expected, 1.0, places=9)
+
+    def test_percentile(self):
+        self.assertEqual(montecarlo.percentile([1.0, 2.0, 3.0], 50), 2.0)
+        self.assertEqual(montecarlo.percentile([1.0, 2.0], 50), 1.5)
+
+    def test_target_option(self):
+        default = retirement.run_monte_carlo(retirement.DataHolder(
+            ['--monte-carlo=2000', '--seed=3']))
+        # Nothing to succeed at without a target
+        self.assertIsNone(default.target_funds)
+        self.assertIsNone(default.success_probability)
+        result = retirement.run_monte_carlo(retirement.DataHolder(
+            ['--monte-carlo=2000', '--seed=3',
+             '--target={}'.format(default.percentiles[25])]))
+        self.assertEqual(result.target_funds, default.percentiles[25])
+        self.assertAlmostEqual(result.success_probability, 0.75, places=2)
+
+    def test_normal_net_rate_spread(self):
+        plan = make_plan(years_of_contribution=0, years_till_retirement=1,
+                         starting_contribution=1)
+        result = montecarlo.MonteCarloSimulator(plan, 20000, seed=4).run()
+        self.assertAlmostEqual(result.percentiles[50], 1.05, delta=0.005)
+        # Both rates are drawn, so the spread is of their difference
+        self.assertAlmostEqual(result.percentiles[95] - result.percentiles[5],
+                               2 * 1.645 * math.hypot(0.15, 0.01), delta=0.01)
@@ -0,0 +1,68 @@
+'''
+tests for the periods for growth calculator
+By: Michael Asnes
+'''
+import math
+import unittest
+import inputstreamcagr
+import periods_for_growth
+
+class TestCases(unittest.TestCase):
+    def test_lump_sum(self):
+        calc = periods_for_growth.PeriodsForGrowthCalc(10000, 20000, 1.07)
+        self.assertAlmostEqual(calc.periods(), math.log(2) / math.log(1.07))
+
+    def test_contributions(self):
+        for rate in (1.07, 1.0000001, 1.0, 0.95):
+            isc = inputstreamcagr.InputStreamCagr(5000, 0, 1000, 30)
+            ending_value = isc._calculate_return_at_rate(rate)
+            calc = periods_for_growth.PeriodsForGrowthCalc(5000, ending_value,
+                                                           rate, 1000)
+            self.assertAlmostEqual(calc.periods(), 30, places=6)
+
+    def test_failures(self):
+        with self.assertRaises(ValueError):
+            periods_for_growth.PeriodsForGrowthCalc(1, 4, 0).periods()
+        with self.assertRaises(ValueError):
+            # Shrinking at 5% a period with 1000 added never reaches 100,000
+            periods_for_growth.PeriodsForGrowthCalc(0, 100000, 0.95,
+                                                    1000).periods()
+
+    def test_never_negative(self):
+        # Already there, growing or adding money every period
+        for args in ((4, 1, 1.05), (4, 1, 1.0, 100), (4, 1, 1.05, 100)):
+            self.assertEqual(
+                periods_for_growth.PeriodsForGrowthCalc(*args).periods(), 0)
+        # Shrinking down to a lower ending value takes time
+        self.assertAlmostEqual(periods_for_growth.PeriodsForGrowthCalc(
+            10000, 5000, 0.95).periods(), math.log(0.5) / math.log(0.95))
+        # Shrinking away from a higher ending value
+        with self.assertRaises(ValueError):
+            periods_for_growth.PeriodsForGrowthCalc(1, 4, 0.95).periods()
+        with self.assertRaises(ValueError):
+            periods_for_growth.PeriodsForGrowthCalc(1, 4, 1.05, -1).periods()
+        periods, statuses = periods_for_growth.periods_batch(
+            [4, 4, 1, 1], [1, 1, 4, 4], [1.05, 1.0, 0.95, 1.05], [0, 100, 0, -1])
+        self.assertEqual(list(periods[:2]), [0, 0])
+        self.assertEqual(list(statuses), [
+            periods_for_growth.STATUS_OK, periods_for_growth.STATUS_OK,
+            periods_for_growth.STATUS_UNREACHABLE,
+            periods_for_growth.STATUS_NEGATIVE_CONTRIBUTION])
+
+    def test_batch(self):
+        periods, statuses = periods_for_growth.periods_batch(
+            [1, 1, 1, 5000, 0, 1, 1],
+            [4, 4, 4, 35000, 100000, 2, float('inf')],
+            [2, 0, -1, 1.0, 0.95, 1.0, 1.1],
+            [0, 0, 0, 1000, 1000, 0, 0])
+        self.assertEqual(list(statuses), [
+            periods_for_growth.STATUS_OK, periods_for_growth.STATUS_ZERO_RATE,
+            periods_for_growth.STATUS_NEGATIVE_RATE,
+            periods_for_growth.STATUS_OK, periods_for_growth.STATUS_UNREACHABLE,
+            periods_for_growth.STATUS_UNREACHABLE,
+            periods_for_growth.STATUS_NOT_FINITE])
+        self.assertAlmostEqual(periods[0], 2)
+        self.assertAlmostEqual(periods[3], 30)
+        self.assertTrue(all(math.isnan(p) for p in periods[1:3] + periods[4:]))
+        lump_sums, _ = periods_for_growth.periods_batch([1], [4], [2])
+        self.assertAlmostEqual(lump_sums[0], 2)
@@ -0,0 +1,65 @@
+'''
+tests for the multi-account portfolio projections
+By: Michael Asnes
+'''
+import io
+import unittest
+import portfolio
+import retirement
+
+class TestCases(unittest.TestCase):
+    def test_matches_retirement(self):
+        accounts = portfolio.Portfolio()
+        accounts.add_account('a', 'tax_free', starting_balance=50000,
+                             yearly_contribution=5000, years_of_contribution=20)
+        accounts.add_account('a', 'tax_deferred', yearly_contribution=30000)
+        accounts.add_account('b', 'taxable', tax_drag=0.0)
+        projection = portfolio.project(accounts)
+        expected = [
+            retirement.retirement_funds(retirement.RetirementParameters(
+                starting_contribution=50000, yearly_contribution=5000,
+                years_of_contribution=20)),
+            # Capped at the tax deferred limit
+            retirement.retirement_funds(retirement.RetirementParameters(
+                yearly_contribution=23000)),
+            retirement.retirement_funds(retirement.RetirementParameters())]
+        for funds, value in zip(expected, projection.account_funds):
+            self.assertAlmostEqual(value, funds, delta=funds * 1e-12)
+        self.assertEqual(list(projection.account_contributed),
+                         [150000, 23000 * 40, 10000 * 40])
+        self.assertAlmostEqual(projection.household_funds[0],
+                               expected[0] + expected[1], places=4)
+        self.assertAlmostEqual(projection.household_after_tax[0],
+                               expected[0] + expected[1] * 0.78, places=4)
+        self.assertAlmostEqual(projection.household_withdraw_per_year[1],
+                               expected[2] * retirement.SAFE_WITHDRAW_RATE)
+
+    def test_tax_drag(self):
+        accounts = portfolio.Portfolio()
+        accounts.add_account(1, 'taxable', compounding_rate=1.10,
+                             inflation_rate=1.02, tax_drag=0.2)
+        self.assertAlmostEqual(portfolio.after_tax_growth_rates(accounts)[0],
+                               1.06)
+        with self.assertRaises(ValueError):
+            accounts.add_account(1, 'savings')
+        with self.assertRaises(ValueError):
+            accounts.add_account(1, 'taxable', tax_drag=1.5)
+        self.assertEqual(len(accounts), 1)
+
+    def test_read_accounts(self):
+        accounts = portfolio.read_accounts(io.StringIO(
+            'household,account_type,yearly_contribution,compounding_rate\n'
+            'smith,tax_free,10000,7%\n'
+            'smith,taxable,,\n'
+            'jones,tax_deferred,5000,\n'))
+        self.assertEqual(accounts.households, ['smith', 'jones'])
+        self.assertEqual(list(accounts.household), [0, 0, 1])
+        self.assertEqual(list(accounts.contribution_limit),
+                         [7000, float('inf'), 23000])
+        self.assertAlmostEqual(accounts.compounding_rate[0], 1.07)
+        with self.assertRaises(ValueError):
+            portfolio.read_accounts(io.StringIO(
+                'household,account_type,years_of_contribution\nx,taxable,ten\n'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+'''
+tests for the retirement calculator
+By: Michael Asnes
+'''
+import contextlib
+import io
+import unittest
+import retirement
+
+def loop_retirement_funds(parameters):
+    funds = parameters.starting_contribution
+    for i in range(parameters.years_till_retirement):
+        funds *= parameters.net_compounding_rate
+        if i < parameters.years_of_contribution:
+            funds += parameters.yearly_contribution
+    return funds
+
+class TestCases(unittest.TestCase):
+    def test_parameters_are_read_only(self):
+        parameters = retirement.RetirementParameters()
+        with self.assertRaises(Exception):
+            parameters.yearly_contribution = 5
+        with self.assertRaises(Exception):
+            parameters.not_a_field = 5
+        changed = parameters.replace(years_of_contribution=35)
+        self.assertEqual(changed.years_of_contribution, 35)
+        self.assertEqual(parameters.years_of_contribution,
+                         retirement.DEFAULT_YEARS_OF_CONTRIBUTION)
+        self.assertEqual(parameters, retirement.RetirementParameters())
+        self.assertNotEqual(parameters, changed)
+
+    def test_calculate(self):
+        parameters = retirement.RetirementParameters(
+            starting_contribution=50000, compounding_rate=1.08,
+            yearly_contribution=10000, years_of_contribution=15,
+            years_till_retirement=30)
+        result = retirement.calculate(parameters, num_multipliers=4)
+        self.assertAlmostEqual(result.retirement_funds,
+                               loop_retirement_funds(parameters), places=6)
+        self.assertEqual(result.money_contributed, 200000)
+        self.assertEqual(result.safe_withdraw_rate, .0381)
+        self.assertAlmostEqual(result.withdraw_per_year,
+                               result.retirement_funds * .0381)
+        self.assertEqual([years for _, years in result.multipliers],
+                         [0, 5, 10, 15])
+        self.assertAlmostEqual(result.multipliers[0][0], 1.05 ** 30)
+
+    def test_contributions_stop_at_retirement(self):
+        parameters = retirement.RetirementParameters(years_of_contribution=40,
+                                                     years_till_retirement=25)
+        self.assertAlmostEqual(retirement.retirement_funds(parameters),
+                               loop_retirement_funds(parameters), places=6)
+
+    def test_data_holder_parses_argv(self):
+        data_holder = retirement.DataHolder(['-s', '50000', '-o', '8%',
+                                             '-n', '15', '-t', '30'])
+        self.assertEqual(data_holder.parameters,
+                         retirement.RetirementParameters(
+                             starting_contribution=50000, compounding_rate=1.08,
+                             years_of_contribution=15, years_till_retirement=30))
+
+    def test_monte_carlo_options_need_monte_carlo(self):
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            with self.assertRaises(SystemExit) as context:
+                retirement.DataHolder(['--target=1000000'])
+        self.assertEqual(context.exception.code, 2)
+        self.assertIn("--target only applies with --monte-carlo",
+                      output.getvalue())
+        data_holder = retirement.DataHolder(['--monte-carlo=10',
+                                             '--target=1000000'])
+        self.assertEqual(data_holder.monte_carlo_options['target'], '1000000')
+
+    def test_sensitivities_match_finite_differences(self):
+        step = 1e-6
+        def funds(parameters, **changes):
+            # The closed form takes real numbers of years
+            values = dict(starting_contribution=parameters.starting_contribution,
+                          net_compounding_rate=parameters.net_compounding_rate,
+                          yearly_contribution=parameters.yearly_contribution,
+                          years_of_contribution=parameters.years_of_contribution,
+                          years_till_retirement=parameters.years_till_retirement)
+            for name, change in changes.items():
+                values[name] += change
+            return retirement.retirement_funds_closed_form(**values)
+        for parameters in (retirement.RetirementParameters(
+                               starting_contribution=50000,
+                               years_of_contribution=15),
+                           retirement.RetirementParameters(
+                               compounding_rate=1.0300001),
+                           retirement.RetirementParameters(
+                               years_of_contribution=50)):
+            sensitivities = retirement.funds_sensitivities(parameters)
+            self.assertAlmostEqual(sensitivities.retirement_funds,
+                                   retirement.retirement_funds(parameters))
+            for name, field in (('net_compounding_rate', 'compounding_rate'),
+                                ('starting_contribution',) * 2,
+                                ('yearly_contribution',) * 2,
+                                ('years_of_contribution',) * 2,
+                                ('years_till_retirement',) * 2):
+                if name.startswith('years'):
+                    # One sided where contributions stop at retirement
+                    slope = (funds(parameters, **{name: step})
+                             - funds(parameters)) / step
+                else:
+                    slope = (funds(parameters, **{name: step})
+                             - funds(parameters, **{name: -step})) / (2 * step)
+                self.assertAlmostEqual(getattr(sensitivities, field), slope,
+                                       delta=abs(slope) * 1e-5
+                                       + sensitivities.retirement_funds * 1e-9)
+            self.assertEqual(sensitivities.inflation_rate,
+                             -sensitivities.compounding_rate)
+
+    def test_sensitivities_batch(self):
+        plans = [retirement.RetirementParameters(),
+                 retirement.RetirementParameters(starting_contribution=50000),
+                 retirement.RetirementParameters()]
+        columns = retirement.sensitivities_batch(plans)
+        for index, parameters in enumerate(plans):
+            self.assertEqual(
+                tuple(column[index] for column in columns),
+                tuple(retirement.funds_sensitivities(parameters)))
+
+    def test_ledger(self):
+        for parameters in (
+                retirement.RetirementParameters(starting_contribution=50000),
+                retirement.RetirementParameters(years_of_contribution=15,
+                                                years_till_retirement=30),
+                retirement.RetirementParameters(years_of_contribution=50,
+                                                years_till_retirement=10),
+                retirement.RetirementParameters(years_till_retirement=0)):
+            rows = list(retirement.ledger(parameters))
+            columns = retirement.ledger_arrays(parameters)
+            self.assertEqual(len(rows), max(parameters.years_till_retirement, 0) + 1)
+            for row, values in zip(rows, zip(*columns)):
+                self.assertEqual(row.year, values[0])
+                for expected, value in zip(row[1:], values[1:]):
+                    self.assertAlmostEqual(value, expected,
+                                           delta=abs(expected) * 1e-12)
+            self.assertAlmostEqual(rows[-1].balance,
+                                   retirement.retirement_funds(parameters),
+                                   delta=rows[-1].balance * 1e-12)
+            self.assertEqual(columns.nominal_balance[0],
+                             parameters.starting_contribution)
+        self.assertEqual(list(retirement.cumulative_growth(1.07, 40)),
+                         [retirement.compound(1, 1.07, years)
+                          for years in range(41)])
@@ -0,0 +1,100 @@
+'''
+tests for the rolling window cagr
+By: Michael Asnes
+'''
+import io
+import math
+import os
+import random
+import tempfile
+import unittest
+from array import array
+import cagr
+import rolling_cagr
+
+class TestCases(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(7)
+        self.prices = [100.0]
+        for _ in range(99):
+            self.prices.append(self.prices[-1] * math.exp(rng.gauss(0, 0.02)))
+        self.prices[40] = 0.0
+
+    def expected(self, windows, periods_per_year):
+        columns = []
+        for years in windows:
+            lag = int(round(years * periods_per_year))
+            column = []
+            for index, price in enumerate(self.prices):
+                start = index - lag
+                if start < 0 or price <= 0 or self.prices[start] <= 0:
+                    column.append(math.nan)
+                else:
+                    column.append(cagr.CagrCalc(self.prices[start], price,
+                                                years).cagr())
+            columns.append(column)
+        return columns
+
+    def assertColumnsEqual(self, columns, expected):
+        self.assertEqual(len(columns), len(expected))
+        for column, expected_column in zip(columns, expected):
+            self.assertEqual(len(column), len(expected_column))
+            for rate, expected_rate in zip(column, expected_column):
+                if math.isnan(expected_rate):
+                    self.assertTrue(math.isnan(rate))
+                else:
+                    self.assertAlmostEqual(rate, expected_rate, places=12)
+
+    def test_matches_cagr_calc(self):
+        windows = (1, 2.5, 7)
+        expected = self.expected(windows, 4)
+        for chunk_size in (1, 3, 10, 29, 1000):
+            rolling = rolling_cagr.RollingCagr(windows, 4)
+            columns = [array('d') for _ in windows]
+            for start in range(0, len(self.prices), chunk_size):
+                chunk = self.prices[start:start + chunk_size]
+                for column, rates in zip(columns, rolling.update_chunk(chunk)):
+                    column.extend(rates)
+            self.assertColumnsEqual(columns, expected)
+
+        rolling = rolling_cagr.RollingCagr(windows, 4)
+        rows = [rolling.update(price) for price in self.prices]
+        self.assertColumnsEqual(list(zip(*rows)), expected)
+
+    def test_csv_tickers_start_over(self):
+        lines = ['ticker,date,price']
+        for ticker in ('AAA', 'BBB'):
+            lines.extend('{},{},{!r}'.format(ticker, day, price)
+                         for day, price in enumerate(self.prices))
+        output = io.StringIO()
+        rolling_cagr.rolling_cagr_csv(io.StringIO('\n'.join(lines) + '\n'),
+                                      output, windows=(1, 3),
+                                      periods_per_year=12, chunk_size=16)
+        rows = output.getvalue().splitlines()
+        self.assertEqual(rows[0], 'ticker,date,price,cagr_1y,cagr_3y')
+        self.assertEqual(len(rows), 201)
+        self.assertEqual([row.replace('AAA', 'BBB', 1) for row in rows[1:101]],
+                         rows[101:201])
+        # The 1 year window fills up on day 12, the 3 year one on day 36
+        self.assertEqual(rows[12].split(',')[3:], ['', ''])
+        self.assertNotEqual(rows[13].split(',')[3], '')
+        self.assertEqual(rows[13].split(',')[4], '')
+        self.assertNotEqual(rows[37].split(',')[4], '')
+
+    def test_binary_file(self):
+        windows = (2, 5)
+        directory = tempfile.mkdtemp()
+        prices_path = os.path.join(directory, 'prices.f64')
+        try:
+            with open(prices_path, 'wb') as prices_file:
+                array('d', self.prices).tofile(prices_file)
+            output = io.BytesIO()
+            with open(prices_path, 'rb') as prices_file:
+                rolling_cagr.rolling_cagr_binary(prices_file, output, windows,
+                                                 6, chunk_size=17)
+        finally:
+            os.remove(prices_path)
+            os.rmdir(directory)
+        rates = array('d', output.getvalue())
+        self.assertColumnsEqual([rates[0::2], rates[1::2]],
+                                self.expected(windows, 6))
@@ -0,0 +1,64 @@
+'''
+tests for historical safe withdrawal rates
+By: Michael Asnes
+'''
+import os
+import random
+import shutil
+import tempfile
+import unittest
+import history
+import safe_withdrawal
+
+def make_history(num_years, seed=5):
+    rng = random.Random(seed)
+    return [history.HistoryYear(1900 + i, rng.gauss(0.09, 0.18),
+                                rng.gauss(0.04, 0.07), rng.gauss(0.03, 0.03))
+            for i in range(num_years)]
+
+def simulate(returns, withdraw_rate):
+    balance = 1.0
+    for real_return in returns:
+        balance = (balance - withdraw_rate) * (1 + real_return)
+    return balance
+
+class TestCases(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'swr.idx')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_cohort_rate_exactly_depletes(self):
+        returns = safe_withdrawal.real_returns(make_history(30), 0.6)
+        rates = safe_withdrawal.cohort_rates(returns, 3, 1, 20)
+        self.assertEqual(len(rates), 20)
+        for years, rate in enumerate(rates, 1):
+            self.assertAlmostEqual(simulate(returns[3:3 + years], rate), 0.0)
+
+    def test_lookup(self):
+        history_years = make_history(40)
+        safe_withdrawal.build_index(history_years, self.path, max_years=30)
+        returns = safe_withdrawal.real_returns(history_years, 0.5)
+        worst = min(safe_withdrawal.cohort_rates(returns, start, 30, 30)[0]
+                    for start in range(11))
+        with safe_withdrawal.SafeWithdrawIndex(self.path) as index:
+            self.assertAlmostEqual(index.lookup(30, 0.5, 1.0), worst)
+            self.assertLessEqual(index.lookup(30, 0.5, 1.0),
+                                 index.lookup(30, 0.5, 0.9))
+            with self.assertRaises(KeyError):
+                index.lookup(30, 0.55, 1.0)
+            with self.assertRaises(KeyError):
+                index.lookup(31, 0.5, 1.0)
+
+    def test_update_matches_rebuild(self):
+        history_years = make_history(60)
+        safe_withdrawal.build_index(history_years, self.path, max_years=25)
+        with open(self.path, 'rb') as index_file:
+            expected = index_file.read()
+
+        safe_withdrawal.build_index(history_years[:50], self.path, max_years=25)
+        safe_withdrawal.update_index(history_years, self.path)
+        with open(self.path, 'rb') as index_file:
+            self.assertEqual(index_file.read(), expected)
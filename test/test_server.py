@@ -0,0 +1,77 @@
+'''
+tests for the calculation server
+By: Michael Asnes
+'''
+import asyncio
+import unittest
+from unittest import mock
+import server
+
+class TestCases(unittest.TestCase):
+    def test_evaluate_batch(self):
+        responses = server.evaluate_batch([
+            {'command': 'cagr', 'beginning_value': 100, 'ending_value': 121,
+             'num_periods': 2},
+            {'command': 'inputstreamcagr', 'beginning_value': 100,
+             'ending_value': 121, 'contribution_per_period': 0,
+             'num_periods': 2},
+            {'command': 'cagr', 'beginning_value': 0, 'ending_value': 1,
+             'num_periods': 1},
+            {'command': 'cagr', 'beginning_value': 'abc', 'ending_value': 1,
+             'num_periods': 1},
+            {'command': 'inputstreamcagr', 'beginning_value': 100,
+             'ending_value': 1, 'contribution_per_period': 10,
+             'num_periods': 2},
+            {'command': 'net_increase', 'rate': '10%', 'periods': 2},
+            ['not', 'a', 'request'],
+        ])
+        self.assertAlmostEqual(responses[0]['result']['rate'], 0.1)
+        self.assertAlmostEqual(responses[1]['result']['rate'], 1.1)
+        self.assertEqual(responses[2], {'error': "Your returns were infinite"})
+        self.assertIn('error', responses[3])
+        self.assertIn('last contribution', responses[4]['error'])
+        self.assertAlmostEqual(responses[5]['result']['multiple'], 1.21)
+        self.assertIn('error', responses[6])
+
+    def test_bad_request_only_fails_itself(self):
+        good = {'command': 'inputstreamcagr', 'beginning_value': 100,
+                'ending_value': 121, 'contribution_per_period': 0,
+                'num_periods': 2}
+        def broken_kernel(*columns):
+            raise ValueError("math domain error")
+        with mock.patch.dict(server.BATCH_KERNELS, {'inputstreamcagr': (
+                server.BATCH_KERNELS['inputstreamcagr'][0], broken_kernel)}):
+            async def run():
+                batcher = server.MicroBatcher(batch_size=3, latency_budget=1)
+                futures = [batcher.submit(request) for request in
+                           (good, {'command': ['x']}, {'command': 'nope'})]
+                batcher.start()
+                responses = await asyncio.gather(*futures)
+                await batcher.stop()
+                return responses
+            responses = asyncio.run(run())
+        # The kernel failed, so the good request was answered on its own
+        self.assertAlmostEqual(responses[0]['result']['rate'], 1.1)
+        self.assertEqual(responses[1], {'error': "Unknown batch command ['x']"})
+        self.assertEqual(responses[2], {'error': "Unknown batch command 'nope'"})
+
+    def test_micro_batching_and_backpressure(self):
+        async def run():
+            batcher = server.MicroBatcher(batch_size=10, latency_budget=0.05,
+                                          max_queue=25)
+            futures = [batcher.submit({'command': 'cagr',
+                                       'beginning_value': 1,
+                                       'ending_value': 2 ** i,
+                                       'num_periods': 1})
+                       for i in range(25)]
+            with self.assertRaises(server.QueueFull):
+                batcher.submit({})
+            batcher.start()
+            responses = await asyncio.gather(*futures)
+            await batcher.stop()
+            return batcher, responses
+        batcher, responses = asyncio.run(run())
+        self.assertEqual(batcher.batches, 3)
+        self.assertEqual(batcher.requests, 25)
+        self.assertEqual([r['result']['rate'] for r in responses],
+                         [2 ** i - 1 for i in range(25)])
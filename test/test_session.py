@@ -0,0 +1,58 @@
+'''
+tests for the incremental what-if session
+By: Michael Asnes
+'''
+import io
+import unittest
+import retirement
+import session
+
+PLAN = retirement.RetirementParameters(
+    starting_contribution=50000, compounding_rate=1.08,
+    yearly_contribution=10000, years_of_contribution=30,
+    years_till_retirement=40)
+
+class TestCases(unittest.TestCase):
+    def assertMatches(self, whatIf):
+        parameters = whatIf.parameters
+        self.assertEqual(len(whatIf.balances),
+                         parameters.years_till_retirement + 1)
+        for year, balance in enumerate(whatIf.balances):
+            expected = retirement.retirement_funds(parameters.replace(
+                years_till_retirement=year))
+            self.assertAlmostEqual(balance, expected, delta=expected * 1e-12)
+        self.assertEqual(whatIf.multipliers(3),
+                         retirement.multipliers(parameters, 3))
+
+    def test_reuses_prefix(self):
+        whatIf = session.RetirementSession(PLAN)
+        self.assertEqual(whatIf.last_update, (0, 40))
+        self.assertMatches(whatIf)
+        # Contributions match for the first 25 years
+        self.assertEqual(whatIf.change(years_of_contribution=25), (25, 15))
+        self.assertMatches(whatIf)
+        self.assertEqual(whatIf.change(years_till_retirement=45), (40, 5))
+        self.assertMatches(whatIf)
+        self.assertEqual(whatIf.change(years_till_retirement=35), (35, 0))
+        self.assertEqual(whatIf.change(years_of_retirement=40), (35, 0))
+        self.assertEqual(whatIf.change(compounding_rate=1.07), (0, 35))
+        self.assertMatches(whatIf)
+        self.assertEqual(whatIf.change(yearly_contribution=0), (0, 35))
+        # Without contributions, how long they'd go on doesn't matter
+        self.assertEqual(whatIf.change(years_of_contribution=10), (35, 0))
+        self.assertMatches(whatIf)
+
+    def test_shell(self):
+        output = io.StringIO()
+        shell = session.SessionShell(session.RetirementSession(PLAN),
+                                     stdin=io.StringIO('n 25\no 7%\nbogus\n'),
+                                     stdout=output)
+        shell.cmdloop(intro='')
+        self.assertIn('(reused 25 of 40 years, recomputed 15)',
+                      output.getvalue())
+        self.assertIn("Unknown command 'bogus'", output.getvalue())
+        self.assertEqual(shell.session.parameters, PLAN.replace(
+            years_of_contribution=25, compounding_rate=1.07))
+
+if __name__ == '__main__':
+    unittest.main()
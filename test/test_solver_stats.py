@@ -0,0 +1,65 @@
+'''
+tests for the growth rate solver statistics
+By: Michael Asnes
+'''
+import json
+import unittest
+import inputstreamcagr
+import solver_stats
+
+class TestCases(unittest.TestCase):
+    def setUp(self):
+        self.stats = solver_stats.SolverStats()
+        inputstreamcagr.set_solver_stats(self.stats)
+
+    def tearDown(self):
+        inputstreamcagr.set_solver_stats(None)
+
+    def test_records_solves(self):
+        isc = inputstreamcagr.InputStreamCagr(10000, 0, 1000, 480)
+        ending_value = isc._calculate_return_at_rate(1.006)
+        rate = inputstreamcagr.InputStreamCagr(
+            10000, ending_value, 1000, 480).approximate_growth_rate()
+        self.assertAlmostEqual(rate, 1.006, places=9)
+        inputstreamcagr.approximate_growth_rates([10000, 1], [ending_value, 1],
+                                                 [1000, 0], [480, 1])
+        self.assertEqual(self.stats.solves, 3)
+        self.assertEqual(self.stats.failures, 0)
+        histograms = self.stats.histograms
+        self.assertEqual(histograms['seconds'].count, 3)
+        self.assertLess(histograms['residual'].max, 1e-11)
+        self.assertLessEqual(histograms['iterations'].max, 10)
+        # Every step evaluates once, on top of the bracketing evaluations
+        self.assertEqual(histograms['evaluations'].sum,
+                         histograms['iterations'].sum + 2 + 2 + 1)
+
+        dumped = json.loads(self.stats.to_json())
+        self.assertEqual(dumped['histograms']['iterations']['count'], 3)
+        prometheus = self.stats.to_prometheus()
+        self.assertIn('fincalc_solver_solves_total 3\n', prometheus)
+        self.assertIn('fincalc_solver_iterations_bucket{le="+Inf"} 3\n',
+                      prometheus)
+
+    def test_iteration_cap(self):
+        isc = inputstreamcagr.InputStreamCagr(10000, 1e6, 1000, 480)
+        with self.assertRaises(ArithmeticError) as caught:
+            isc.approximate_growth_rate(max_iterations=2)
+        self.assertIn('did not converge within 2 iterations',
+                      str(caught.exception))
+        self.assertEqual(self.stats.failures, 1)
+
+    def test_bracket_cap(self):
+        isc = inputstreamcagr.InputStreamCagr(1e-300, 1e300, 0, 1)
+        with self.assertRaises(ArithmeticError):
+            isc.approximate_growth_rate()
+        # Stopped where doubling the rate again would overflow
+        expansions = self.stats.histograms['bracket_expansions'].max
+        self.assertTrue(1000 < expansions
+                        < inputstreamcagr.MAX_BRACKET_EXPANSIONS)
+        # Needs a rate of 1e306 per period, past 1.05 doubled 1000 times
+        self.assertAlmostEqual(inputstreamcagr.InputStreamCagr(
+            100, 1e308, 0, 1).approximate_growth_rate() / 1e306, 1.0,
+            places=9)
+        _, statuses, _ = inputstreamcagr.approximate_growth_rates(
+            [1e-300], [1e300], [0], [1])
+        self.assertEqual(list(statuses), [inputstreamcagr.STATUS_MAX_ITERATIONS])
@@ -0,0 +1,68 @@
+'''
+tests for the retirement parameter sweep
+By: Michael Asnes
+'''
+import io
+import struct
+import types
+import unittest
+import retirement
+import sweep
+
+class TestCases(unittest.TestCase):
+    def test_parse_range(self):
+        self.assertEqual(sweep.parse_range('5%:7%:1%', is_rate=True),
+                         [1.05, 1.06, 1.07])
+        self.assertEqual(sweep.parse_range('10:30:10', is_integer=True),
+                         [10, 20, 30])
+        self.assertEqual(sweep.parse_range('1.02,1.03'), [1.02, 1.03])
+
+    def test_npy_matches_calculator(self):
+        ranges = {'inflation_rate': [1.02, 1.03],
+                  'compounding_rate': [1.07, 1.095],
+                  'years_of_contribution': [10, 40],
+                  'years_till_retirement': [20, 40],
+                  'starting_contribution': [0, 50000],
+                  'yearly_contribution': [5000, 10000, 20000]}
+        output = io.BytesIO()
+        sweep.sweep(ranges, output, 'npy', chunk_cells=7)
+        data = output.getvalue()
+        header_length, = struct.unpack_from('<H', data, 8)
+        self.assertEqual((10 + header_length) % 64, 0)
+        self.assertIn(b"'shape': (2, 2, 2, 2, 2, 3)", data[:10 + header_length])
+        values = struct.unpack('<96d', data[10 + header_length:])
+
+        i, o, n, t, s, c = 1, 0, 0, 1, 1, 2
+        plan = types.SimpleNamespace(
+            starting_contribution=50000, net_compounding_rate=1.07 - 1.03 + 1,
+            yearly_contribution=20000, years_of_contribution=10,
+            years_till_retirement=40)
+        expected = retirement.CompoundingCalculator(plan).get_retirement_funds()
+        index = ((((i * 2 + o) * 2 + n) * 2 + t) * 2 + s) * 3 + c
+        self.assertAlmostEqual(values[index] / expected, 1.0, places=12)
+
+    def test_blocks_respect_chunk_cells(self):
+        ranges = {'inflation_rate': [1.02],
+                  'compounding_rate': [1.07, 1.08],
+                  'years_of_contribution': [30],
+                  'years_till_retirement': [40],
+                  'starting_contribution': [0, 10000, 50000],
+                  'yearly_contribution': [1000, 5000, 10000, 20000]}
+        whole = [list(funds) for _, _, funds in sweep.sweep_blocks(ranges)]
+        self.assertEqual([len(funds) for funds in whole], [12, 12])
+        for chunk_cells in (1, 3, 5, 12, 100):
+            blocks = list(sweep.sweep_blocks(ranges, chunk_cells))
+            self.assertTrue(all(len(funds) <= chunk_cells
+                                for _, _, funds in blocks))
+            joined = [[], []]
+            for parameters, offset, funds in blocks:
+                outer = ranges['compounding_rate'].index(parameters[1])
+                self.assertEqual(offset, len(joined[outer]))
+                joined[outer].extend(funds)
+            self.assertEqual(joined, whole)
+
+            output = io.StringIO()
+            sweep.sweep(ranges, output, 'csv', chunk_cells=chunk_cells)
+            rows = output.getvalue().splitlines()[1:]
+            self.assertEqual(len(rows), 24)
+            self.assertEqual(rows[7].split(',')[4:6], ['10000', '20000'])
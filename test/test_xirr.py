@@ -0,0 +1,73 @@
+'''
+tests for the irregular cash flow growth rate
+By: Michael Asnes
+'''
+import datetime
+import io
+import math
+import unittest
+import fincalc
+import inputstreamcagr
+import xirr
+
+class TestCases(unittest.TestCase):
+    def test_matches_input_stream_cagr(self):
+        # 365 day years, so whole years line up with inputstreamcagr periods
+        isc = inputstreamcagr.InputStreamCagr(5000, 0, 1000, 10)
+        ending_value = isc._calculate_return_at_rate(1.07)
+        # The starting value compounds one more period than the first
+        # contribution
+        flows = [(730000 - 365, -5000)]
+        flows.extend((730000 + 365 * year, -1000) for year in range(10))
+        flows.append((730000 + 365 * 9, ending_value))
+        self.assertAlmostEqual(xirr.xirr(flows), 1.07, places=10)
+
+    def test_dates_and_signs(self):
+        self.assertAlmostEqual(
+            xirr.xirr([(datetime.date(2021, 1, 1), -1000),
+                       ('2022-01-01', 1100)]), 1.10, places=10)
+        # Borrowing first and paying back later is the same rate
+        self.assertAlmostEqual(
+            xirr.xirr([('2021-01-01', 1000), ('2022-01-01', -1100)]), 1.10,
+            places=10)
+        # A loss
+        self.assertAlmostEqual(
+            xirr.xirr([('2021-01-01', -1000), ('2022-01-01', 500)]), 0.5,
+            places=10)
+        with self.assertRaises(ValueError):
+            xirr.xirr([('2021-01-01', -1000), ('2022-01-01', -500)])
+        with self.assertRaises(ValueError):
+            xirr.xirr([('2021-01-01', -1000), ('2021-01-01', 500)])
+
+    def test_batch(self):
+        accounts = [
+            [('2020-01-01', -1000), ('2020-06-15', -250), ('2020-09-01', 300),
+             ('2023-03-31', 1400)],
+            [],
+            [('2020-01-01', -1000), ('2021-01-01', -500)],
+            [('2019-05-05', -10), ('2049-05-05', 2000)],
+        ]
+        book = xirr.FlowBook()
+        for flows in accounts:
+            book.add_account(flows)
+        rates, statuses, iterations = xirr.xirr_batch(book)
+        self.assertEqual(list(statuses), [inputstreamcagr.STATUS_CONVERGED,
+                                          inputstreamcagr.STATUS_NO_SOLUTION,
+                                          inputstreamcagr.STATUS_NO_SOLUTION,
+                                          inputstreamcagr.STATUS_CONVERGED])
+        self.assertTrue(math.isnan(rates[1]) and math.isnan(rates[2]))
+        for account in (0, 3):
+            self.assertAlmostEqual(rates[account], xirr.xirr(accounts[account]),
+                                   places=10)
+            self.assertLess(iterations[account], 15)
+
+    def test_read_flow_book(self):
+        names, book = xirr.read_flow_book(io.StringIO(
+            'account,date,amount\n'
+            'a,2020-01-01,-100\na,2021-01-01,110\n'
+            'b,2020-01-01,-100\nb,2020-07-01,-100\nb,2021-01-01,250\n'))
+        self.assertEqual(names, ['a', 'b'])
+        self.assertEqual(list(book.offsets), [0, 2, 5])
+        self.assertEqual(fincalc.evaluate('xirr', {
+            'dates': ['2020-01-01', '2021-01-01'], 'amounts': [-100, 110]}),
+            {'rate': xirr.xirr_batch(book)[0][0]})
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+'''
+Growth rate of irregular, dated cash flows (like a spreadsheet's XIRR)
+By: Michael Asnes
+
+InputStreamCagr assumes the same contribution every period. Real accounts
+get deposits and withdrawals of any size on any date. Given each flow's date
+and amount, this finds the yearly growth rate r (ex: 1.07) at which the
+deposits, compounded to the last date, are worth exactly as much as the
+withdrawals (and the ending value) compounded to the same date.
+
+Deposits are negative and withdrawals positive, as in a spreadsheet. The
+account's ending value is a positive flow on the last date.
+
+Many accounts can be solved at once from a FlowBook, which packs every flow
+of every account into a few flat arrays.
+'''
+import csv
+import datetime
+import math
+import sys
+from array import array
+
+from inputstreamcagr import (DEFAULT_MAX_ITERATIONS, DEFAULT_RELATIVE_TOLERANCE,
+                             MAX_BRACKET_EXPANSIONS, STATUS_CONVERGED,
+                             STATUS_MAX_ITERATIONS, STATUS_NO_SOLUTION,
+                             _newton_bisect_step, double_rate, newton_bisect)
+
+DAYS_PER_YEAR = 365.0
+
+
+def usage():
+    print(
+        '''Usage:
+\t-h show this help
+\t<flows.csv>
+\t\tflows.csv has a header row and account, date (YYYY-MM-DD) and
+\t\tamount columns, with each account's flows on consecutive rows.
+\t\tDeposits are negative, withdrawals and ending values positive.
+\t\tPrints the yearly growth rate of each account.'''
+    )
+
+
+def process_opts():
+    for arg in sys.argv:
+        if arg == '-h' or arg == '--help':
+            sys.exit(usage())
+    try:
+        flows_path = sys.argv[1]
+    except IndexError:
+        sys.exit(usage())
+    return flows_path
+
+
+def to_day(date):
+    """ Day number of a date given as a datetime.date, a 'YYYY-MM-DD' string,
+    or already as a day number """
+    if isinstance(date, datetime.date):
+        return date.toordinal()
+    if isinstance(date, str):
+        return datetime.datetime.strptime(date.strip()[:10],
+                                          '%Y-%m-%d').toordinal()
+    return int(date)
+
+
+class FlowBook(object):
+    """ The cash flows of many accounts, packed into flat arrays.
+
+    Account k's flows are days[offsets[k]:offsets[k + 1]] and the matching
+    amounts. Days are day numbers (see to_day()). There are no per-account
+    objects, so a book can hold millions of flows.
+    """
+    def __init__(self):
+        self.offsets = array('q', [0])
+        self.days = array('l')
+        self.amounts = array('d')
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def add_account(self, flows):
+        """ Adds an account's (date, amount) flows. Returns its index. """
+        for date, amount in flows:
+            self.days.append(to_day(date))
+            self.amounts.append(float(amount))
+        self.offsets.append(len(self.days))
+        return len(self) - 1
+
+
+def read_flow_book(flows_file):
+    """ Returns (account names, FlowBook) from a csv file with account, date
+    and amount columns. Each account's rows must be together. """
+    book = FlowBook()
+    names = []
+    for row in csv.DictReader(flows_file):
+        if not names or row['account'] != names[-1]:
+            if names:
+                book.offsets.append(len(book.days))
+            names.append(row['account'])
+        book.days.append(to_day(row['date']))
+        book.amounts.append(float(row['amount']))
+    if names:
+        book.offsets.append(len(book.days))
+    return names, book
+
+
+class _FlowResiduals(object):
+    """ Residuals of every account in a book, from flat per-flow and
+    per-account arrays.
+
+    An account's residual at rate r is log(deposits compounded to its last
+    date) - log(withdrawals compounded to its last date), flipped in sign if
+    needed so it increases with r.
+    """
+    def __init__(self, offsets, days, amounts):
+        self.offsets = offsets
+        self.amounts = amounts
+        num_accounts = len(offsets) - 1
+        # Years from each flow to its account's last flow
+        self.spans = array('d', [0.0]) * len(amounts)
+        # Per account: the longest and shortest span of its deposits and
+        # withdrawals, and whether its residual is flipped
+        self.deposit_spans = array('d', [0.0]) * (2 * num_accounts)
+        self.withdrawal_spans = array('d', [0.0]) * (2 * num_accounts)
+        self.orientations = array('b', [0]) * num_accounts
+        for account in range(num_accounts):
+            start, stop = offsets[account], offsets[account + 1]
+            if stop <= start:
+                continue
+            last_day = max(days[start:stop])
+            self.spans[start:stop] = array('d', [(last_day - day) / DAYS_PER_YEAR
+                                                 for day in days[start:stop]])
+            deposit_spans = [span for span, amount in
+                             zip(self.spans[start:stop], amounts[start:stop])
+                             if amount < 0]
+            withdrawal_spans = [span for span, amount in
+                                zip(self.spans[start:stop], amounts[start:stop])
+                                if amount > 0]
+            if not deposit_spans or not withdrawal_spans:
+                continue
+            self.deposit_spans[2 * account] = max(deposit_spans)
+            self.deposit_spans[2 * account + 1] = min(deposit_spans)
+            self.withdrawal_spans[2 * account] = max(withdrawal_spans)
+            self.withdrawal_spans[2 * account + 1] = min(withdrawal_spans)
+            if max(deposit_spans) == 0 and max(withdrawal_spans) == 0:
+                continue   # everything on one date, so no rate matters
+            # At high rates the earliest flow dominates. The residual has to
+            # go up from there, so flip it if that flow is a withdrawal.
+            self.orientations[account] = (
+                1 if max(deposit_spans) >= max(withdrawal_spans) else -1)
+
+    def failure(self, account):
+        """ Why account can't have a growth rate, or None if it can """
+        if self.offsets[account + 1] <= self.offsets[account]:
+            return "The account has no cash flows"
+        if self.orientations[account] == 0:
+            start, stop = self.offsets[account], self.offsets[account + 1]
+            amounts = self.amounts[start:stop]
+            if not any(amount < 0 for amount in amounts) \
+                    or not any(amount > 0 for amount in amounts):
+                return ("Cash flows need at least one deposit (negative) and "
+                        "one withdrawal or ending value (positive)")
+            return ("All cash flows are on the same date, so there is no "
+                    "growth rate")
+        return None
+
+    def residual_and_derivative(self, account, rate):
+        """ Returns (residual, d residual / d rate) for account at rate """
+        if rate <= 0:
+            return -math.inf, math.inf
+        log_rate = math.log(rate)
+        # Scale each sum by its largest term so nothing overflows
+        high = 0 if log_rate >= 0 else 1
+        deposit_shift = self.deposit_spans[2 * account + high] * log_rate
+        withdrawal_shift = self.withdrawal_spans[2 * account + high] * log_rate
+        deposits = deposit_slope = withdrawals = withdrawal_slope = 0.0
+        exp = math.exp
+        start, stop = self.offsets[account], self.offsets[account + 1]
+        for amount, span in zip(self.amounts[start:stop],
+                                self.spans[start:stop]):
+            if amount < 0:
+                term = -amount * exp(span * log_rate - deposit_shift)
+                deposits += term
+                deposit_slope += term * span
+            elif amount > 0:
+                term = amount * exp(span * log_rate - withdrawal_shift)
+                withdrawals += term
+                withdrawal_slope += term * span
+        orientation = self.orientations[account]
+        residual = (deposit_shift + math.log(deposits)
+                    - withdrawal_shift - math.log(withdrawals))
+        derivative = (deposit_slope / deposits
+                      - withdrawal_slope / withdrawals) / rate
+        return orientation * residual, orientation * derivative
+
+    def bracket(self, account):
+        """ Returns (min_rate, max_rate) around account's growth rate,
+        widening out from 1. Raises ArithmeticError if it can't. """
+        def residual(rate):
+            return self.residual_and_derivative(account, rate)[0]
+
+        at_one = residual(1.0)
+        if at_one == 0:
+            return 1.0, 1.0
+        if at_one < 0:
+            min_rate, max_rate = 1.0, 1.05
+            expansions = 0
+            while residual(max_rate) < 0:
+                expansions += 1
+                if expansions > MAX_BRACKET_EXPANSIONS:
+                    raise ArithmeticError(
+                        "Couldn't find a growth rate high enough to balance "
+                        "the cash flows")
+                min_rate, max_rate = max_rate, double_rate(max_rate)
+        else:
+            min_rate, max_rate = 0.5, 1.0
+            expansions = 0
+            while residual(min_rate) > 0:
+                expansions += 1
+                if expansions > MAX_BRACKET_EXPANSIONS:
+                    raise ArithmeticError(
+                        "Couldn't find a growth rate low enough to balance "
+                        "the cash flows")
+                min_rate, max_rate = min_rate / 2, min_rate
+        return min_rate, max_rate
+
+
+def xirr(flows, relative_tolerance=DEFAULT_RELATIVE_TOLERANCE,
+         max_iterations=DEFAULT_MAX_ITERATIONS):
+    """ Returns the yearly growth rate (ex: 1.07) of an account's (date,
+    amount) cash flows.
+
+    Raises ValueError if the flows can't have a growth rate, and
+    ArithmeticError if it can't be found.
+    """
+    book = FlowBook()
+    book.add_account(flows)
+    residuals = _FlowResiduals(book.offsets, book.days, book.amounts)
+    failure = residuals.failure(0)
+    if failure is not None:
+        raise ValueError(failure)
+    min_rate, max_rate = residuals.bracket(0)
+    if min_rate == max_rate:
+        return min_rate
+    return newton_bisect(lambda rate: residuals.residual_and_derivative(0, rate),
+                         min_rate, max_rate, relative_tolerance,
+                         relative_tolerance, max_iterations)
+
+
+def xirr_batch(book, relative_tolerance=DEFAULT_RELATIVE_TOLERANCE,
+               max_iterations=DEFAULT_MAX_ITERATIONS):
+    """ Solves every account in a FlowBook.
+
+    Takes one step for every unsolved account per pass, like
+    inputstreamcagr.approximate_growth_rates(), keeping the solver state in
+    flat arrays. Returns (rates, statuses, iterations):
+        rates: array('d') of yearly growth rates, nan where there is none
+        statuses: array('b') of inputstreamcagr STATUS_* codes
+        iterations: array('l') of solver steps taken per account
+    """
+    residuals = _FlowResiduals(book.offsets, book.days, book.amounts)
+    num_accounts = len(book)
+    nan = float('nan')
+    rates = array('d', [nan]) * num_accounts
+    statuses = array('b', [STATUS_CONVERGED]) * num_accounts
+    iterations = array('l', [0]) * num_accounts
+    min_rates = array('d', [nan]) * num_accounts
+    max_rates = array('d', [nan]) * num_accounts
+    previous_residuals = array('d', [math.inf]) * num_accounts
+    active = []
+    for account in range(num_accounts):
+        if residuals.failure(account) is not None:
+            statuses[account] = STATUS_NO_SOLUTION
+            continue
+        try:
+            min_rate, max_rate = residuals.bracket(account)
+        except ArithmeticError:
+            statuses[account] = STATUS_MAX_ITERATIONS
+            continue
+        rates[account] = (min_rate + max_rate) / 2
+        if min_rate != max_rate:
+            min_rates[account] = min_rate
+            max_rates[account] = max_rate
+            active.append(account)
+
+    for _ in range(max_iterations):
+        if not active:
+            break
+        still_active = []
+        for account in active:
+            rate = rates[account]
+            residual, derivative = residuals.residual_and_derivative(account,
+                                                                     rate)
+            iterations[account] += 1
+            next_rate, min_rates[account], max_rates[account] = \
+                _newton_bisect_step(rate, residual, derivative,
+                                    previous_residuals[account],
+                                    min_rates[account], max_rates[account],
+                                    relative_tolerance, relative_tolerance)
+            if next_rate is None:
+                continue
+            previous_residuals[account] = residual
+            rates[account] = next_rate
+            still_active.append(account)
+        active = still_active
+
+    for account in active:
+        statuses[account] = STATUS_MAX_ITERATIONS
+    return rates, statuses, iterations
+
+
+def main():
+    flows_path = process_opts()
+    try:
+        with open(flows_path, newline='') as flows_file:
+            names, book = read_flow_book(flows_file)
+    except (OSError, KeyError, ValueError) as err:
+        sys.exit("Couldn't read {}: {}".format(flows_path, err))
+    rates, statuses, _ = xirr_batch(book)
+    for name, rate, status in zip(names, rates, statuses):
+        if status == STATUS_CONVERGED:
+            print("{}: {:.2f}% per year".format(name, (rate - 1) * 100))
+        elif status == STATUS_NO_SOLUTION:
+            print("{}: no growth rate explains these cash flows".format(name))
+        else:
+            print("{}: the growth rate did not converge".format(name))
+
+if __name__ == "__main__":
+    main()